@@ -3,12 +3,13 @@ import logging
 import os
 import sys
 from . import constants
+from .compression import compress, negotiate, should_compress
+from .serialization import FastJSONProvider
 from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, current_app
 from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 from flask_htmx import HTMX
 from datetime import datetime
-from distutils.version import LooseVersion
 
 from sqlalchemy import MetaData
 from config import settings
@@ -43,7 +44,7 @@ migrate = Migrate()
 
 
 def sort_versions(versions):
-    return sorted(versions, key=lambda x: LooseVersion(x.version_code), reverse=True)
+    return sorted(versions, key=lambda x: (x.version_sort_key, x.id), reverse=True)
 
 def page_not_found(e):
   return render_template('error/404.j2',error=True), 404
@@ -65,6 +66,21 @@ def remove_none_values(value):
     else:
         return value
 
+def compress_response(response):
+    """Compress JSON responses of the API and WinGet endpoints if the client accepts it."""
+    if request.blueprint not in ('api', 'winget') or response.direct_passthrough:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(request.headers.get('Accept-Encoding'))
+    if encoding is None or not should_compress(response.mimetype, response.content_encoding, response.content_length or 0):
+        return response
+    from app.http_cache import variant_etag
+    response.set_data(compress(response.get_data(), encoding))
+    response.content_encoding = encoding
+    if 'ETag' in response.headers:
+        response.headers['ETag'] = variant_etag(response.headers['ETag'], encoding)
+    return response
+
 
 class PrefixLoggerAdapter(logging.LoggerAdapter):
     """ A logger adapter that adds a prefix to every message """
@@ -73,13 +89,22 @@ class PrefixLoggerAdapter(logging.LoggerAdapter):
 
 def create_app():
     app = Flask(__name__)
+    app.json = FastJSONProvider(app)
     
     app.config.from_object(settings)
     app.register_error_handler(404, page_not_found)
     app.register_error_handler(500, internal_server_error)
+    app.after_request(compress_response)
 
     db.init_app(app)
     from app.models import User, Package, PackageVersion, Installer, InstallerSwitch, Permission, Role, Setting
+    from app import manifests
+    from app.counters import init_download_counter
+    from app.downloads import init_download_offload
+    from app.urls import init_trusted_hosts
+    init_download_offload(app)
+    init_download_counter(app)
+    init_trusted_hosts(app)
     migrate.init_app(app, db)
     htmx.init_app(app)
     dynaconf.init_app(app)
@@ -89,9 +114,8 @@ def create_app():
     login_manager.login_message = ''
     login_manager.init_app(app)
 
-    @login_manager.user_loader
-    def load_user(user_id):
-        return User.query.get(int(user_id))
+    from app.permissions import load_user
+    login_manager.user_loader(load_user)
 
     from app.ui_routes import ui
     from app.api_routes import api
@@ -130,12 +154,11 @@ def create_app():
     app.add_template_global(constants.installer_scopes, name='installer_scopes')
     app.add_template_global(constants.simplified_nested_installer_types, name='nested_installer_types')
 
-    def get_settings():
-        return {setting.key.upper(): setting.get_value() for setting in Setting.query.all()}
-    
+    from app.settings_cache import all_settings
+
     @app.context_processor
     def inject_settings():
-        return dict(global_settings=get_settings())
+        return dict(global_settings=all_settings())
 
     @app.context_processor
     def inject_now():
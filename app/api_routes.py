@@ -1,4 +1,5 @@
 import os
+from datetime import date, datetime, timedelta, timezone
 import boto3
 from flask import (
     Blueprint,
@@ -14,15 +15,44 @@ from flask import (
     flash,
 )
 from flask_login import current_user, login_required
+from sqlalchemy.orm import aliased, selectinload
 from werkzeug.http import parse_range_header
 from werkzeug.utils import secure_filename
 import requests
 from app import db
+from app.counters import count_download
+from app.continuation import (
+    InvalidContinuationToken,
+    after_position,
+    fetch_page,
+    keyset_position,
+    keyset_token,
+)
 from app.decorators import permission_required
+from app.downloads import (
+    LATEST,
+    DownloadNotFound,
+    counts_as_download,
+    installer_key,
+    offload_mode,
+    offload_response,
+    resolve_download,
+)
+from app.fieldsets import (
+    InvalidFieldset,
+    load_options,
+    parse_selection,
+    serialize as serialize_fields,
+)
 from app.forms import AddInstallerForm, AddPackageForm, AddVersionForm
+from app.fulltext import substring_match
+from app.hll import HyperLogLog
 from app.models import (
+    DownloadStat,
     InstallerSwitch,
     Package,
+    PackageCommand,
+    PackageTag,
     PackageVersion,
     Installer,
     Permission,
@@ -30,7 +60,8 @@ from app.models import (
     Setting,
     User,
 )
-from app.utils import create_installer, save_file, basedir, delete_installer_util
+from app.settings_cache import get_setting
+from app.utils import create_installer, save_file, basedir, delete_installer_util, split_list
 from app.constants import installer_switches
 
 api = Blueprint("api", __name__)
@@ -55,37 +86,138 @@ def packages():
     query = Package.query
 
     if search_query:
-        search = "%{}%".format(search_query)
         query = query.filter(
-            db.or_(
-                Package.name.ilike(search),
-                Package.identifier.ilike(search),
-                Package.publisher.ilike(search)
+            substring_match(
+                [Package.name, Package.identifier, Package.publisher], search_query
             )
         )
 
+    if request.args.get('view') == 'summary':
+        query = summarize_packages(query)
+        serialize = summary_to_dict
+    else:
+        serialize = Package.to_dict
+
+    if 'cursor' in request.args:
+        return keyset_page(
+            query,
+            [Package.id],
+            lambda item: [getattr(item, 'Package', item).id],
+            serialize,
+            'packages',
+        )
+
     paginated_packages = query.paginate(page=page,per_page=per_page,error_out=False)
     packages = paginated_packages.items
 
     return jsonify({
-        'packages': [package.to_dict() for package in packages],
+        'packages': [serialize(package) for package in packages],
         'total': paginated_packages.total,
         'pages': paginated_packages.pages,
         'current_page': paginated_packages.page
     })
 
+def summarize_packages(query):
+    """Turn a package query into one GROUP BY row per package with its counts.
+
+    Nothing is loaded lazily: the latest version comes from
+    ``Package.latest_version_id`` and the counts from the joined tables.
+    """
+    latest = aliased(PackageVersion)
+    return (
+        query.with_entities(
+            Package,
+            db.func.count(db.distinct(PackageVersion.id)).label("version_count"),
+            db.func.count(Installer.id).label("installer_count"),
+            latest.version_code.label("latest_version"),
+        )
+        .outerjoin(PackageVersion, PackageVersion.identifier == Package.identifier)
+        .outerjoin(Installer, Installer.version_id == PackageVersion.id)
+        .outerjoin(latest, latest.id == Package.latest_version_id)
+        .group_by(Package.id, latest.version_code)
+        .order_by(Package.id)
+    )
+
+
+def summary_to_dict(row):
+    package = row.Package
+    return {
+        "id": package.id,
+        "identifier": package.identifier,
+        "name": package.name,
+        "publisher": package.publisher,
+        "moniker": package.moniker,
+        "download_count": package.download_count,
+        "version_count": row.version_count,
+        "installer_count": row.installer_count,
+        "latest_version": row.latest_version,
+    }
+
+
+def keyset_page(query, columns, position, serialize, name):
+    """Answer with the page of ``query`` that follows the ``cursor`` argument.
+
+    Rows are ordered by ``columns``, ``position`` returns their values for an
+    item. Unlike ``paginate()`` this seeks through the index instead of
+    skipping rows and only counts all rows when asked to with ``count=1``.
+    """
+    per_page = max(request.args.get('limit', 10, type=int), 1)
+    cursor = request.args.get('cursor', '', type=str)
+
+    output = {}
+    if request.args.get('count', 0, type=int):
+        output['total'] = query.order_by(None).count()
+    query = query.order_by(None).order_by(*columns)
+    if cursor:
+        try:
+            after = keyset_position(
+                cursor, *[column.type.python_type for column in columns]
+            )
+        except InvalidContinuationToken:
+            return "Invalid cursor", 400
+        query = query.filter(after_position(columns, after))
+
+    items, has_more = fetch_page(lambda count: query.limit(count).all(), per_page)
+    output[name] = [serialize(item) for item in items]
+    output['next_cursor'] = keyset_token(*position(items[-1])) if has_more else None
+    return jsonify(output)
+
+
+def sparse_query(model):
+    """Query ``model`` for the ``fields`` and ``expand`` arguments.
+
+    Returns the query and the function serializing its results, see
+    app.fieldsets.
+    """
+    selection = parse_selection(
+        model, request.args.get('fields'), request.args.get('expand')
+    )
+    if selection is None:
+        return model.query, model.to_dict
+    return (
+        model.query.options(*load_options(model, selection)),
+        lambda obj: serialize_fields(obj, selection),
+    )
+
+
+@api.errorhandler(InvalidFieldset)
+def invalid_fieldset(error):
+    return f"Unknown field: {error}", 400
+
+
 @api.get("/package/<identifier>")
 @login_required
 @permission_required("view:package")
 def package(identifier):
+    query, serialize = sparse_query(Package)
     # Use identifier and check if its the id or the package identifier
     if identifier.isdigit():
-        package = Package.query.get(identifier)
+        package = query.get(identifier)
     else:
-        package = Package.query.filter_by(identifier=identifier).first()
+        package = query.filter_by(identifier=identifier).first()
     if package is None:
         return "Package not found", 404
-    return jsonify(package.to_dict())
+    return jsonify(serialize(package))
     
 
 @api.get("/package/<identifier>/versions")
@@ -95,6 +227,16 @@ def package_versions(identifier):
     package = Package.query.filter_by(identifier=identifier).first()
     if package is None:
         return "Package not found", 404
+    if 'cursor' in request.args:
+        return keyset_page(
+            PackageVersion.query.filter_by(identifier=identifier).options(
+                selectinload(PackageVersion.installers)
+            ),
+            [PackageVersion.version_sort_key, PackageVersion.id],
+            lambda version: [version.version_sort_key, version.id],
+            PackageVersion.to_dict,
+            'versions',
+        )
     return jsonify([version.to_dict() for version in package.versions])
 
 @api.get("/package/<identifier>/version/<version>")
@@ -132,19 +274,21 @@ def package_installer(identifier, version, installer):
 @login_required
 @permission_required("view:installer")
 def get_installer_by_id(installer_id):
-    installer = Installer.query.get(installer_id)
+    query, serialize = sparse_query(Installer)
+    installer = query.get(installer_id)
     if installer is None:
         return "Installer not found", 404
-    return jsonify(installer.to_dict())
+    return jsonify(serialize(installer))
 
 @api.get("/version/<version_id>")
 @login_required
 @permission_required("view:version")
 def get_version_by_id(version_id):
-    version = PackageVersion.query.get(version_id)
+    query, serialize = sparse_query(PackageVersion)
+    version = query.get(version_id)
     if version is None:
         return "Version not found", 404
-    return jsonify(version.to_dict())
+    return jsonify(serialize(version))
 
 
 @api.route("/generate_presigned_url", methods=["POST"])
@@ -174,7 +318,7 @@ def generate_presigned_url():
         presigned_url = s3_client.generate_presigned_url(
             "put_object",
             Params={
-                "Bucket": Setting.get("bucket_name").get_value(),
+                "Bucket": get_setting("bucket_name"),
                 "Key": s3_object_key,
                 "ContentType": content_type,
             },
@@ -259,6 +403,14 @@ def update_package(identifier):
     publisher = request.form["publisher"]
     package.name = name
     package.publisher = publisher
+    package.moniker = request.form.get("moniker") or None
+    package.tags = [
+        PackageTag(tag=tag) for tag in split_list(request.form.get("tags", ""))
+    ]
+    package.commands = [
+        PackageCommand(command=command)
+        for command in split_list(request.form.get("commands", ""))
+    ]
     db.session.commit()
     return redirect(request.referrer)
 
@@ -377,6 +529,8 @@ def edit_installer(identifier):
         return "Installer not found", 404
 
     current_app.logger.info(f"Installer found: {installer}")
+    installer.product_code = request.form.get("product_code") or None
+    installer.package_family_name = request.form.get("package_family_name") or None
 
     current_app.logger.info("Going through installer switches to update them")
     for field_name in installer_switches:
@@ -679,46 +833,87 @@ def delete_user(id):
     return "", 200
 
 
+STATS_DAYS = 30
+
+
+@api.get("/stats")
+@login_required
+@permission_required("view:package")
+def stats():
+    """Downloads per installer and UTC day, ``since`` and ``until`` default to the last 30 days."""
+    try:
+        today = datetime.now(timezone.utc).date()
+        until = date.fromisoformat(request.args.get('until') or today.isoformat())
+        since = date.fromisoformat(
+            request.args.get('since')
+            or (until - timedelta(days=STATS_DAYS - 1)).isoformat()
+        )
+    except ValueError:
+        return "Invalid date", 400
+
+    query = DownloadStat.query.filter(DownloadStat.day.between(since, until))
+    for argument, column in [
+        ('identifier', DownloadStat.identifier),
+        ('version', DownloadStat.version_code),
+        ('architecture', DownloadStat.architecture),
+        ('scope', DownloadStat.scope),
+    ]:
+        if request.args.get(argument):
+            query = query.filter(column == request.args[argument])
+    rows = query.order_by(
+        DownloadStat.day,
+        DownloadStat.identifier,
+        DownloadStat.version_code,
+        DownloadStat.architecture,
+        DownloadStat.scope,
+    ).all()
+
+    # Sketches of different days and installers merge into the unique clients of all of them
+    clients = HyperLogLog()
+    for row in rows:
+        clients.merge(HyperLogLog.from_bytes(row.clients))
+    return jsonify({
+        'since': since.isoformat(),
+        'until': until.isoformat(),
+        'downloads': sum(row.downloads for row in rows),
+        'unique_clients': clients.count(),
+        'stats': [row.to_dict() for row in rows],
+    })
+
+
 @api.route("/download/<identifier>/<version>/<architecture>/<scope>")
 def download(identifier, version, architecture, scope):
-    # TODO: Improve this function to be more efficient, also when a package's publisher is renamed the file won't be found anymore
-    package = Package.query.filter_by(identifier=identifier).first()
-    if package is None:
-        current_app.logger.warning("Package not found")
-        return "Package not found", 404
+    # TODO: when a package's publisher is renamed the file won't be found anymore
+    try:
+        installer = resolve_download(identifier, version, architecture, scope)
+    except DownloadNotFound as error:
+        current_app.logger.warning(str(error))
+        return str(error), 404
 
-    # Get version of package and also match package
-    version_code = PackageVersion.query.filter_by(
-        version_code=version, identifier=identifier
-    ).first()
-    if version_code is None:
-        current_app.logger.warning("Version not found")
-        return "Package version not found", 404
-    # Get installer of package version and also match architecture and identifier
-    installer = Installer.query.filter_by(
-        version_id=version_code.id, architecture=architecture, scope=scope
-    ).first()
-    if installer is None:
-        current_app.logger.warning("Installer not found")
-        return "Installer not found", 404
+    return send_installer(installer)
+
+
+@api.route("/download/<identifier>/latest/<architecture>/<scope>")
+def download_latest(identifier, architecture, scope):
+    try:
+        installer = resolve_download(identifier, LATEST, architecture, scope)
+    except DownloadNotFound as error:
+        current_app.logger.warning(str(error))
+        return str(error), 404
+
+    return send_installer(installer)
 
-    if Setting.get("USE_S3").get_value() and installer.external_url is None:
+
+def send_installer(installer):
+    """Redirect to or stream a ``ResolvedInstaller``."""
+    if get_setting("use_s3") and installer.external_url is None:
         current_app.logger.info("Downloading from S3")
         # Generate a pre-signed URL for the S3 object
         presigned_url = s3_client.generate_presigned_url(
             "get_object",
             Params={
-                "Bucket": Setting.get("BUCKET_NAME").get_value(),
-                "Key": "packages/"
-                + package.publisher
-                + "/"
-                + package.identifier
-                + "/"
-                + version_code.version_code
-                + "/"
-                + installer.architecture
-                + "/"
-                + installer.file_name,
+                "Bucket": get_setting("bucket_name"),
+                "Key": installer_key(installer),
                 "ResponseContentDisposition": "attachment; filename="
                 + installer.file_name,
                 "ResponseContentType": "application/octet-stream",
@@ -726,9 +921,8 @@ def download(identifier, version, architecture, scope):
             ExpiresIn=URL_EXPIRATION_SECONDS,
         )
 
-        # Increment the download count and commit to the database
-        package.download_count += 1
-        db.session.commit()
+        # Count the download, written in the background by app.counters
+        count_download(installer)
 
         # Redirect the client to the pre-signed URL
         return redirect(presigned_url)
@@ -736,9 +930,8 @@ def download(identifier, version, architecture, scope):
     # If the installer has an external URL, redirect the client to it
     if installer.external_url:
         current_app.logger.info("Downloading from external URL")
-        # Increment the download count and commit to the database
-        package.download_count += 1
-        db.session.commit()
+        # Count the download, written in the background by app.counters
+        count_download(installer)
 
         # Redirect the client to the pre-signed URL
         return redirect(installer.external_url)
@@ -746,16 +939,16 @@ def download(identifier, version, architecture, scope):
     installer_path = os.path.join(
         basedir,
         "packages",
-        package.publisher,
-        package.identifier,
-        version_code.version_code,
+        installer.publisher,
+        installer.identifier,
+        installer.version_code,
         installer.architecture,
     )
 
     current_app.logger.info("Starting download for package:")
-    current_app.logger.info(f"Package name: {package.name}")
-    current_app.logger.info(f"Package identifier: {package.identifier}")
-    current_app.logger.info(f"Package version: {version_code.version_code}")
+    current_app.logger.info(f"Package name: {installer.name}")
+    current_app.logger.info(f"Package identifier: {installer.identifier}")
+    current_app.logger.info(f"Package version: {installer.version_code}")
     current_app.logger.info(f"Architecture: {installer.architecture}")
     current_app.logger.info(f"Installer file name: {installer.file_name}")
     current_app.logger.info(f"Installer SHA256: {installer.installer_sha256}")
@@ -776,8 +969,15 @@ def download(identifier, version, architecture, scope):
             return "Invalid range header", 400
 
     # Only add to download_count for a whole file download not part of it (winget uses range)
-    if (is_partial and range_header and range_header == "bytes=0-1") or not is_partial:
-        package.download_count += 1
-        db.session.commit()
-
+    if counts_as_download(range_header):
+        count_download(installer)
+
+    offload = offload_mode()
+    if offload:
+        return offload_response(
+            offload,
+            os.path.join(basedir, "packages"),
+            installer_path,
+            installer.file_name,
+        )
     return send_from_directory(installer_path, installer.file_name, as_attachment=True)
@@ -0,0 +1,89 @@
+"""Native asyncio database access for the FastAPI WinGet router.
+
+The router gets its own ``AsyncEngine`` (aiosqlite for SQLite, asyncpg for
+PostgreSQL) pointed at the same database as Flask-SQLAlchemy, with its own
+pool sized by ``ASYNC_DB_POOL_SIZE`` and ``ASYNC_DB_MAX_OVERFLOW``. Set
+``ASYNC_SQLALCHEMY_DATABASE_URI`` to use another driver or database.
+
+Queries reuse the statement builders of the sync code, ORM work that has to
+load lazily (building manifests, searches) goes through ``run_sync`` so it
+never blocks the event loop on I/O.
+"""
+
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import db
+from app.models import RevisionCounter
+from app.settings_cache import fetch_setting
+
+# Dialect -> asyncio driver of the same database
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+engine = None
+flask_app = None
+async_session = async_sessionmaker(expire_on_commit=False)
+
+
+def async_database_url(url):
+    """Return ``url`` with its driver swapped for the asyncio one."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(
+            f"No asyncio driver for {backend}, set ASYNC_SQLALCHEMY_DATABASE_URI"
+        )
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def init_async_db(app):
+    """Create the async engine for the database ``app`` is configured with."""
+    global engine, flask_app
+    flask_app = app
+    with app.app_context():
+        # Flask-SQLAlchemy already resolved relative SQLite paths against the instance folder
+        url = app.config.get("ASYNC_SQLALCHEMY_DATABASE_URI") or async_database_url(
+            db.engine.url
+        )
+
+    options = {"pool_pre_ping": True}
+    if make_url(url).get_backend_name() != "sqlite":
+        options["pool_size"] = int(app.config.get("ASYNC_DB_POOL_SIZE", 10))
+        options["max_overflow"] = int(app.config.get("ASYNC_DB_MAX_OVERFLOW", 20))
+    engine = create_async_engine(url, **options)
+    async_session.configure(bind=engine)
+    return engine
+
+
+async def dispose_async_db():
+    """Close all pooled connections of the async engine."""
+    if engine is not None:
+        await engine.dispose()
+
+
+async def get_session():
+    """FastAPI dependency handing out an ``AsyncSession`` per request.
+
+    The request runs inside an application context, settings read their
+    overrides from the Flask config.
+    """
+    with flask_app.app_context():
+        async with async_session() as session:
+            yield session
+
+
+async def get_setting_value(session, key):
+    """Return the value of setting ``key`` or None if it doesn't exist."""
+    return await fetch_setting(session, key)
+
+
+async def get_revision(session, name):
+    """Return the current value of the ``RevisionCounter`` called ``name``."""
+    value = await session.scalar(
+        select(RevisionCounter.value).where(RevisionCounter.name == name)
+    )
+    return value or 0
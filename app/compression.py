@@ -0,0 +1,87 @@
+"""Content-Encoding negotiation for the JSON endpoints.
+
+gzip is always available, ``br`` and ``zstd`` only with the optional
+``brotli`` and ``zstandard`` packages installed (``compression`` extra).
+Bodies we store, like manifests, are compressed once when they are built,
+everything else is compressed per response by the Flask ``after_request``
+hook and the FastAPI middleware.
+"""
+
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Smaller bodies don't get noticeably smaller
+MIN_SIZE = 512
+
+COMPRESSIBLE_TYPES = ("application/json",)
+
+COMPRESSORS = {"gzip": lambda data: gzip.compress(data, compresslevel=6, mtime=0)}
+if brotli is not None:
+    COMPRESSORS["br"] = lambda data: brotli.compress(data, quality=5)
+if zstandard is not None:
+    # Compressor objects aren't thread-safe, so one per call
+    COMPRESSORS["zstd"] = lambda data: zstandard.ZstdCompressor(level=10).compress(data)
+
+# Best first, used to break ties between equally weighted encodings
+PREFERENCE = [encoding for encoding in ("zstd", "br", "gzip") if encoding in COMPRESSORS]
+
+
+def _weights(accept_encoding):
+    weights = {}
+    for entry in accept_encoding.split(","):
+        coding, _, params = entry.strip().partition(";")
+        weight = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        if coding:
+            weights[coding.lower()] = weight
+    return weights
+
+
+def negotiate(accept_encoding):
+    """Return the encoding to answer an ``Accept-Encoding`` header with, None for identity."""
+    if not accept_encoding:
+        return None
+    weights = _weights(accept_encoding)
+    wildcard = weights.get("*", 0.0)
+    candidates = [
+        (weights.get(encoding, wildcard), -rank, encoding)
+        for rank, encoding in enumerate(PREFERENCE)
+    ]
+    weight, _, encoding = max(candidates)
+    return encoding if weight > 0 else None
+
+
+def compress(data, encoding):
+    """Compress ``data`` with ``encoding``."""
+    return COMPRESSORS[encoding](data)
+
+
+def compress_all(data):
+    """Return ``data`` compressed with every available encoding, {} if it is too small."""
+    if len(data) < MIN_SIZE:
+        return {}
+    return {encoding: compress(data, encoding) for encoding in COMPRESSORS}
+
+
+def should_compress(mimetype, content_encoding, size):
+    """Tell whether a response body is worth compressing on the fly."""
+    return (
+        mimetype in COMPRESSIBLE_TYPES
+        and not content_encoding
+        and size >= MIN_SIZE
+    )
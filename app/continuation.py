@@ -0,0 +1,69 @@
+"""Opaque ``ContinuationToken`` values of the WinGet REST API.
+
+A token is the keyset position the next page starts after, encoded as
+URL-safe base64 of a small JSON object. Clients treat it as opaque and hand
+it back verbatim, so pages never need an ``OFFSET``. The admin API hands out
+the same tokens as its ``cursor``.
+"""
+
+import base64
+import binascii
+import json
+
+from sqlalchemy import and_, or_
+
+
+class InvalidContinuationToken(ValueError):
+    """Raised for a token we didn't hand out."""
+
+
+def encode_token(position):
+    """Encode a keyset ``position`` dict as a continuation token."""
+    payload = json.dumps(position, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def decode_token(token, *keys):
+    """Decode a continuation token, which has to carry all of ``keys``."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (UnicodeError, binascii.Error, ValueError) as e:
+        raise InvalidContinuationToken(token) from e
+    if not isinstance(position, dict) or any(key not in position for key in keys):
+        raise InvalidContinuationToken(token)
+    return position
+
+
+def keyset_token(*values):
+    """Encode the sort key of the last row of a page as a continuation token."""
+    return encode_token({"after": list(values)})
+
+
+def keyset_position(token, *types):
+    """Decode the sort key of a ``keyset_token``, one value of each of ``types``."""
+    after = decode_token(token, "after")["after"]
+    if not (
+        isinstance(after, list)
+        and len(after) == len(types)
+        and all(isinstance(value, kind) for value, kind in zip(after, types))
+    ):
+        raise InvalidContinuationToken(token)
+    return after
+
+
+def fetch_page(fetch, limit):
+    """Return the first ``limit`` rows of ``fetch(limit + 1)`` and whether there are more.
+
+    The one extra row tells whether there is a next page without counting.
+    """
+    rows = fetch(limit + 1)
+    return rows[:limit], len(rows) > limit
+
+
+def after_position(columns, position):
+    """Condition selecting the rows ordered by ``columns`` that come after ``position``."""
+    condition = columns[-1] > position[-1]
+    for column, value in zip(reversed(columns[:-1]), reversed(position[:-1])):
+        condition = or_(column > value, and_(column == value, condition))
+    return condition
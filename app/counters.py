@@ -0,0 +1,195 @@
+"""Write-behind download counter.
+
+Counting a download used to be a read-modify-write of
+``Package.download_count`` and a commit per installer fetch, which on SQLite
+takes the database write lock for every download. Each worker now adds up
+downloads in memory and a background thread writes them every
+``DOWNLOAD_COUNT_FLUSH_INTERVAL`` seconds, as one transaction of atomic
+``download_count = download_count + n`` updates. Pending counts are flushed
+on shutdown too, counts of a worker that gets killed are lost. A batch that
+fails to be written is retried with the next flushes, after
+``DOWNLOAD_COUNT_FLUSH_ATTEMPTS`` failures in a row it is dropped and logged
+so a row that can't be written doesn't grow the buffer for good.
+
+The same flush adds the downloads of each installer per day to
+``DownloadStat``, along with a ``HyperLogLog`` of the client addresses, so
+unique clients are counted in fixed memory however big the fleet is.
+"""
+
+import atexit
+import threading
+from collections import Counter, namedtuple
+from datetime import datetime, timezone
+
+from flask import current_app, has_request_context, request
+from sqlalchemy import bindparam, func, select, update
+
+from app import db
+from app.hll import HyperLogLog
+from app.models import DownloadStat, Package
+from app.upsert import insert_missing
+
+DEFAULT_FLUSH_INTERVAL = 5.0
+DEFAULT_FLUSH_ATTEMPTS = 3
+
+# The key columns of a DownloadStat row
+StatKey = namedtuple(
+    "StatKey", ["identifier", "version_code", "architecture", "scope", "day"]
+)
+
+
+class PendingStat:
+    def __init__(self):
+        self.downloads = 0
+        self.clients = HyperLogLog()
+
+    def merge(self, other):
+        self.downloads += other.downloads
+        self.clients.merge(other.clients)
+
+
+class DownloadCounter:
+    def __init__(self, app, interval=DEFAULT_FLUSH_INTERVAL, attempts=DEFAULT_FLUSH_ATTEMPTS):
+        self.app = app
+        self.interval = interval
+        self.attempts = attempts
+        self._failures = 0
+        self._pending = Counter()
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def increment(self, package_id, stat=None, client=None):
+        """Count a download of ``package_id``, and of the ``StatKey`` ``stat`` if given."""
+        with self._lock:
+            self._pending[package_id] += 1
+            if stat is not None:
+                pending = self._stats.get(stat)
+                if pending is None:
+                    pending = self._stats[stat] = PendingStat()
+                pending.downloads += 1
+                if client:
+                    pending.clients.add(client)
+            # Started by the first download, so every forked worker gets its own thread
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="download-counter", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        """Write the pending counts, they are kept for the next flush if that fails.
+
+        After ``attempts`` failed flushes in a row the counts that failed are dropped.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            stats, self._stats = self._stats, {}
+        if not pending and not stats:
+            return
+        try:
+            with self.app.app_context(), db.engine.begin() as connection:
+                if pending:
+                    _write_download_counts(connection, pending)
+                if stats:
+                    _write_stats(connection, stats)
+        except Exception as error:
+            self._failures += 1
+            self.app.logger.error(f"Failed to write download counts: {error}")
+            if self._failures >= self.attempts:
+                self._failures = 0
+                self.app.logger.error(
+                    f"Dropped {sum(pending.values())} downloads of {len(pending)} packages "
+                    f"and {sum(stat.downloads for stat in stats.values())} downloads of "
+                    f"{len(stats)} installer statistics after {self.attempts} failed writes"
+                )
+                return
+            with self._lock:
+                self._pending.update(pending)
+                for key, stat in stats.items():
+                    if key in self._stats:
+                        stat.merge(self._stats[key])
+                    self._stats[key] = stat
+        else:
+            self._failures = 0
+
+    def stop(self):
+        """Stop the background thread and write what is pending."""
+        self._stopped.set()
+        self.flush()
+
+
+def _write_download_counts(connection, pending):
+    package = Package.__table__
+    statement = (
+        update(package)
+        .where(package.c.id == bindparam("package_id"))
+        .values(
+            download_count=func.coalesce(package.c.download_count, 0)
+            + bindparam("increment")
+        )
+    )
+    # In id order, so concurrent flushes of two workers can't deadlock
+    connection.execute(
+        statement,
+        [
+            {"package_id": package_id, "increment": increment}
+            for package_id, increment in sorted(pending.items())
+        ],
+    )
+
+
+def _write_stats(connection, stats):
+    table = DownloadStat.__table__
+    empty = HyperLogLog().to_bytes()
+    for key, stat in sorted(stats.items()):
+        # Two workers may write the first downloads of a key at once, the
+        # loser's insert does nothing and both merge into the same row
+        insert_missing(connection, table, {**key._asdict(), "downloads": 0, "clients": empty})
+        match = [getattr(table.c, column) == value for column, value in key._asdict().items()]
+        # Sketches merge by reading them, the row stays locked until we wrote it back
+        row = connection.execute(
+            select(table.c.id, table.c.clients).where(*match).with_for_update()
+        ).one()
+        clients = HyperLogLog.from_bytes(row.clients).merge(stat.clients)
+        connection.execute(
+            update(table)
+            .where(table.c.id == row.id)
+            .values(
+                downloads=table.c.downloads + stat.downloads,
+                clients=clients.to_bytes(),
+            )
+        )
+
+
+def init_download_counter(app):
+    """Attach a ``DownloadCounter`` to ``app`` that is flushed on exit."""
+    counter = DownloadCounter(
+        app,
+        float(app.config.get("DOWNLOAD_COUNT_FLUSH_INTERVAL", DEFAULT_FLUSH_INTERVAL)),
+        int(app.config.get("DOWNLOAD_COUNT_FLUSH_ATTEMPTS", DEFAULT_FLUSH_ATTEMPTS)),
+    )
+    app.extensions["download_counter"] = counter
+    atexit.register(counter.stop)
+    return counter
+
+
+def count_download(installer, client=None):
+    """Count a download of a ``ResolvedInstaller`` by ``client``, the current request's by default."""
+    if client is None and has_request_context():
+        client = request.remote_addr
+    stat = StatKey(
+        installer.identifier,
+        installer.version_code,
+        installer.architecture,
+        installer.scope,
+        datetime.now(timezone.utc).date(),
+    )
+    current_app.extensions["download_counter"].increment(
+        installer.package_id, stat, client
+    )
@@ -0,0 +1,290 @@
+"""Installer downloads for the ASGI app.
+
+Every manifest's ``InstallerUrl`` points at ``/api/download/...``, which
+this router answers like ``api.download`` of the Flask blueprint: S3 and
+external installers are redirected to, local files are handed to the
+reverse proxy if ``DOWNLOAD_OFFLOAD`` is set and sent by
+``InstallerFileResponse`` otherwise.
+
+That response never holds more than ``CHUNK_SIZE`` bytes of a file in
+memory, it reads the pieces it sends with ``os.pread`` in a worker thread
+so the event loop doesn't block on the disk. Single and multiple byte
+ranges are answered, the latter as ``multipart/byteranges``, and
+``If-Range`` is checked against the strong ETag made of the installer's
+SHA256.
+"""
+
+from __future__ import annotations
+
+import os
+import secrets
+import stat
+from datetime import datetime, timezone
+from functools import partial
+from typing import List, Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+import boto3
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import RedirectResponse
+from flask import current_app
+from sqlalchemy.ext.asyncio import AsyncSession
+from werkzeug.http import http_date
+from werkzeug.security import safe_join
+
+from .async_db import get_session, get_setting_value
+from .counters import count_download
+from .downloads import (
+    LATEST,
+    DownloadNotFound,
+    counts_as_download,
+    fetch_download,
+    installer_key,
+    offload_mode,
+    offload_target,
+)
+from .http_cache import byte_ranges, etag_matches, if_range_matches
+from .utils import basedir
+
+router = APIRouter(prefix="/api/download", tags=["downloads"])
+
+s3_client = boto3.client("s3")
+
+URL_EXPIRATION_SECONDS = 3600
+CHUNK_SIZE = 1024 * 1024
+MEDIA_TYPE = "application/octet-stream"
+
+
+class InstallerFileResponse(Response):
+    """Send byte ranges of the file at ``path``.
+
+    ``parts`` are ``(preamble, start, stop)`` triples, each preamble is sent
+    before the bytes from ``start`` up to ``stop`` and ``epilogue`` after all
+    of them.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        parts: List[Tuple[bytes, int, int]],
+        epilogue: bytes = b"",
+        status_code: int = 200,
+        headers: Optional[dict] = None,
+        media_type: str = MEDIA_TYPE,
+    ):
+        self.path = path
+        self.parts = parts
+        self.epilogue = epilogue
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+        length = sum(len(preamble) + stop - start for preamble, start, stop in parts)
+        self.headers["content-length"] = str(length + len(epilogue))
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["method"] == "HEAD":
+            await self._send_start(send)
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        fd = await anyio.to_thread.run_sync(os.open, self.path, os.O_RDONLY)
+        try:
+            await self._send_start(send)
+            # Stop reading the file once the client went away
+            async with anyio.create_task_group() as task_group:
+
+                async def wrap(func) -> None:
+                    await func()
+                    task_group.cancel_scope.cancel()
+
+                task_group.start_soon(wrap, partial(self._send_parts, send, fd))
+                await wrap(partial(self._listen_for_disconnect, receive))
+        finally:
+            os.close(fd)
+
+    async def _send_start(self, send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+
+    async def _send_parts(self, send, fd: int) -> None:
+        for preamble, start, stop in self.parts:
+            if preamble:
+                await send({"type": "http.response.body", "body": preamble, "more_body": True})
+            offset = start
+            while offset < stop:
+                chunk = await anyio.to_thread.run_sync(
+                    os.pread, fd, min(CHUNK_SIZE, stop - offset), offset
+                )
+                if not chunk:
+                    raise RuntimeError(f"{self.path} got shorter while it was sent")
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                offset += len(chunk)
+        await send({"type": "http.response.body", "body": self.epilogue, "more_body": False})
+
+    async def _listen_for_disconnect(self, receive) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+
+
+def content_disposition(file_name: str) -> str:
+    quoted = quote(file_name)
+    if quoted != file_name:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{file_name}"'
+
+
+def installer_etag(installer) -> Optional[str]:
+    """Return the strong ETag of a ``ResolvedInstaller``, its SHA256 if it has one."""
+    if not installer.installer_sha256:
+        return None
+    return f'"{installer.installer_sha256.lower()}"'
+
+
+def file_response(request: Request, path: str, size: int, mtime: float, installer) -> Response:
+    """Answer ``request`` with the file at ``path``, or the ranges of it it asks for."""
+    etag = installer_etag(installer)
+    last_modified = datetime.fromtimestamp(int(mtime), timezone.utc)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": content_disposition(installer.file_name),
+        "Last-Modified": http_date(last_modified),
+    }
+    if etag:
+        headers["ETag"] = etag
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+
+    ranges = None
+    if if_range_matches(request.headers.get("if-range"), etag, last_modified):
+        ranges = byte_ranges(request.headers.get("range"), size)
+    if ranges is None:
+        return InstallerFileResponse(path, [(b"", 0, size)], headers=headers)
+    if not ranges:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+        return InstallerFileResponse(path, [(b"", start, stop)], status_code=206, headers=headers)
+
+    boundary = secrets.token_hex(16)
+    parts = []
+    for start, stop in ranges:
+        preamble = (
+            f"--{boundary}\r\n"
+            f"Content-Type: {MEDIA_TYPE}\r\n"
+            f"Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n"
+        ).encode("latin-1")
+        # Every part but the first ends the previous one's body
+        parts.append((preamble if not parts else b"\r\n" + preamble, start, stop))
+    return InstallerFileResponse(
+        path,
+        parts,
+        epilogue=f"\r\n--{boundary}--\r\n".encode("latin-1"),
+        status_code=206,
+        headers=headers,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+    )
+
+
+def _stat_file(path: str) -> Optional[os.stat_result]:
+    try:
+        result = os.stat(path)
+    except OSError:
+        return None
+    return result if stat.S_ISREG(result.st_mode) else None
+
+
+async def _download(
+    request: Request,
+    session: AsyncSession,
+    identifier: str,
+    version,
+    architecture: str,
+    scope: str,
+) -> Response:
+    try:
+        installer = await fetch_download(session, identifier, version, architecture, scope)
+    except DownloadNotFound as error:
+        current_app.logger.warning(str(error))
+        raise HTTPException(status_code=404, detail=str(error))
+
+    client = request.client.host if request.client else None
+    counted = request.method == "GET" and counts_as_download(request.headers.get("range"))
+
+    if await get_setting_value(session, "USE_S3") and installer.external_url is None:
+        presigned_url = s3_client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": await get_setting_value(session, "BUCKET_NAME"),
+                "Key": installer_key(installer),
+                "ResponseContentDisposition": "attachment; filename=" + installer.file_name,
+                "ResponseContentType": MEDIA_TYPE,
+            },
+            ExpiresIn=URL_EXPIRATION_SECONDS,
+        )
+        if counted:
+            count_download(installer, client)
+        return RedirectResponse(presigned_url, status_code=302)
+
+    if installer.external_url:
+        if counted:
+            count_download(installer, client)
+        return RedirectResponse(installer.external_url, status_code=302)
+
+    path = safe_join(basedir, installer_key(installer))
+    result = await anyio.to_thread.run_sync(_stat_file, path) if path else None
+    if result is None:
+        current_app.logger.warning(f"Installer file not found: {path}")
+        raise HTTPException(status_code=404, detail="Installer file not found")
+
+    offload = offload_mode()
+    if offload:
+        target = offload_target(offload, os.path.join(basedir, "packages"), path)
+        response = Response(
+            media_type=MEDIA_TYPE,
+            headers={
+                offload: target,
+                "Content-Disposition": content_disposition(installer.file_name),
+            },
+        )
+    else:
+        response = file_response(request, path, result.st_size, result.st_mtime, installer)
+    # Revalidating a copy the client already has isn't a download
+    if counted and response.status_code != 304:
+        count_download(installer, client)
+    return response
+
+
+@router.api_route("/{identifier}/latest/{architecture}/{scope}", methods=["GET", "HEAD"])
+async def download_latest(
+    identifier: str,
+    architecture: str,
+    scope: str,
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+) -> Response:
+    """Send the installer of the newest version of a package that has one for ``architecture`` and ``scope``."""
+    return await _download(request, session, identifier, LATEST, architecture, scope)
+
+
+@router.api_route("/{identifier}/{version}/{architecture}/{scope}", methods=["GET", "HEAD"])
+async def download(
+    identifier: str,
+    version: str,
+    architecture: str,
+    scope: str,
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+) -> Response:
+    """Send an installer, supporting ``Range`` and ``If-Range``."""
+    return await _download(request, session, identifier, version, architecture, scope)
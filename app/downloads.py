@@ -0,0 +1,243 @@
+"""Resolution of download URLs to installers.
+
+``/api/download/<identifier>/<version>/<architecture>/<scope>`` resolves to
+a ``ResolvedInstaller`` holding everything needed to redirect to or stream
+the file, in one joined query. Resolutions are kept in a per-process LRU,
+so repeat downloads of the same installer don't touch the database. Any
+change to a package, version or installer bumps the catalog revision, which
+empties the LRU of every worker, see app.revision_cache. ``fetch_download``
+resolves through an ``AsyncSession`` for the ASGI app.
+
+The ``latest`` alias resolves to the newest version that has an installer
+for the requested architecture and scope, which isn't necessarily
+``Package.latest_version_id``. Versions can't be called ``latest``, see
+app.forms.
+
+Files in local storage are sent by the reverse proxy if ``DOWNLOAD_OFFLOAD``
+is set, so a multi-GB transfer doesn't tie up a worker: ``x-accel-redirect``
+for nginx, with ``DOWNLOAD_OFFLOAD_PREFIX`` naming the internal location
+that serves the ``packages/`` tree, or ``x-sendfile`` for Apache and
+lighttpd.
+"""
+
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from urllib.parse import quote
+
+from flask import Response, abort, current_app
+from sqlalchemy import and_, select
+from werkzeug.security import safe_join
+
+from app import db
+from app.manifests import CATALOG_REVISION
+from app.models import Installer, Package, PackageVersion
+from app.revision_cache import revision_cache
+
+DEFAULT_CACHE_SIZE = 1024
+
+OFFLOAD_HEADERS = {
+    "x-accel-redirect": "X-Accel-Redirect",
+    "x-sendfile": "X-Sendfile",
+}
+DEFAULT_OFFLOAD_PREFIX = "/protected/packages/"
+
+# Version of the ``latest`` download alias in resolution keys
+LATEST = object()
+
+ResolvedInstaller = namedtuple(
+    "ResolvedInstaller",
+    [
+        "package_id",
+        "identifier",
+        "name",
+        "publisher",
+        "version_code",
+        "architecture",
+        "scope",
+        "file_name",
+        "external_url",
+        "installer_sha256",
+    ],
+)
+
+_COLUMNS = [
+    Package.id,
+    Package.identifier,
+    Package.name,
+    Package.publisher,
+    PackageVersion.version_code,
+    Installer.architecture,
+    Installer.scope,
+    Installer.file_name,
+    Installer.external_url,
+    Installer.installer_sha256,
+]
+
+_lock = threading.Lock()
+
+
+class DownloadNotFound(LookupError):
+    """Raised with the message to answer with when a download doesn't resolve."""
+
+
+def _new_cache(session):
+    return OrderedDict()
+
+
+def _cache():
+    return revision_cache(CATALOG_REVISION, _new_cache)
+
+
+def _resolve_statement(identifier, version, architecture, scope):
+    if version is LATEST:
+        # Older versions may have the installer the newest one lacks
+        return (
+            select(*_COLUMNS)
+            .join(PackageVersion, PackageVersion.identifier == Package.identifier)
+            .join(Installer, Installer.version_id == PackageVersion.id)
+            .where(
+                Package.identifier == identifier,
+                Installer.architecture == architecture,
+                Installer.scope == scope,
+            )
+            .order_by(
+                PackageVersion.version_sort_key.desc(), PackageVersion.id.desc(), Installer.id
+            )
+            .limit(1)
+        )
+    # Outer joins tell which part of the URL didn't match
+    return (
+        select(*_COLUMNS, PackageVersion.id.label("version_id"), Installer.id.label("installer_id"))
+        .outerjoin(
+            PackageVersion,
+            and_(
+                PackageVersion.identifier == Package.identifier,
+                PackageVersion.version_code == version,
+            ),
+        )
+        .outerjoin(
+            Installer,
+            and_(
+                Installer.version_id == PackageVersion.id,
+                Installer.architecture == architecture,
+                Installer.scope == scope,
+            ),
+        )
+        .where(Package.identifier == identifier)
+        .order_by(PackageVersion.id, Installer.id)
+        .limit(1)
+    )
+
+
+def _resolved(row, version):
+    if version is LATEST:
+        if row is None:
+            raise DownloadNotFound("Installer not found")
+        return ResolvedInstaller(*row)
+    if row is None:
+        raise DownloadNotFound("Package not found")
+    if row.version_id is None:
+        raise DownloadNotFound("Package version not found")
+    if row.installer_id is None:
+        raise DownloadNotFound("Installer not found")
+    return ResolvedInstaller(*row[: len(_COLUMNS)])
+
+
+def _lookup(cache, key):
+    with _lock:
+        resolved = cache.get(key)
+        if resolved is not None:
+            cache.move_to_end(key)
+        return resolved
+
+
+def _store(cache, key, resolved):
+    size = current_app.config.get("DOWNLOAD_CACHE_SIZE", DEFAULT_CACHE_SIZE)
+    with _lock:
+        cache[key] = resolved
+        while len(cache) > size:
+            cache.popitem(last=False)
+    return resolved
+
+
+def resolve_download(identifier, version, architecture, scope):
+    """Return the ``ResolvedInstaller`` of a download URL, ``version`` may be ``LATEST``.
+
+    Raises ``DownloadNotFound`` if it doesn't resolve, misses aren't cached.
+    """
+    key = (identifier, version, architecture, scope)
+    cache = _cache().get()
+    resolved = _lookup(cache, key)
+    if resolved is not None:
+        return resolved
+    row = db.session.execute(_resolve_statement(*key)).first()
+    return _store(cache, key, _resolved(row, version))
+
+
+async def fetch_download(session, identifier, version, architecture, scope):
+    """``resolve_download`` on an ``AsyncSession``."""
+    key = (identifier, version, architecture, scope)
+    cache = await _cache().fetch(session)
+    resolved = _lookup(cache, key)
+    if resolved is not None:
+        return resolved
+    row = (await session.execute(_resolve_statement(*key))).first()
+    return _store(cache, key, _resolved(row, version))
+
+
+def installer_key(installer):
+    """Return the path of a ``ResolvedInstaller`` in storage, its S3 key or relative to app/."""
+    return "/".join(
+        [
+            "packages",
+            installer.publisher,
+            installer.identifier,
+            installer.version_code,
+            installer.architecture,
+            installer.file_name,
+        ]
+    )
+
+
+def counts_as_download(range_header):
+    """Return True if a request with ``range_header`` is counted as a download.
+
+    Only whole files are, winget fetches the first two bytes before the rest.
+    """
+    return range_header is None or range_header == "bytes=0-1"
+
+
+def init_download_offload(app):
+    """Check ``DOWNLOAD_OFFLOAD`` when the app is created rather than on every download."""
+    mode = (app.config.get("DOWNLOAD_OFFLOAD") or "").lower()
+    if mode and mode not in OFFLOAD_HEADERS:
+        raise ValueError(f"Unknown DOWNLOAD_OFFLOAD {mode!r}, use one of {', '.join(OFFLOAD_HEADERS)}")
+
+
+def offload_mode():
+    """Return the offload header name configured by ``DOWNLOAD_OFFLOAD``, None to stream."""
+    return OFFLOAD_HEADERS.get((current_app.config.get("DOWNLOAD_OFFLOAD") or "").lower())
+
+
+def offload_target(header, packages_dir, path):
+    """Return the value of the offload ``header`` sending ``path`` within ``packages_dir``."""
+    if header == "X-Accel-Redirect":
+        prefix = current_app.config.get("DOWNLOAD_OFFLOAD_PREFIX", DEFAULT_OFFLOAD_PREFIX)
+        relative = os.path.relpath(path, packages_dir).replace(os.sep, "/")
+        return prefix.rstrip("/") + "/" + quote(relative)
+    return os.path.abspath(path)
+
+
+def offload_response(header, packages_dir, directory, file_name):
+    """Answer with ``header`` telling the reverse proxy to send the file.
+
+    ``directory`` lies within ``packages_dir``; the proxy handles ``Range``.
+    """
+    path = safe_join(directory, file_name)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    response = Response(mimetype="application/octet-stream")
+    response.headers.set("Content-Disposition", "attachment", filename=file_name)
+    response.headers[header] = offload_target(header, packages_dir, path)
+    return response
@@ -6,20 +6,120 @@ import asyncio
 from typing import List
 
 from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi.responses import PlainTextResponse
+from starlette.datastructures import URL, Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from .async_db import dispose_async_db, init_async_db
+from .compression import compress, negotiate, should_compress
+from .http_cache import variant_etag
 from .models import Package, PackageVersion, Installer, db
+from .download_api import router as download_router
 from .winget_api import router as winget_router
 from .schemas import PackageSchema
+from .serialization import FastJSONResponse
+from .urls import is_trusted_host, reset_request_base_url, set_request_base_url
 from .storage import upload_bytes
 from . import create_app
 
-app = FastAPI(title="WinGetty Async API")
+app = FastAPI(title="WinGetty Async API", default_response_class=FastJSONResponse)
 app.include_router(winget_router)
+app.include_router(download_router)
+
+
+class RequestBaseURLMiddleware:
+    """Let installer URLs point at the host the client reached us on.
+
+    Hosts missing from ``TRUSTED_HOSTS`` are answered with 400.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        host = Headers(scope=scope).get("host") or URL(scope=scope).netloc
+        if not is_trusted_host(host, getattr(scope["app"].state, "trusted_hosts", None)):
+            response = PlainTextResponse("Invalid host header", status_code=400)
+            await response(scope, receive, send)
+            return
+        token = set_request_base_url(host, scope.get("root_path", ""))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            reset_request_base_url(token)
+
+
+class CompressJSONMiddleware:
+    """Compress JSON responses if the client accepts it and they aren't already.
+
+    Plain ASGI rather than ``BaseHTTPMiddleware``, so responses it leaves
+    alone, like streamed installer downloads, go to the server untouched.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        encoding = None
+        if scope["type"] == "http":
+            encoding = negotiate(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        body = []
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                mimetype = headers.get("content-type", "").split(";")[0].strip()
+                size = int(headers.get("content-length", 0))
+                if should_compress(mimetype, headers.get("content-encoding"), size):
+                    # Held back until the whole body is there
+                    start = message
+                    return
+            elif start is not None and message["type"] == "http.response.body":
+                body.append(message.get("body", b""))
+                if message.get("more_body", False):
+                    return
+                content = compress(b"".join(body), encoding)
+                headers = MutableHeaders(raw=list(start["headers"]))
+                headers["content-encoding"] = encoding
+                headers["content-length"] = str(len(content))
+                headers["vary"] = "Accept-Encoding"
+                if "etag" in headers:
+                    headers["etag"] = variant_etag(headers["etag"], encoding)
+                await send({**start, "headers": headers.raw})
+                message = {"type": "http.response.body", "body": content}
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+
+# Added last runs first, the base URL is set for everything below
+app.add_middleware(CompressJSONMiddleware)
+app.add_middleware(RequestBaseURLMiddleware)
+
 
 @app.on_event("startup")
 async def startup() -> None:
     # Initialize Flask application context for SQLAlchemy
     flask_app = create_app()
     flask_app.app_context().push()
+    init_async_db(flask_app)
+    app.state.flask_app = flask_app
+    app.state.trusted_hosts = flask_app.config.get("TRUSTED_HOSTS")
+
+
+@app.on_event("shutdown")
+async def shutdown() -> None:
+    # Write the buffered download counts before the worker goes away
+    await asyncio.to_thread(app.state.flask_app.extensions["download_counter"].stop)
+    await dispose_async_db()
 
 @app.get("/packages", response_model=List[PackageSchema])
 async def list_packages() -> List[PackageSchema]:
@@ -0,0 +1,273 @@
+"""Sparse fieldsets of the admin API.
+
+``to_dict()`` serializes a package, version or installer with everything
+below it. Endpoints that take ``?fields=`` and ``?expand=`` serialize only
+what was asked for and load only the columns and relationships that needs:
+
+* ``fields=id,installers.installer_sha256`` limits the output to those
+  fields, a dotted name selects fields of a related object and expands it.
+* ``expand=installers,installers.switches`` serializes related objects in
+  full, unexpanded relationships are listed by id.
+
+Without either parameter the output is the same as ``to_dict()``.
+"""
+
+from sqlalchemy import orm
+
+from app.models import (
+    Installer,
+    InstallerSwitch,
+    NestedInstallerFile,
+    Package,
+    PackageCommand,
+    PackageTag,
+    PackageVersion,
+)
+from app.urls import download_url
+
+
+class InvalidFieldset(ValueError):
+    """Raised for a field the requested object doesn't have."""
+
+
+def _loader(base, strategy, *args):
+    """Apply a loader ``strategy`` below ``base``, or at the root without one."""
+    return getattr(base if base is not None else orm, strategy)(*args)
+
+
+class Selection:
+    """Fields selected on one object and the selections of related objects."""
+
+    def __init__(self, fields=None):
+        # None selects every field
+        self.fields = fields
+        self.children = {}
+
+    def child(self, name):
+        if self.fields is not None:
+            self.fields.add(name)
+        return self.children.setdefault(name, Selection())
+
+    def select(self, name):
+        if self.fields is None:
+            self.fields = set()
+        self.fields.add(name)
+
+
+class ColumnField:
+    def __init__(self, column):
+        self.columns = [column]
+
+    def options(self, base, selection):
+        return []
+
+    def value(self, obj, selection):
+        return getattr(obj, self.columns[0].key)
+
+
+class ValuesField:
+    """One column of the rows of a relationship, like the tags of a package."""
+
+    columns = []
+
+    def __init__(self, relationship, column):
+        self.relationship = relationship
+        self.column = column
+
+    def options(self, base, selection):
+        return [_loader(base, "selectinload", self.relationship).load_only(self.column)]
+
+    def value(self, obj, selection):
+        return [getattr(row, self.column.key) for row in getattr(obj, self.relationship.key)]
+
+
+class RelationshipField:
+    """Related objects, serialized when expanded and listed by id otherwise."""
+
+    columns = []
+
+    def __init__(self, relationship, model, reverse=False):
+        self.relationship = relationship
+        self.model = model
+        self.reverse = reverse
+
+    def options(self, base, selection):
+        loader = _loader(base, "selectinload", self.relationship)
+        if selection is None:
+            return [loader.load_only(self.model.id)]
+        return load_options(self.model, selection, loader)
+
+    def value(self, obj, selection):
+        rows = getattr(obj, self.relationship.key)
+        if self.reverse:
+            rows = reversed(rows)
+        if selection is None:
+            return [row.id for row in rows]
+        return [serialize(row, selection) for row in rows]
+
+
+class ComputedField:
+    """A value derived from ``columns`` and whatever ``options`` load."""
+
+    def __init__(self, columns, options, value):
+        self.columns = columns
+        self._options = options
+        self._value = value
+
+    def options(self, base, selection):
+        return [self._options(base)]
+
+    def value(self, obj, selection):
+        return self._value(obj)
+
+
+def _columns(*columns):
+    return {column.key: ColumnField(column) for column in columns}
+
+
+# Same fields in the same order as the to_dict() of each model
+FIELDSETS = {
+    Package: {
+        **_columns(Package.id, Package.identifier, Package.name, Package.publisher, Package.moniker),
+        "tags": ValuesField(Package.tags, PackageTag.tag),
+        "commands": ValuesField(Package.commands, PackageCommand.command),
+        **_columns(Package.download_count),
+        "versions": RelationshipField(Package.versions, PackageVersion, reverse=True),
+    },
+    PackageVersion: {
+        **_columns(
+            PackageVersion.id,
+            PackageVersion.identifier,
+            PackageVersion.version_code,
+            PackageVersion.default_locale,
+            PackageVersion.package_locale,
+            PackageVersion.short_description,
+            PackageVersion.date_added,
+        ),
+        "installers": RelationshipField(PackageVersion.installers, Installer),
+        "package_id": ComputedField(
+            [PackageVersion.identifier],
+            lambda base: _loader(base, "joinedload", PackageVersion.package).load_only(
+                Package.id
+            ),
+            lambda version: version.package.id,
+        ),
+    },
+    Installer: {
+        **_columns(
+            Installer.id,
+            Installer.version_id,
+            Installer.architecture,
+            Installer.installer_type,
+            Installer.nested_installer_type,
+        ),
+        "nested_installer_files": RelationshipField(
+            Installer.nested_installer_files, NestedInstallerFile
+        ),
+        **_columns(
+            Installer.file_name,
+            Installer.external_url,
+            Installer.installer_sha256,
+            Installer.scope,
+            Installer.product_code,
+            Installer.package_family_name,
+        ),
+        "switches": RelationshipField(Installer.switches, InstallerSwitch),
+        "installer_url": ComputedField(
+            [Installer.version_id, Installer.architecture, Installer.scope],
+            lambda base: _loader(base, "joinedload", Installer.package_version).load_only(
+                PackageVersion.identifier, PackageVersion.version_code
+            ),
+            lambda installer: download_url(
+                installer.package_version.identifier,
+                installer.package_version.version_code,
+                installer.architecture,
+                installer.scope,
+            ),
+        ),
+    },
+    NestedInstallerFile: _columns(
+        NestedInstallerFile.id,
+        NestedInstallerFile.installer_id,
+        NestedInstallerFile.relative_file_path,
+        NestedInstallerFile.portable_command_alias,
+    ),
+    InstallerSwitch: _columns(
+        InstallerSwitch.id,
+        InstallerSwitch.installer_id,
+        InstallerSwitch.parameter,
+        InstallerSwitch.value,
+    ),
+}
+
+
+def _split(value):
+    return [name for name in (value or "").split(",") if name.strip()]
+
+
+def _walk(model, selection, path, create):
+    """Resolve ``path`` from ``model``, returning the model and selection at its end."""
+    *relationships, name = path.strip().split(".")
+    for relationship in relationships:
+        field = FIELDSETS[model].get(relationship)
+        if not isinstance(field, RelationshipField):
+            raise InvalidFieldset(path)
+        model, selection = field.model, create(selection, relationship)
+    if name not in FIELDSETS[model]:
+        raise InvalidFieldset(path)
+    return model, selection, name
+
+
+def parse_selection(model, fields=None, expand=None):
+    """Build the ``Selection`` of the ``fields`` and ``expand`` arguments.
+
+    Returns None if neither is given, which stands for the full ``to_dict()``.
+    Raises ``InvalidFieldset`` for unknown or non-expandable names.
+    """
+    if not fields and not expand:
+        return None
+    root = Selection()
+
+    def child(selection, name):
+        # A field below a relationship narrows down what's selected there
+        selected = selection.children.get(name)
+        selection.select(name)
+        if selected is None or selected.fields is None:
+            selected = selection.children[name] = Selection(set())
+        return selected
+
+    for path in _split(fields):
+        _, selection, name = _walk(model, root, path, child)
+        selection.select(name)
+    for path in _split(expand):
+        end_model, selection, name = _walk(
+            model, root, path, lambda selection, name: selection.child(name)
+        )
+        if not isinstance(FIELDSETS[end_model][name], RelationshipField):
+            raise InvalidFieldset(path)
+        selection.child(name)
+    return root
+
+
+def _selected(model, selection):
+    for name, field in FIELDSETS[model].items():
+        if selection.fields is None or name in selection.fields:
+            yield name, field
+
+
+def load_options(model, selection, base=None):
+    """Loader options that load exactly what ``serialize`` reads for ``selection``."""
+    columns = [model.id]
+    options = []
+    for name, field in _selected(model, selection):
+        columns.extend(field.columns)
+        options.extend(field.options(base, selection.children.get(name)))
+    return [_loader(base, "load_only", *columns), *options]
+
+
+def serialize(obj, selection):
+    """Serialize the fields of ``obj`` chosen by ``selection``."""
+    return {
+        name: field.value(obj, selection.children.get(name))
+        for name, field in _selected(type(obj), selection)
+    }
@@ -7,7 +7,7 @@ from flask_wtf.file import FileField, FileAllowed, FileRequired
 import wtforms
 from wtforms import Form, StringField, SelectField, validators, ValidationError
 
-from app.models import Setting
+from app.settings_cache import get_setting
 from . import constants
 class RequiredIf(object):
 
@@ -64,6 +64,16 @@ class RequiredIfFileOrURL:
 
 
 
+class NotReservedVersion:
+    """Reject version codes the download routes use for something else."""
+
+    reserved = ('latest',)
+
+    def __call__(self, form, field):
+        if field.data in self.reserved:
+            raise ValidationError(f'"{field.data}" is reserved for the newest version.')
+
+
 # this is type of form to just to escape csrf protection
 class AddInstallerFormFields(FlaskForm):
     class Meta:
@@ -79,7 +89,7 @@ class AddInstallerFormFields(FlaskForm):
             self.file.validators.append(Optional())
             self.url.validators.append(Optional())  # Both fields are optional when file_required is False
 
-        if Setting.get("USE_S3").get_value() and file_required:
+        if get_setting("use_s3") and file_required:
             self.is_aws.validators.append(InputRequired())
 
 
@@ -92,7 +102,7 @@ class AddInstallerFormFields(FlaskForm):
 
     is_aws = BooleanField('Is AWS', validators=[Optional()])
 
-    version = StringField('Version',validators=[RequiredIfFileOrURL('file', 'url')])
+    version = StringField('Version',validators=[RequiredIfFileOrURL('file', 'url'), NotReservedVersion()])
     
 
     architecture = SelectField('Architecture', choices=constants.architectures,validators=[RequiredIfFileOrURL('file', 'url')])
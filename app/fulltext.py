@@ -0,0 +1,120 @@
+"""Indexed substring search over package names, identifiers and publishers.
+
+SQLite keeps an FTS5 ``package_fts`` table with the trigram tokenizer in sync
+with ``package`` through triggers, substring matches are answered from it via
+``MATCH``. PostgreSQL gets ``pg_trgm`` GIN indexes (see the migration) which
+``ILIKE '%keyword%'`` uses directly. Other databases fall back to a plain
+``ILIKE``.
+
+Neither is declared on the models, ``include_object`` keeps Alembic's
+autogenerate from dropping them.
+"""
+
+from sqlalchemy import Boolean, DDL, bindparam, column, event, or_, select, table
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ColumnElement
+from sqlalchemy.sql.visitors import InternalTraversal
+
+from app.models import Package
+
+# Trigrams can't match anything shorter than three characters
+MIN_KEYWORD_LENGTH = 3
+
+FTS_COLUMNS = ("name", "identifier", "publisher")
+
+FTS_TABLE = "package_fts"
+TRIGRAM_INDEXES = {f"ix_package_{name}_trgm" for name in FTS_COLUMNS}
+
+package_fts = table(FTS_TABLE, column("rowid"))
+
+SQLITE_DDL = [
+    f"CREATE VIRTUAL TABLE package_fts USING fts5({', '.join(FTS_COLUMNS)}, "
+    "content='package', content_rowid='id', tokenize='trigram')",
+    """CREATE TRIGGER package_fts_ai AFTER INSERT ON package BEGIN
+        INSERT INTO package_fts(rowid, name, identifier, publisher)
+        VALUES (new.id, new.name, new.identifier, new.publisher);
+    END""",
+    """CREATE TRIGGER package_fts_ad AFTER DELETE ON package BEGIN
+        INSERT INTO package_fts(package_fts, rowid, name, identifier, publisher)
+        VALUES ('delete', old.id, old.name, old.identifier, old.publisher);
+    END""",
+    # Only fire for the indexed columns, not for download counts or revision bumps
+    """CREATE TRIGGER package_fts_au AFTER UPDATE OF name, identifier, publisher ON package BEGIN
+        INSERT INTO package_fts(package_fts, rowid, name, identifier, publisher)
+        VALUES ('delete', old.id, old.name, old.identifier, old.publisher);
+        INSERT INTO package_fts(rowid, name, identifier, publisher)
+        VALUES (new.id, new.name, new.identifier, new.publisher);
+    END""",
+]
+
+for statement in SQLITE_DDL:
+    # Migrations create the same objects, this covers db.create_all()
+    event.listen(Package.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """Alembic ``include_object`` hook skipping the search index objects."""
+    if type_ == "table":
+        # FTS5 keeps the index in shadow tables named after the virtual table
+        return name != FTS_TABLE and not name.startswith(f"{FTS_TABLE}_")
+    if type_ == "index":
+        return name not in TRIGRAM_INDEXES
+    return True
+
+
+def _like_pattern(keyword):
+    escaped = keyword.replace("/", "//").replace("%", "/%").replace("_", "/_")
+    return f"%{escaped}%"
+
+
+def _fts_query(columns, keyword):
+    names = " ".join(c.key for c in columns)
+    phrase = keyword.replace('"', '""')
+    return f'{{{names}}} : "{phrase}"'
+
+
+class SubstringMatch(ColumnElement):
+    """Case-insensitive substring match of a keyword against ``package`` columns."""
+
+    type = Boolean()
+    inherit_cache = True
+    _traverse_internals = [
+        ("columns", InternalTraversal.dp_clauseelement_tuple),
+        ("pattern", InternalTraversal.dp_clauseelement),
+        ("fts_query", InternalTraversal.dp_clauseelement),
+    ]
+
+    def __init__(self, columns, keyword):
+        self.columns = tuple(columns)
+        self.pattern = bindparam(None, _like_pattern(keyword), unique=True)
+        self.fts_query = bindparam(None, _fts_query(self.columns, keyword), unique=True)
+
+
+@compiles(SubstringMatch)
+def _compile_substring_match(element, compiler, **kw):
+    return compiler.process(
+        or_(*(c.ilike(element.pattern, escape="/") for c in element.columns)), **kw
+    )
+
+
+@compiles(SubstringMatch, "sqlite")
+def _compile_substring_match_sqlite(element, compiler, **kw):
+    fts_rows = select(package_fts.c.rowid).where(
+        column("package_fts").op("MATCH")(element.fts_query)
+    )
+    return compiler.process(Package.id.in_(fts_rows), **kw)
+
+
+def substring_match(columns, keyword):
+    """Return a condition matching ``keyword`` anywhere in any of ``columns``.
+
+    The index covers the name, identifier and publisher of ``Package``, any
+    other column is matched with a plain ``ILIKE``.
+    """
+    indexed = all(
+        column.table is Package.__table__ and column.key in FTS_COLUMNS
+        for column in columns
+    )
+    if not indexed or len(keyword) < MIN_KEYWORD_LENGTH:
+        return or_(*(c.ilike(_like_pattern(keyword), escape="/") for c in columns))
+    return SubstringMatch(columns, keyword)
@@ -0,0 +1,62 @@
+"""HyperLogLog sketch for approximate distinct counts.
+
+A sketch of ``2 ** precision`` one-byte registers estimates how many distinct
+values were added to it with a standard error of about
+``1.04 / sqrt(2 ** precision)``, 3.25% with the default 1 KiB of registers,
+no matter how many values there are. Sketches of the same precision merge
+losslessly, so daily sketches add up to the distinct count of any range of
+days.
+"""
+
+import hashlib
+import math
+
+DEFAULT_PRECISION = 10
+
+
+class HyperLogLog:
+    def __init__(self, registers=None, precision=DEFAULT_PRECISION):
+        self.precision = precision
+        size = 1 << precision
+        if registers is None:
+            self.registers = bytearray(size)
+        elif len(registers) != size:
+            raise ValueError(f"Expected {size} registers, got {len(registers)}")
+        else:
+            self.registers = bytearray(registers)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Load a sketch stored with ``to_bytes``, the precision follows from its size."""
+        return cls(data, int(math.log2(len(data))))
+
+    def to_bytes(self):
+        return bytes(self.registers)
+
+    def add(self, value):
+        digest = hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest()
+        hashed = int.from_bytes(digest, "big")
+        bits = 64 - self.precision
+        index = hashed >> bits
+        rest = hashed & ((1 << bits) - 1)
+        # Position of the leftmost 1 bit of what's left of the hash
+        rank = bits - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Can't merge sketches of different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        """Return the estimated number of distinct values added."""
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        # Linear counting is more accurate while many registers are still empty
+        if estimate <= 2.5 * size and zeros:
+            estimate = size * math.log(size / zeros)
+        return round(estimate)
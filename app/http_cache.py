@@ -0,0 +1,109 @@
+"""Conditional request helpers for the WinGet REST endpoints and downloads.
+
+Framework independent so the Flask blueprint and the FastAPI router answer
+``If-None-Match``, ``Range`` and ``If-Range`` the same way.
+"""
+
+import hashlib
+
+from werkzeug.http import parse_date, parse_range_header
+
+from app.serialization import dumps
+from app.settings_cache import get_setting
+
+CACHE_CONTROL_SETTING = "winget_cache_control"
+DEFAULT_CACHE_CONTROL = "no-cache"
+
+# More ranges than this in one request are ignored, the whole file is sent
+MAX_RANGES = 16
+
+
+def etag_for(*parts):
+    """Return a strong ETag derived from the JSON representation of ``parts``."""
+    digest = hashlib.sha256(dumps(parts, sort_keys=True)).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def variant_etag(etag, encoding):
+    """Return the ETag of the ``encoding`` representation of ``etag``, which differs per encoding."""
+    if not encoding:
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def etag_matches(if_none_match, etag):
+    """Return True if an ``If-None-Match`` header value matches ``etag``.
+
+    Uses the weak comparison RFC 9110 prescribes for ``If-None-Match``.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque_tag = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque_tag
+        for candidate in if_none_match.split(",")
+    )
+
+
+def matching_etag(if_none_match, etag, encoding=None):
+    """Return the ETag ``If-None-Match`` matches, None if it matches neither.
+
+    The client may hold the identity representation of ``etag`` or, if it
+    was compressed, the ``encoding`` one.
+    """
+    for candidate in dict.fromkeys([etag, variant_etag(etag, encoding)]):
+        if etag_matches(if_none_match, candidate):
+            return candidate
+    return None
+
+
+def cache_headers(etag, cache_control=None):
+    """Return the caching headers to send along with ``etag``.
+
+    ``cache_control`` is read from the settings unless given.
+    """
+    if cache_control is None:
+        cache_control = get_setting(CACHE_CONTROL_SETTING)
+    return {
+        "ETag": etag,
+        "Cache-Control": cache_control or DEFAULT_CACHE_CONTROL,
+        "Vary": "Accept-Encoding",
+    }
+
+
+def byte_ranges(range_header, size):
+    """Return the ``(start, stop)`` ranges of a ``size`` bytes file a ``Range`` header asks for.
+
+    None means the header is ignored (missing, malformed, not in bytes or too
+    many ranges), an empty list that none of the ranges is satisfiable.
+    """
+    parsed = parse_range_header(range_header)
+    if parsed is None or parsed.units != "bytes" or len(parsed.ranges) > MAX_RANGES:
+        return None
+    ranges = []
+    for begin, end in parsed.ranges:
+        if begin < 0:
+            # Suffix range, the last -begin bytes
+            if size:
+                ranges.append((max(size + begin, 0), size))
+        elif begin < size:
+            ranges.append((begin, size if end is None else min(end, size)))
+    return ranges
+
+
+def if_range_matches(if_range, etag, last_modified=None):
+    """Return True if the ``Range`` of a request with ``if_range`` applies.
+
+    Entity tags are compared strongly as RFC 9110 requires, so weak ones
+    never match; a date has to be the ``last_modified`` datetime sent.
+    """
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith("W/"):
+        return False
+    if if_range.startswith('"'):
+        return etag is not None and not etag.startswith("W/") and if_range == etag
+    return last_modified is not None and parse_date(if_range) == last_modified
@@ -0,0 +1,420 @@
+"""Materialized WinGet package manifests.
+
+``/wg/packageManifests/<identifier>`` is the hottest endpoint we serve, so the
+JSON body of every package is stored pre-serialized in ``PackageManifest`` and
+returned as-is. Any write to a package, its tags or commands, a version, an
+installer, a switch or a nested installer file bumps ``Package.revision`` in
+the same transaction, which turns the stored body stale; it is rebuilt from
+the ORM graph on the next read.
+The strong ETag of a manifest is a hash of the body served: revisions start
+over when a package is deleted and created again, and the same revision is
+served with other base URLs, versions or pages.
+
+Stored bodies hold a placeholder for the base of the installer URLs, which
+is filled in with the base URL of each request they are served to, see
+app.urls. With ``PUBLIC_BASE_URL`` configured, their gzip, brotli and zstd
+variants for it are stored next to them, so a hot manifest is only
+compressed once. Manifests are stored through a connection of their own,
+serving one never commits the session of the request.
+
+Requests for a single ``Version`` bypass the stored body and only load and
+serialize that version. The ``manifest_version_limit`` setting caps the
+stored manifests to the latest versions, a stored body is only served for
+the limit in effect, config overrides included. With ``manifest_page_size`` set,
+manifests are served in pages of versions linked by ``ContinuationToken``
+instead, those pages are built on every request.
+
+The same hook keeps ``Package.latest_version_id`` pointing at the newest
+version that has an installer.
+"""
+
+import hashlib
+from collections import namedtuple
+
+from sqlalchemy import and_, delete, event, insert, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload
+
+from app import db
+from app.compression import compress_all
+from app.continuation import after_position, fetch_page, keyset_position, keyset_token
+from app.models import (
+    Installer,
+    InstallerSwitch,
+    NestedInstallerFile,
+    Package,
+    PackageCommand,
+    PackageManifest,
+    PackageTag,
+    PackageVersion,
+    RevisionCounter,
+    Setting,
+)
+from app.revision_cache import mark_changed
+from app.serialization import dumps
+from app.urls import base_url, fill_base_url, placeholder_base_url, public_base_url
+
+# Bumped together with any package revision, search results depend on all of them
+CATALOG_REVISION = "catalog"
+
+# Package columns that end up in the manifest, download counts don't
+MANIFEST_ATTRIBUTES = ["identifier", "name", "publisher", "moniker"]
+
+# Every stored manifest depends on this one, see manifest_settings()
+VERSION_LIMIT_SETTING = "manifest_version_limit"
+PAGE_SIZE_SETTING = "manifest_page_size"
+
+# Content-Encoding -> PackageManifest column holding the body compressed with it
+ENCODED_BODIES = {
+    "gzip": PackageManifest.body_gzip,
+    "br": PackageManifest.body_br,
+    "zstd": PackageManifest.body_zstd,
+}
+
+# ``encoded`` maps a Content-Encoding to the body compressed with it
+Manifest = namedtuple("Manifest", ["revision", "body", "encoded"], defaults=[{}])
+
+# How many of the latest versions a manifest lists and how many a page lists, 0 for all
+ManifestSettings = namedtuple("ManifestSettings", ["version_limit", "page_size"])
+
+_settings_statement = select(Setting).where(
+    Setting.key.in_([VERSION_LIMIT_SETTING, PAGE_SIZE_SETTING])
+)
+
+
+def _integer_value(setting):
+    return max(setting.get_value() or 0, 0) if setting else 0
+
+
+def _manifest_settings(settings):
+    by_key = {setting.key: setting for setting in settings}
+    return ManifestSettings(
+        _integer_value(by_key.get(VERSION_LIMIT_SETTING)),
+        _integer_value(by_key.get(PAGE_SIZE_SETTING)),
+    )
+
+
+def manifest_settings(session):
+    """Return the ``ManifestSettings`` in effect, overrides from the app config applied."""
+    return _manifest_settings(session.scalars(_settings_statement))
+
+
+def _serialize(package, versions=None):
+    return dumps(package.generate_output(versions)).decode("utf-8")
+
+
+def _package(session, identifier):
+    return session.scalar(select(Package).where(Package.identifier == identifier))
+
+
+def _versions_statement(identifier):
+    return (
+        select(PackageVersion)
+        .where(
+            PackageVersion.identifier == identifier,
+            PackageVersion.installers.any(),
+        )
+        .options(
+            selectinload(PackageVersion.installers).selectinload(Installer.switches),
+            selectinload(PackageVersion.installers).selectinload(
+                Installer.nested_installer_files
+            ),
+        )
+    )
+
+
+def stored_manifest_statement(identifier, version_limit):
+    """Select the package revision and the stored bodies if they are still current.
+
+    Bodies built with another ``version_limit`` aren't.
+    """
+    return (
+        select(
+            Package.revision,
+            PackageManifest.body,
+            PackageManifest.base_url,
+            *ENCODED_BODIES.values(),
+        )
+        .outerjoin(
+            PackageManifest,
+            and_(
+                PackageManifest.identifier == Package.identifier,
+                PackageManifest.revision == Package.revision,
+                PackageManifest.version_limit == version_limit,
+            ),
+        )
+        .where(Package.identifier == identifier)
+    )
+
+
+def _served_manifest(revision, body, encoded, stored_base_url):
+    base = base_url()
+    if stored_base_url != base:
+        # Built for another base URL, compressed per response instead
+        encoded = {}
+    return Manifest(revision, fill_base_url(body, base), encoded)
+
+
+def _stored_manifest(row):
+    encoded = {
+        encoding: row._mapping[column]
+        for encoding, column in ENCODED_BODIES.items()
+        if row._mapping[column] is not None
+    }
+    return _served_manifest(row.revision, row.body, encoded, row.base_url)
+
+
+def get_manifest(
+    identifier, version=None, channel=None, market=None, continuation_token=None
+):
+    """Return the ``Manifest`` of ``identifier`` or None if it doesn't exist.
+
+    With ``version`` only that version is listed. We don't track channels, so
+    a package never has a version in a requested ``channel``; installers aren't
+    restricted to markets, so ``market`` doesn't narrow anything down.
+    Raises ``InvalidContinuationToken`` for a token we didn't hand out.
+    """
+    return load_manifest(
+        db.session, identifier, version, channel, market, continuation_token
+    )
+
+
+def load_manifest(
+    session, identifier, version=None, channel=None, market=None, continuation_token=None
+):
+    """``get_manifest`` on an explicit ``session``."""
+    if channel:
+        return None
+    if version:
+        return build_version_manifest(session, identifier, version)
+    settings = manifest_settings(session)
+    if settings.page_size:
+        return build_manifest_page(session, identifier, settings.page_size, continuation_token)
+
+    row = session.execute(stored_manifest_statement(identifier, settings.version_limit)).first()
+    if row is None:
+        return None
+    if row.body is not None:
+        return _stored_manifest(row)
+    return build_manifest(session, identifier, settings.version_limit)
+
+
+async def fetch_manifest(
+    session, identifier, version=None, channel=None, market=None, continuation_token=None
+):
+    """``get_manifest`` on an ``AsyncSession``.
+
+    A stored body is read without leaving the event loop, building one walks
+    the ORM graph through ``run_sync``.
+    """
+    if channel or version:
+        return await session.run_sync(
+            load_manifest, identifier, version, channel, market
+        )
+    settings = _manifest_settings(await session.scalars(_settings_statement))
+    if settings.page_size:
+        return await session.run_sync(
+            build_manifest_page, identifier, settings.page_size, continuation_token
+        )
+
+    row = (
+        await session.execute(stored_manifest_statement(identifier, settings.version_limit))
+    ).first()
+    if row is None:
+        return None
+    if row.body is not None:
+        return _stored_manifest(row)
+    return await session.run_sync(build_manifest, identifier, settings.version_limit)
+
+
+def build_manifest(session, identifier, limit=0):
+    """Serialize the manifest of the ``limit`` latest versions of ``identifier`` and store it."""
+    package = _package(session, identifier)
+    if package is None:
+        return None
+
+    versions = None
+    if limit:
+        latest = session.scalars(
+            _versions_statement(identifier)
+            .order_by(PackageVersion.version_sort_key.desc(), PackageVersion.id.desc())
+            .limit(limit)
+        )
+        versions = list(reversed(latest.all()))
+    with placeholder_base_url():
+        body = _serialize(package, versions)
+    public = public_base_url()
+    encoded = compress_all(fill_base_url(body, public).encode("utf-8")) if public else {}
+    _store_manifest(
+        session,
+        identifier=identifier,
+        revision=package.revision,
+        version_limit=limit,
+        body=body,
+        base_url=public,
+        **{column.key: encoded.get(encoding) for encoding, column in ENCODED_BODIES.items()},
+    )
+    return _served_manifest(package.revision, body, encoded, public)
+
+
+def _store_manifest(session, **values):
+    # Its own transaction, whatever the request's session holds stays untouched
+    try:
+        with session.get_bind(PackageManifest).begin() as connection:
+            connection.execute(
+                delete(PackageManifest).where(PackageManifest.identifier == values["identifier"])
+            )
+            connection.execute(insert(PackageManifest).values(**values))
+    except IntegrityError:
+        # Another worker stored the same manifest concurrently, theirs is just as good
+        pass
+
+
+def build_version_manifest(session, identifier, version_code):
+    """Serialize the manifest of a single version, None if it has no installers."""
+    package = _package(session, identifier)
+    if package is None:
+        return None
+    versions = session.scalars(
+        _versions_statement(identifier).where(PackageVersion.version_code == version_code)
+    ).all()
+    if not versions:
+        return None
+    return Manifest(package.revision, _serialize(package, versions))
+
+
+def build_manifest_page(session, identifier, page_size, continuation_token=None):
+    """Serialize the page of versions following ``continuation_token``."""
+    package = _package(session, identifier)
+    if package is None:
+        return None
+    statement = _versions_statement(identifier).order_by(
+        PackageVersion.version_sort_key, PackageVersion.id
+    )
+    if continuation_token:
+        position = keyset_position(continuation_token, str, int)
+        statement = statement.where(
+            after_position(
+                [PackageVersion.version_sort_key, PackageVersion.id], position
+            )
+        )
+
+    versions, has_more = fetch_page(
+        lambda count: session.scalars(statement.limit(count)).all(), page_size
+    )
+    output = package.generate_output(versions)
+    if has_more:
+        last = versions[-1]
+        output["ContinuationToken"] = keyset_token(last.version_sort_key, last.id)
+    return Manifest(package.revision, dumps(output).decode("utf-8"))
+
+
+def manifest_etag(manifest):
+    """Return the strong ETag of the identity encoding of a ``Manifest``."""
+    return f'"{hashlib.sha256(manifest.body.encode("utf-8")).hexdigest()[:32]}"'
+
+
+def _package_changed(obj):
+    state = inspect(obj)
+    return any(state.attrs[key].history.has_changes() for key in MANIFEST_ATTRIBUTES)
+
+
+def _changed_package_identifiers(session):
+    """Collect the identifiers of all packages touched by the current flush."""
+    identifiers = set()
+    package_ids = set()
+    version_ids = set()
+    installer_ids = set()
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Package):
+            if obj in session.dirty and not _package_changed(obj):
+                continue
+            identifiers.add(obj.identifier)
+        elif isinstance(obj, PackageVersion):
+            if obj.identifier is not None:
+                identifiers.add(obj.identifier)
+            elif obj.package is not None:
+                identifiers.add(obj.package.identifier)
+        elif isinstance(obj, Installer):
+            version_ids.add(obj.version_id)
+        elif isinstance(obj, (InstallerSwitch, NestedInstallerFile)):
+            installer_ids.add(obj.installer_id)
+        elif isinstance(obj, (PackageTag, PackageCommand)):
+            package_ids.add(obj.package_id)
+
+    connection = session.connection()
+    package_ids.discard(None)
+    if package_ids:
+        identifiers.update(
+            connection.execute(
+                select(Package.identifier).where(Package.id.in_(package_ids))
+            ).scalars()
+        )
+    installer_ids.discard(None)
+    if installer_ids:
+        version_ids.update(
+            connection.execute(
+                select(Installer.version_id).where(Installer.id.in_(installer_ids))
+            ).scalars()
+        )
+    version_ids.discard(None)
+    if version_ids:
+        identifiers.update(
+            connection.execute(
+                select(PackageVersion.identifier).where(
+                    PackageVersion.id.in_(version_ids)
+                )
+            ).scalars()
+        )
+    identifiers.discard(None)
+    return identifiers
+
+
+def latest_version_subquery():
+    """Correlated subquery selecting the newest installable version of ``Package``."""
+    return (
+        select(PackageVersion.id)
+        .where(
+            PackageVersion.identifier == Package.identifier,
+            PackageVersion.installers.any(),
+        )
+        .order_by(PackageVersion.version_sort_key.desc(), PackageVersion.id.desc())
+        .limit(1)
+        .correlate(Package)
+        .scalar_subquery()
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def invalidate_manifests(session, flush_context):
+    """Bump the revision of every package changed by this flush and of the catalog.
+
+    Also moves the latest version pointer of the changed packages.
+    """
+    limit_changed = any(
+        isinstance(obj, Setting) and obj.key == VERSION_LIMIT_SETTING
+        for obj in (*session.new, *session.dirty, *session.deleted)
+    )
+    identifiers = _changed_package_identifiers(session)
+    if not identifiers and not limit_changed:
+        return
+
+    connection = session.connection()
+    RevisionCounter.bump(connection, CATALOG_REVISION)
+    mark_changed(session, CATALOG_REVISION)
+    statement = update(Package).values(revision=Package.revision + 1)
+    if not limit_changed:
+        statement = statement.where(Package.identifier.in_(identifiers))
+    connection.execute(statement)
+    if identifiers:
+        connection.execute(
+            update(Package)
+            .where(Package.identifier.in_(identifiers))
+            .values(latest_version_id=latest_version_subquery())
+        )
+    deleted = {obj.identifier for obj in session.deleted if isinstance(obj, Package)}
+    if deleted:
+        connection.execute(
+            delete(PackageManifest).where(PackageManifest.identifier.in_(deleted))
+        )
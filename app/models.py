@@ -1,11 +1,15 @@
 import dataclasses
 from datetime import datetime
-from distutils.version import LooseVersion
 import json
 from app import db, bcrypt
-from flask import url_for, current_app
+from flask import current_app
 import os
 from flask_login import UserMixin
+from app.hll import HyperLogLog
+from app.upsert import insert_missing
+from app.urls import download_url, download_url_builder
+from app.versions import version_sort_key
+from sqlalchemy.orm import validates
 
 
 @dataclasses.dataclass
@@ -15,9 +19,29 @@ class Package(db.Model):
     name = db.Column(db.String(255), nullable=False)
     publisher = db.Column(db.String(255), nullable=False)
     versions = db.relationship(
-        "PackageVersion", backref="package", cascade="all, delete-orphan"
+        "PackageVersion",
+        backref="package",
+        cascade="all, delete-orphan",
+        order_by="(PackageVersion.version_sort_key, PackageVersion.id)",
     )
     download_count = db.Column(db.Integer, default=0)
+    moniker = db.Column(db.String(100), nullable=True, index=True)
+    tags = db.relationship("PackageTag", backref="package", cascade="all, delete-orphan")
+    commands = db.relationship(
+        "PackageCommand", backref="package", cascade="all, delete-orphan"
+    )
+    # Bumped whenever the package or anything below it changes, see app.manifests
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    # Newest version with an installer, maintained by app.manifests. No foreign key:
+    # the version is deleted before the pointer moves on, in the same flush
+    latest_version_id = db.Column(db.Integer, nullable=True)
+
+    __table_args__ = (
+        # Case-folded lookups of manifestSearch, see app.search
+        db.Index("ix_package_lower_name", db.func.lower(name)),
+        db.Index("ix_package_lower_identifier", db.func.lower(identifier)),
+        db.Index("ix_package_lower_moniker", db.func.lower(moniker)),
+    )
 
     def to_dict(self):
         return {
@@ -25,26 +49,28 @@ class Package(db.Model):
             "identifier": self.identifier,
             "name": self.name,
             "publisher": self.publisher,
+            "moniker": self.moniker,
+            "tags": [tag.tag for tag in self.tags],
+            "commands": [command.command for command in self.commands],
             "download_count": self.download_count,
-            "versions": sorted(
-                [version.to_dict() for version in self.versions],
-                key=lambda x: LooseVersion(x["version_code"]),
-                reverse=True,
-            ),
+            "versions": [version.to_dict() for version in reversed(self.versions)],
         }
 
-    def generate_output(self):
+    def generate_output(self, versions=None):
+        """Build the WinGet manifest, of ``versions`` only if given."""
         output = {
             "Data": {
                 "PackageIdentifier": self.identifier,
-                "Versions": self._get_version_data(),
+                "Versions": self._get_version_data(
+                    self.versions if versions is None else versions
+                ),
             }
         }
         return output
 
-    def _get_version_data(self):
+    def _get_version_data(self, versions):
         version_data = []
-        for version in self.versions:
+        for version in versions:
             data = {
                 "PackageVersion": version.version_code,
                 "DefaultLocale": self._get_default_locale(version),
@@ -56,15 +82,31 @@ class Package(db.Model):
         return version_data
 
     def _get_default_locale(self, version):
-        return {
+        default_locale = {
             "PackageLocale": version.package_locale,
             "Publisher": self.publisher,
             "PackageName": self.name,
             "ShortDescription": version.short_description,
         }
+        if self.moniker:
+            default_locale["Moniker"] = self.moniker
+        if self.tags:
+            default_locale["Tags"] = [tag.tag for tag in self.tags]
+        return default_locale
+
+    def _get_installer_identifiers(self, installer):
+        identifiers = {}
+        if installer.product_code:
+            identifiers["ProductCode"] = installer.product_code
+        if installer.package_family_name:
+            identifiers["PackageFamilyName"] = installer.package_family_name
+        if self.commands:
+            identifiers["Commands"] = [command.command for command in self.commands]
+        return identifiers
 
     def _get_installer_data(self, version):
         installer_data = []
+        installer_url = download_url_builder()
         for installer in version.installers:
             if installer.scope == "both":
                 # If installer is for both user and machine, create two entries for each scope (user and machine) but use it with download url
@@ -72,19 +114,17 @@ class Package(db.Model):
                     data = {
                         "Architecture": installer.architecture,
                         "InstallerType": installer.installer_type,
-                        "InstallerUrl": url_for(
-                            "api.download",
-                            identifier=self.identifier,
-                            version=version.version_code,
-                            architecture=installer.architecture,
-                            scope=installer.scope,
-                            _external=True,
-                            _scheme="https",
+                        "InstallerUrl": installer_url(
+                            self.identifier,
+                            version.version_code,
+                            installer.architecture,
+                            installer.scope,
                         ),
                         "InstallerSha256": installer.installer_sha256,
                         "Scope": scope,
                         "InstallerSwitches": self._get_installer_switches(installer),
                     }
+                    data.update(self._get_installer_identifiers(installer))
                     if installer.installer_type == "zip":
                         data["NestedInstallerType"] = installer.nested_installer_type
                         data["NestedInstallerFiles"] = self._get_nested_installer_data(
@@ -95,19 +135,17 @@ class Package(db.Model):
                 data = {
                     "Architecture": installer.architecture,
                     "InstallerType": installer.installer_type,
-                    "InstallerUrl": url_for(
-                        "api.download",
-                        identifier=self.identifier,
-                        version=version.version_code,
-                        architecture=installer.architecture,
-                        scope=installer.scope,
-                        _external=True,
-                        _scheme="https",
+                    "InstallerUrl": installer_url(
+                        self.identifier,
+                        version.version_code,
+                        installer.architecture,
+                        installer.scope,
                     ),
                     "InstallerSha256": installer.installer_sha256,
                     "Scope": installer.scope,
                     "InstallerSwitches": self._get_installer_switches(installer),
                 }
+                data.update(self._get_installer_identifiers(installer))
                 if installer.installer_type == "zip":
                     data["NestedInstallerType"] = installer.nested_installer_type
                     data["NestedInstallerFiles"] = self._get_nested_installer_data(
@@ -132,32 +170,133 @@ class Package(db.Model):
             nested_installer_data.append(data)
         return nested_installer_data
 
-    def generate_output_manifest_search(self):
-        output = {
-            "PackageIdentifier": self.identifier,
-            "PackageName": self.name,
-            "Publisher": self.publisher,
-            "Versions": [],
+
+class PackageTag(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    package_id = db.Column(db.Integer, db.ForeignKey("package.id"), index=True)
+    tag = db.Column(db.String(100), index=True)
+
+    __table_args__ = (db.Index("ix_package_tag_lower_tag", db.func.lower(tag)),)
+
+
+class PackageCommand(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    package_id = db.Column(db.Integer, db.ForeignKey("package.id"), index=True)
+    command = db.Column(db.String(100), index=True)
+
+    __table_args__ = (
+        db.Index("ix_package_command_lower_command", db.func.lower(command)),
+    )
+
+
+class PackageManifest(db.Model):
+    """Serialized ``/wg/packageManifests`` body of a package.
+
+    A row is only valid while ``revision`` matches ``Package.revision`` and
+    ``version_limit`` the limit in effect.
+    Installer URLs in ``body`` start with ``BASE_URL_PLACEHOLDER``, see
+    app.urls.
+    """
+
+    identifier = db.Column(db.String(255), primary_key=True)
+    revision = db.Column(db.Integer, nullable=False)
+    # manifest_version_limit the body was built with, 0 for all versions
+    version_limit = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    body = db.Column(db.Text, nullable=False)
+    # Pre-compressed variants of body, None when too small or the encoder is missing
+    body_gzip = db.Column(db.LargeBinary)
+    body_br = db.Column(db.LargeBinary)
+    body_zstd = db.Column(db.LargeBinary)
+    # PUBLIC_BASE_URL the compressed variants were built for, body has a placeholder instead
+    base_url = db.Column(db.String(255))
+    date_built = db.Column(db.DateTime, default=datetime.now)
+
+
+class DownloadStat(db.Model):
+    """Downloads of an installer on one day, written by app.counters.
+
+    Keyed by identifier rather than package id so statistics outlive the
+    package. ``clients`` holds the ``HyperLogLog`` of the client addresses.
+    """
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    identifier = db.Column(db.String(255), nullable=False)
+    version_code = db.Column(db.String(50), nullable=False)
+    architecture = db.Column(db.String(50), nullable=False)
+    scope = db.Column(db.String(50), nullable=False)
+    day = db.Column(db.Date, nullable=False, index=True)
+    downloads = db.Column(db.Integer, nullable=False, default=0)
+    clients = db.Column(db.LargeBinary, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint(identifier, version_code, architecture, scope, day),
+    )
+
+    def to_dict(self):
+        return {
+            "identifier": self.identifier,
+            "version_code": self.version_code,
+            "architecture": self.architecture,
+            "scope": self.scope,
+            "day": self.day.isoformat(),
+            "downloads": self.downloads,
+            "unique_clients": HyperLogLog.from_bytes(self.clients).count(),
         }
 
-        for version in self.versions:
-            version_data = {"PackageVersion": version.version_code}
-            # Only append version if there's at least one installer
-            if version.installers:
-                output["Versions"].append(version_data)
 
-        return output
+class RevisionCounter(db.Model):
+    """Named counter bumped on writes so every worker can tell its caches are stale."""
+
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def bump(connection, name):
+        increment = (
+            db.update(RevisionCounter)
+            .where(RevisionCounter.name == name)
+            .values(value=RevisionCounter.value + 1)
+        )
+        if connection.execute(increment).rowcount == 0:
+            # Another worker's first write may create the row at the same time
+            insert_missing(connection, RevisionCounter.__table__, {"name": name, "value": 0})
+            connection.execute(increment)
+
+    @staticmethod
+    def get(name):
+        value = db.session.execute(
+            db.select(RevisionCounter.value).where(RevisionCounter.name == name)
+        ).scalar()
+        return value or 0
 
 
 class PackageVersion(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    identifier = db.Column(db.String(50), db.ForeignKey("package.identifier"))
+    identifier = db.Column(db.String(50), db.ForeignKey("package.identifier"), index=True)
     version_code = db.Column(db.String(50))
     default_locale = db.Column(db.String(50))
     package_locale = db.Column(db.String(50))
     short_description = db.Column(db.String(50))
     date_added = db.Column(db.DateTime, default=datetime.now())
     installers = db.relationship("Installer", backref="package_version", lazy=True)
+    # Binary ordering of this is the version ordering, see app.versions
+    version_sort_key = db.Column(
+        db.String(255)
+        .with_variant(db.String(255, collation="C"), "postgresql")
+        .with_variant(db.String(255, collation="utf8mb4_bin"), "mysql", "mariadb"),
+        nullable=False,
+        default="",
+        server_default="",
+    )
+
+    __table_args__ = (
+        db.Index("ix_package_version_identifier_sort_key", identifier, version_sort_key),
+    )
+
+    @validates("version_code")
+    def _set_version_sort_key(self, key, version_code):
+        self.version_sort_key = version_sort_key(version_code)
+        return version_code
 
     def to_dict(self):
         return {
@@ -175,7 +314,7 @@ class PackageVersion(db.Model):
 
 class Installer(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    version_id = db.Column(db.Integer, db.ForeignKey("package_version.id"))
+    version_id = db.Column(db.Integer, db.ForeignKey("package_version.id"), index=True)
     architecture = db.Column(db.String(50))
     installer_type = db.Column(db.String(50))
     file_name = db.Column(db.String(100), nullable=True)
@@ -187,6 +326,15 @@ class Installer(db.Model):
     nested_installer_files = db.relationship(
         "NestedInstallerFile", backref="installer", lazy=True
     )
+    product_code = db.Column(db.String(255), nullable=True, index=True)
+    package_family_name = db.Column(db.String(255), nullable=True, index=True)
+
+    __table_args__ = (
+        db.Index("ix_installer_lower_product_code", db.func.lower(product_code)),
+        db.Index(
+            "ix_installer_lower_package_family_name", db.func.lower(package_family_name)
+        ),
+    )
 
     def to_dict(self):
         return {
@@ -200,8 +348,10 @@ class Installer(db.Model):
             "external_url": self.external_url,
             "installer_sha256": self.installer_sha256,
             "scope": self.scope,
+            "product_code": self.product_code,
+            "package_family_name": self.package_family_name,
             "switches": [switch.to_dict() for switch in self.switches],
-            "installer_url": url_for('api.download', identifier=self.package_version.package.identifier, version=self.package_version.version_code, architecture=self.architecture, scope=self.scope, _external=True, _scheme='https')
+            "installer_url": download_url(self.package_version.identifier, self.package_version.version_code, self.architecture, self.scope)
         }
 
     def to_json(self):
@@ -304,8 +454,11 @@ class Role(db.Model):
     users = db.relationship("User", back_populates="role")
 
     def has_permission(self, name):
-        # Check if the permission name is in there
-        return name in [permission.name for permission in self.permissions]
+        # Checked against the cached permission set, not self.permissions.
+        # Imported here, app.permissions imports this module
+        from app.permissions import role_permissions
+
+        return name in role_permissions(self.id)
 
     def user_count(self):
         return len(self.users)
@@ -345,36 +498,33 @@ class Setting(db.Model):
         else:
             self.value = value
 
-    def get_value(self):
-        # Convert self.key to uppercase for case-insensitive comparison
-        upper_key = self.key.upper()
-
-        # First, check if the setting is defined in app.config in a case-insensitive manner
-        if upper_key in (k.upper() for k in current_app.config):
-            app_config_value = current_app.config[upper_key]
-            # Return the app config value, converting it to the correct type
-            if self.type == "integer":
-                return int(app_config_value)
-            elif self.type == "boolean":
-                return app_config_value.lower() == "true" if isinstance(app_config_value, str) else bool(app_config_value)
-            elif self.type == "float":
-                return float(app_config_value)
-            elif self.type == "json":
-                return json.loads(app_config_value) if isinstance(app_config_value, str) else app_config_value
-            else:
-                return app_config_value
+    def _convert(self, value):
+        # Return the value converted to the type of the setting
+        if self.type == "integer":
+            return int(value)
+        elif self.type == "boolean":
+            return value.lower() == "true" if isinstance(value, str) else bool(value)
+        elif self.type == "float":
+            return float(value)
+        elif self.type == "json":
+            return json.loads(value) if isinstance(value, str) else value
         else:
-            # Otherwise, return the value from the database, as before
-            if self.type == "integer":
-                return int(self.value)
-            elif self.type == "boolean":
-                return self.value.lower() == "true"
-            elif self.type == "float":
-                return float(self.value)
-            elif self.type == "json":
-                return json.loads(self.value)
-            else:
-                return self.value
+            return value
+
+    def get_value(self, overrides=None):
+        """Return the typed value, overridden by the app config if it has the key.
+
+        ``overrides`` maps upper-cased keys to the values overriding the
+        database, the app config by default. See app.settings_cache for
+        cached values.
+        """
+        if overrides is None:
+            overrides = current_app.config
+        upper_key = self.key.upper()
+        if upper_key in overrides:
+            return self._convert(overrides[upper_key])
+        # Otherwise, return the value from the database, as before
+        return self._convert(self.value)
 
     def get(key):
         key = key.lower()
@@ -389,5 +539,5 @@ class Setting(db.Model):
             "type": self.type,
             "value": self.get_value(),
             "depends_on": self.depends_on,
-            "is_env": upper_key in (k.upper() for k in current_app.config)
+            "is_env": upper_key in current_app.config
         }
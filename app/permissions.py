@@ -1,7 +1,47 @@
+from collections import defaultdict
+
 from flask import current_app
-from app.models import Permission, Role, User
+from app.models import Permission, Role, User, roles_permissions
 from app import db
+from app.revision_cache import revision_cache, track
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+
+ROLES_REVISION = "roles"
+
+
+def _load_role_permissions(session):
+    names = defaultdict(set)
+    rows = session.execute(
+        select(roles_permissions.c.role_id, Permission.name).join(
+            Permission, Permission.id == roles_permissions.c.permission_id
+        )
+    )
+    for role_id, name in rows:
+        names[role_id].add(name)
+    return {role_id: frozenset(role_names) for role_id, role_names in names.items()}
+
+
+track(ROLES_REVISION, Role, Permission)
+
+
+def role_permissions(role_id):
+    """Return the names of the permissions of role ``role_id`` as a frozenset.
+
+    All roles are cached per process, see app.revision_cache.
+    """
+    permissions = revision_cache(ROLES_REVISION, _load_role_permissions).get()
+    return permissions.get(role_id, frozenset())
+
+
+def load_user(user_id):
+    """Load the user of a session with their role in one query.
+
+    Permission checks then go to the cache and don't query at all.
+    """
+    return User.query.options(joinedload(User.role)).get(int(user_id))
+
 
 def get_or_create(model, **kwargs):
     """Get an instance if it exists, otherwise create and return an instance."""
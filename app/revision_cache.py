@@ -0,0 +1,134 @@
+"""Process-wide caches of tables that are read all the time and rarely written.
+
+A ``RevisionCache`` keeps whatever its ``load`` function builds from the
+database in memory. Flushing a change to one of the models it is built from
+bumps the ``RevisionCounter`` named after it; a worker compares that counter
+with the revision it loaded at most once every ``CACHE_CHECK_INTERVAL``
+seconds and reloads when it moved on. The worker that made the change drops
+its cache on commit right away.
+
+The listeners are registered on every ``Session``, so writes through the
+``AsyncSession`` of the ASGI app bump revisions like those of Flask's
+``db.session``.
+"""
+
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import RevisionCounter
+
+DEFAULT_INTERVAL = 1.0
+
+# Revision name -> models whose changes bump it
+_tracked = {}
+
+
+class RevisionCache:
+    def __init__(self, revision, load, interval=DEFAULT_INTERVAL):
+        self.revision = revision
+        self.load = load
+        self.interval = interval
+        self.value = None
+        self.loaded_revision = None
+        self.checked_at = None
+        # Bumped by clear(), a refresh that overlapped it mustn't count as a check
+        self.generation = 0
+        self._lock = threading.Lock()
+
+    def stale(self):
+        return (
+            self.checked_at is None
+            or time.monotonic() - self.checked_at >= self.interval
+        )
+
+    def refresh(self, session):
+        """Reload through ``session`` if the revision changed.
+
+        No lock is held while querying: ``fetch`` runs this on the event loop,
+        waiting for a lock there would block the I/O of the request holding
+        it. Requests finding the cache stale at the same time may each load
+        it, the newest revision wins.
+        """
+        generation = self.generation
+        cleared = self.checked_at is None
+        revision = session.execute(
+            select(RevisionCounter.value).where(RevisionCounter.name == self.revision)
+        ).scalar() or 0
+        value = None
+        if cleared or revision != self.loaded_revision:
+            value = self.load(session)
+        with self._lock:
+            if value is not None and (
+                self.loaded_revision is None or revision >= self.loaded_revision
+            ):
+                # Swapped as a whole, readers in other threads never see a partial load
+                self.value = value
+                self.loaded_revision = revision
+            if generation == self.generation:
+                self.checked_at = time.monotonic()
+
+    def get(self, session=None):
+        if self.stale():
+            self.refresh(session or db.session)
+        return self.value
+
+    async def fetch(self, session):
+        """``get`` on an ``AsyncSession``."""
+        if self.stale():
+            await session.run_sync(self.refresh)
+        return self.value
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self.checked_at = None
+
+
+def revision_cache(revision, load, app=None):
+    """Return the ``RevisionCache`` of ``revision`` of ``app``, the current one by default."""
+    app = app or current_app
+    caches = app.extensions.setdefault("revision_caches", {})
+    cache = caches.get(revision)
+    if cache is None:
+        interval = float(app.config.get("CACHE_CHECK_INTERVAL", DEFAULT_INTERVAL))
+        cache = caches.setdefault(revision, RevisionCache(revision, load, interval))
+    return cache
+
+
+def track(revision, *models):
+    """Bump ``revision`` whenever an instance of one of ``models`` is flushed."""
+    _tracked[revision] = models
+
+
+def mark_changed(session, revision):
+    """Drop the caches of ``revision`` of this worker once ``session`` commits."""
+    session.info.setdefault("changed_revisions", set()).add(revision)
+
+
+@event.listens_for(Session, "after_flush")
+def bump_revisions(session, flush_context):
+    changed = list(session.new) + list(session.dirty) + list(session.deleted)
+    for revision, models in _tracked.items():
+        if any(isinstance(obj, models) for obj in changed):
+            RevisionCounter.bump(session.connection(), revision)
+            mark_changed(session, revision)
+
+
+@event.listens_for(Session, "after_commit")
+def clear_changed_caches(session):
+    changed = session.info.pop("changed_revisions", ())
+    if changed and has_app_context():
+        caches = current_app.extensions.get("revision_caches", {})
+        for revision in changed:
+            if revision in caches:
+                caches[revision].clear()
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_changed_revisions(session):
+    session.info.pop("changed_revisions", None)
@@ -17,6 +17,8 @@ class InstallerSchema(BaseModel):
     external_url: Optional[str] = None
     installer_sha256: str
     scope: str
+    product_code: Optional[str] = None
+    package_family_name: Optional[str] = None
     nested_installer_type: Optional[str] = None
     nested_installer_files: List[NestedInstallerFileSchema] = []
     switches: List[InstallerSwitchSchema] = []
@@ -39,6 +41,7 @@ class PackageSchema(BaseModel):
     identifier: str
     name: str
     publisher: str
+    moniker: Optional[str] = None
     download_count: int
     versions: List[PackageVersionSchema] = []
 
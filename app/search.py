@@ -0,0 +1,253 @@
+"""WinGet ``manifestSearch`` query building shared by the Flask and FastAPI routes.
+
+Each ``MatchType`` is compiled into an operator the database can answer from an
+index: plain equality for Exact, equality on ``lower()`` for CaseInsensitive,
+a range scan on ``lower()`` for StartsWith and the text index for Substring.
+Keywords are case-folded by the database's ``lower()`` like the columns, which
+on SQLite only folds ASCII letters. Unknown match types match nothing.
+
+A search never loads ORM objects: the matching packages are fetched as plain
+column tuples in one query and their installable version codes in a second
+one, no matter how many packages match. Packages without any installer are
+filtered out by the database before ``MaximumResults`` is applied.
+
+Results are returned in pages of at most ``SEARCH_PAGE_SIZE`` packages ordered
+by identifier. The ``ContinuationToken`` of a page is the last identifier on it,
+the next page starts right after it in the unique identifier index.
+"""
+
+from collections import namedtuple
+
+from sqlalchemy import and_, false, func, or_, select, true
+
+from app.continuation import InvalidContinuationToken, decode_token, encode_token, fetch_page
+from app.fulltext import substring_match
+from app.models import Installer, Package, PackageCommand, PackageTag, PackageVersion
+
+
+def _on_installers(condition):
+    return Package.versions.any(PackageVersion.installers.any(condition))
+
+
+# PackageMatchField -> (column, wrapper turning a condition on it into one on Package)
+MATCH_FIELDS = {
+    "PackageName": (Package.name, None),
+    "PackageIdentifier": (Package.identifier, None),
+    "Moniker": (Package.moniker, None),
+    "Tag": (PackageTag.tag, Package.tags.any),
+    "Command": (PackageCommand.command, Package.commands.any),
+    "ProductCode": (Installer.product_code, _on_installers),
+    "PackageFamilyName": (Installer.package_family_name, _on_installers),
+}
+
+# Fields the free text ``Query`` is matched against besides name and identifier
+QUERY_FIELDS = ["Moniker", "Tag", "Command"]
+
+SUBSTRING_MATCH_TYPES = ["Substring", "Partial", "Fuzzy", "FuzzySubstring"]
+
+SEARCH_PAGE_SIZE = 100
+
+SearchPage = namedtuple("SearchPage", ["data", "continuation_token"])
+
+
+def _like_escape(keyword):
+    return keyword.replace("/", "//").replace("%", "/%").replace("_", "/_")
+
+
+def _starts_with(column, keyword):
+    """Prefix match on ``lower(column)`` written as a range so the index can be scanned.
+
+    The LIKE only weeds out false positives of collations ignoring punctuation.
+    """
+    lowered = func.lower(column)
+    if not keyword.isascii():
+        # Python and the database may fold these differently, only the LIKE is safe
+        return lowered.like(func.lower(f"{_like_escape(keyword)}%"), escape="/")
+    folded = keyword.lower()
+    upper_bound = folded[:-1] + chr(ord(folded[-1]) + 1)
+    return and_(
+        lowered >= folded,
+        lowered < upper_bound,
+        lowered.like(f"{_like_escape(folded)}%", escape="/"),
+    )
+
+
+def match_condition(columns, keyword, match_type):
+    """Compile a RequestMatch into a condition matching any of ``columns``.
+
+    Unknown or missing match types match nothing.
+    """
+    if match_type == "Exact":
+        return or_(*(column == keyword for column in columns))
+    if match_type == "CaseInsensitive":
+        return or_(*(func.lower(column) == func.lower(keyword) for column in columns))
+    if match_type == "StartsWith":
+        if not keyword:
+            return true()
+        return or_(*(_starts_with(column, keyword) for column in columns))
+    if match_type in SUBSTRING_MATCH_TYPES:
+        return substring_match(columns, keyword)
+    if match_type == "Wildcard":
+        pattern = _like_escape(keyword).replace("*", "%").replace("?", "_")
+        return or_(*(column.ilike(pattern, escape="/") for column in columns))
+    return false()
+
+
+def _field_condition(field, keyword, match_type):
+    """Return the condition matching ``field``, None for a field we don't store."""
+    if field not in MATCH_FIELDS:
+        return None
+    column, wrapper = MATCH_FIELDS[field]
+    condition = match_condition([column], keyword, match_type)
+    if wrapper is None:
+        return condition
+    return wrapper(condition)
+
+
+def _query_condition(main_query):
+    keyword = main_query.get("KeyWord") or ""
+    match_type = main_query.get("MatchType")
+    # Name and identifier together so a substring match is a single text index lookup
+    condition = match_condition([Package.name, Package.identifier], keyword, match_type)
+    return or_(
+        condition,
+        *(_field_condition(field, keyword, match_type) for field in QUERY_FIELDS),
+    )
+
+
+def _filter_condition(filter_entry):
+    request_match = filter_entry.get("RequestMatch") or {}
+    return _field_condition(
+        filter_entry.get("PackageMatchField"),
+        request_match.get("KeyWord") or "",
+        request_match.get("MatchType"),
+    )
+
+
+def search_condition(request_data):
+    """Translate a manifestSearch request body into a single SQL condition.
+
+    ``Query`` and ``Inclusions`` widen the result (OR), every entry of
+    ``Filters`` narrows it down (AND), except those on fields we don't store. Returns None for a request without
+    any criteria, which matches all packages.
+    """
+    alternatives = []
+    main_query = request_data.get("Query")
+    if main_query:
+        alternatives.append(_query_condition(main_query))
+    for inclusion in request_data.get("Inclusions") or []:
+        condition = _filter_condition(inclusion)
+        # Nothing matches a field we don't store
+        alternatives.append(false() if condition is None else condition)
+
+    # Filters on fields we don't store are skipped rather than matching nothing
+    conditions = [
+        condition
+        for condition in map(_filter_condition, request_data.get("Filters") or [])
+        if condition is not None
+    ]
+    if alternatives:
+        conditions.append(or_(*alternatives))
+    if not conditions:
+        return None
+    return and_(*conditions)
+
+
+def installable():
+    """Condition matching packages with at least one version that has an installer."""
+    return Package.versions.any(PackageVersion.installers.any())
+
+
+def package_statement(request_data, limit, after=None):
+    """Select the columns of the installable packages matching ``request_data``.
+
+    Only packages whose identifier sorts after ``after`` are selected.
+    """
+    statement = (
+        select(Package.identifier, Package.name, Package.publisher)
+        .where(installable())
+        .order_by(Package.identifier)
+    )
+    condition = search_condition(request_data)
+    if condition is not None:
+        statement = statement.where(condition)
+    if after is not None:
+        statement = statement.where(Package.identifier > after)
+    return statement.limit(limit)
+
+
+def versions_statement(identifiers):
+    """Select the version codes of ``identifiers`` that have at least one installer."""
+    return (
+        select(PackageVersion.identifier, PackageVersion.version_code)
+        .where(
+            PackageVersion.identifier.in_(identifiers),
+            PackageVersion.installers.any(),
+        )
+        .order_by(PackageVersion.version_sort_key, PackageVersion.id)
+    )
+
+
+def search_output(package_rows, version_rows):
+    """Build the manifestSearch ``Data`` entries from the fetched rows."""
+    versions = {}
+    for identifier, version_code in version_rows:
+        versions.setdefault(identifier, []).append({"PackageVersion": version_code})
+
+    return [
+        {
+            "PackageIdentifier": identifier,
+            "PackageName": name,
+            "Publisher": publisher,
+            "Versions": versions[identifier],
+        }
+        for identifier, name, publisher in package_rows
+        # The installers may have been removed in between both queries
+        if identifier in versions
+    ]
+
+
+def _page_position(continuation_token):
+    if not continuation_token:
+        return None, 0
+    position = decode_token(continuation_token, "after", "returned")
+    if not isinstance(position["after"], str) or not isinstance(position["returned"], int):
+        raise InvalidContinuationToken(continuation_token)
+    return position["after"], position["returned"]
+
+
+def search_packages(
+    session,
+    request_data,
+    maximum_results=50,
+    continuation_token=None,
+    page_size=SEARCH_PAGE_SIZE,
+):
+    """Run a manifestSearch request on ``session`` and return a ``SearchPage``.
+
+    ``maximum_results`` caps all pages together, 0 doesn't cap them. Raises
+    ``InvalidContinuationToken`` for a token we didn't hand out.
+    """
+    after, returned = _page_position(continuation_token)
+    limit = page_size
+    if maximum_results:
+        limit = min(limit, maximum_results - returned)
+    if limit <= 0:
+        return SearchPage([], None)
+
+    package_rows, has_more = fetch_page(
+        lambda count: session.execute(package_statement(request_data, count, after)).all(), limit
+    )
+    if not package_rows:
+        return SearchPage([], None)
+    version_rows = session.execute(
+        versions_statement([row.identifier for row in package_rows])
+    ).all()
+
+    next_token = None
+    returned += len(package_rows)
+    if has_more and (not maximum_results or returned < maximum_results):
+        next_token = encode_token(
+            {"after": package_rows[-1].identifier, "returned": returned}
+        )
+    return SearchPage(search_output(package_rows, version_rows), next_token)
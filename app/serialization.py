@@ -0,0 +1,82 @@
+"""Fast JSON encoding shared by the Flask and FastAPI responses.
+
+Everything is encoded by orjson straight to ``bytes``. The Flask provider
+keeps the output of Flask's default one (sorted keys, HTTP dates, indented
+in debug mode or with ``compact = False``, a trailing newline), so
+``jsonify`` callers don't notice the switch. Only non-ASCII characters
+differ, they are sent as UTF-8 rather than escaped.
+"""
+
+import decimal
+import json
+from datetime import date
+
+import orjson
+from fastapi.responses import JSONResponse
+from flask.json.provider import JSONProvider
+from werkzeug.http import http_date
+
+
+def _default(obj):
+    if isinstance(obj, date):
+        return http_date(obj)
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if hasattr(obj, "__html__"):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj, sort_keys=False, indent=False):
+    """Encode ``obj`` as UTF-8 JSON ``bytes``, compact unless ``indent``."""
+    option = orjson.OPT_PASSTHROUGH_DATETIME
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    if not sort_keys:
+        return orjson.dumps(obj, default=_default, option=option | orjson.OPT_NON_STR_KEYS)
+    try:
+        return orjson.dumps(obj, default=_default, option=option | orjson.OPT_SORT_KEYS)
+    except orjson.JSONEncodeError:
+        # orjson sorts non-str keys as strings, the json module by their value
+        text = json.dumps(
+            obj,
+            default=_default,
+            sort_keys=True,
+            ensure_ascii=False,
+            indent=2 if indent else None,
+            separators=None if indent else (",", ":"),
+        )
+        return text.encode("utf-8")
+
+
+class FastJSONProvider(JSONProvider):
+    """Flask JSON provider encoding with orjson."""
+
+    sort_keys = True
+    # Indented if False, or if None and the app is in debug mode
+    compact = None
+
+    def dumps(self, obj, **kwargs):
+        return dumps(
+            obj,
+            sort_keys=kwargs.get("sort_keys", self.sort_keys),
+            indent=kwargs.get("indent") is not None,
+        ).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        return self._app.response_class(
+            dumps(obj, sort_keys=self.sort_keys, indent=indent) + b"\n",
+            mimetype="application/json",
+        )
+
+
+class FastJSONResponse(JSONResponse):
+    """FastAPI response class encoding with orjson."""
+
+    def render(self, content):
+        return dumps(content)
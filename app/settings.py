@@ -104,6 +104,30 @@ def create_settings():
             "depends_on": "enable_uplink",
             "position": 8,
         },
+        {
+            "name": "WinGet Cache-Control",
+            "description": "Cache-Control header sent with WinGet REST responses, e.g. public, max-age=300.",
+            "key": "winget_cache_control",
+            "type": "string",
+            "value": "no-cache",
+            "position": 9,
+        },
+        {
+            "name": "Manifest version limit",
+            "description": "Only list the latest N versions in package manifests, 0 lists all of them.",
+            "key": "manifest_version_limit",
+            "type": "integer",
+            "value": "0",
+            "position": 10,
+        },
+        {
+            "name": "Manifest page size",
+            "description": "Split package manifests into pages of N versions linked by a ContinuationToken, 0 serves whole manifests.",
+            "key": "manifest_page_size",
+            "type": "integer",
+            "value": "0",
+            "position": 11,
+        },
     ]
 
     for setting in repository_settings:
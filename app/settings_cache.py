@@ -0,0 +1,55 @@
+"""Process-wide cache of the typed setting values.
+
+Settings are read on nearly every request, from downloads to every template
+render, and hardly ever change. Each worker keeps all of them in a
+``RevisionCache``, already converted to their type and with the overrides
+from the app config applied.
+
+Reads that have to be consistent with other rows of the same transaction,
+like the manifest settings of app.manifests, keep querying ``Setting``.
+"""
+
+from collections import namedtuple
+
+from flask import current_app
+from sqlalchemy import select
+
+from app.models import Setting
+from app.revision_cache import revision_cache, track
+
+SETTINGS_REVISION = "settings"
+
+# ``values`` is keyed by setting key, ``template_values`` by the upper-cased key
+SettingValues = namedtuple("SettingValues", ["values", "template_values"])
+
+
+def _load(session):
+    overrides = {key.upper(): value for key, value in current_app.config.items()}
+    values = {
+        setting.key: setting.get_value(overrides)
+        for setting in session.scalars(select(Setting))
+    }
+    return SettingValues(values, {key.upper(): value for key, value in values.items()})
+
+
+track(SETTINGS_REVISION, Setting)
+
+
+def settings_cache(app=None):
+    """Return the ``RevisionCache`` of the settings of ``app``."""
+    return revision_cache(SETTINGS_REVISION, _load, app)
+
+
+def get_setting(key, session=None):
+    """Return the value of setting ``key``, None if there is no such setting."""
+    return settings_cache().get(session).values.get(key.lower())
+
+
+async def fetch_setting(session, key):
+    """``get_setting`` on an ``AsyncSession``."""
+    return (await settings_cache().fetch(session)).values.get(key.lower())
+
+
+def all_settings():
+    """Return all setting values keyed by their upper-cased key, for templates."""
+    return settings_cache().get().template_values
@@ -8,7 +8,7 @@ from typing import Optional
 import boto3
 from azure.storage.blob.aio import BlobServiceClient
 
-from .models import Setting
+from .settings_cache import get_setting
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -26,9 +26,9 @@ class StorageBackend(str, Enum):
 
 def _get_backend() -> StorageBackend:
     """Return the configured storage backend."""
-    if Setting.get("use_s3").get_value():
+    if get_setting("use_s3"):
         return StorageBackend.S3
-    if Setting.get("use_azure").get_value():
+    if get_setting("use_azure"):
         return StorageBackend.AZURE
     return StorageBackend.LOCAL
 
@@ -36,7 +36,7 @@ async def _get_blob_client() -> BlobServiceClient:
     """Return a cached Azure BlobServiceClient instance."""
     global _blob_client
     if _blob_client is None:
-        conn = Setting.get("azure_connection_string").get_value()
+        conn = get_setting("azure_connection_string")
         _blob_client = BlobServiceClient.from_connection_string(conn)
     return _blob_client
 
@@ -44,10 +44,10 @@ async def upload_bytes(data: bytes, path: str) -> None:
     """Upload ``data`` to ``path`` using the configured backend."""
     backend = _get_backend()
     if backend is StorageBackend.S3:
-        bucket = Setting.get("bucket_name").get_value()
+        bucket = get_setting("bucket_name")
         await asyncio.to_thread(_s3_client.put_object, Bucket=bucket, Key=path, Body=data)
     elif backend is StorageBackend.AZURE:
-        container = Setting.get("azure_container").get_value()
+        container = get_setting("azure_container")
         client = await _get_blob_client()
         blob = client.get_container_client(container).get_blob_client(path)
         await blob.upload_blob(data, overwrite=True)
@@ -0,0 +1,30 @@
+"""Inserting rows other workers may insert at the same time.
+
+Counters and statistics rows are created by the first write that needs
+them. Two workers can both find the row missing, a plain INSERT then fails
+the transaction of one of them, along with everything else it wrote.
+"""
+
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+
+def insert_missing(connection, table, values):
+    """Insert a row unless one with the same unique key exists, without failing the transaction."""
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        statement = postgresql.insert(table).values(**values).on_conflict_do_nothing()
+    elif dialect == "sqlite":
+        statement = sqlite.insert(table).values(**values).on_conflict_do_nothing()
+    elif dialect in ("mysql", "mariadb"):
+        statement = insert(table).values(**values).prefix_with("IGNORE")
+    else:
+        # Only the savepoint is rolled back if another worker inserted first
+        try:
+            with connection.begin_nested():
+                connection.execute(insert(table).values(**values))
+        except IntegrityError:
+            pass
+        return
+    connection.execute(statement)
@@ -0,0 +1,142 @@
+"""Installer download URLs without ``url_for``.
+
+The download route is turned into a ``str.format`` template once per
+process, building a URL then only quotes the four path segments. The base
+URL comes from ``PUBLIC_BASE_URL`` if configured, otherwise from the current
+request: Flask's request context or, for the ASGI app, the value set by its
+middleware through ``set_request_base_url``.
+
+Bodies stored for every client, like manifests, are built inside
+``placeholder_base_url()`` and get the base URL of the request they are
+served to through ``fill_base_url``, a request's host never ends up in what
+other clients are sent. ``TRUSTED_HOSTS`` limits the hosts requests may
+name, others are answered with 400.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from urllib.parse import quote
+
+from flask import current_app, has_request_context, request
+from werkzeug.sansio.utils import host_is_trusted
+
+DOWNLOAD_ENDPOINT = "api.download"
+DOWNLOAD_ARGUMENTS = ("identifier", "version", "architecture", "scope")
+
+# Same quoting as werkzeug's default converter
+SEGMENT_SAFE = "!$&'()*+,/:;=@"
+
+# Installer URLs have always been handed out as https, proxies terminate TLS
+SCHEME = "https"
+
+# Stands in for the base URL in stored bodies, braces are quoted in URL paths
+BASE_URL_PLACEHOLDER = "{wingetty-base-url}"
+
+_request_base_url = ContextVar("request_base_url", default=None)
+_placeholder_base_url = ContextVar("placeholder_base_url", default=False)
+
+
+def set_request_base_url(host, root_path=""):
+    """Remember the base URL of the request being handled outside of Flask."""
+    return _request_base_url.set(f"{SCHEME}://{host}{root_path.rstrip('/')}")
+
+
+def reset_request_base_url(token):
+    _request_base_url.reset(token)
+
+
+def init_trusted_hosts(app):
+    """Check the host of Flask requests against ``TRUSTED_HOSTS`` when it is read."""
+    hosts = app.config.get("TRUSTED_HOSTS")
+    if hosts:
+        app.request_class = type("Request", (app.request_class,), {"trusted_hosts": list(hosts)})
+    elif not app.config.get("PUBLIC_BASE_URL"):
+        app.logger.warning(
+            "Neither PUBLIC_BASE_URL nor TRUSTED_HOSTS is set, installer URLs use any host a request names"
+        )
+
+
+def is_trusted_host(host, hosts):
+    """Return whether ``host`` may be used in URLs, any host is if ``hosts`` is empty."""
+    return not hosts or host_is_trusted(host, hosts)
+
+
+@contextmanager
+def placeholder_base_url():
+    """Build URLs starting with ``BASE_URL_PLACEHOLDER`` instead of the base URL."""
+    token = _placeholder_base_url.set(True)
+    try:
+        yield
+    finally:
+        _placeholder_base_url.reset(token)
+
+
+def fill_base_url(body, base=None):
+    """Replace the placeholder in a body built with ``placeholder_base_url()``.
+
+    ``base`` defaults to the base URL of the current request.
+    """
+    return body.replace(BASE_URL_PLACEHOLDER, base_url() if base is None else base)
+
+
+def compile_download_template(app):
+    """Return the ``str.format`` template of the download route path of ``app``."""
+    placeholders = {name: f"__{name}__" for name in DOWNLOAD_ARGUMENTS}
+    path = app.url_map.bind("").build(DOWNLOAD_ENDPOINT, placeholders)
+    template = path.replace("{", "{{").replace("}", "}}")
+    for name, placeholder in placeholders.items():
+        template = template.replace(placeholder, "{" + name + "}")
+    return template
+
+
+def _download_template(app):
+    template = app.extensions.get("download_url_template")
+    if template is None:
+        template = app.extensions["download_url_template"] = compile_download_template(app)
+    return template
+
+
+def public_base_url():
+    """Return the configured ``PUBLIC_BASE_URL`` without a trailing slash, None if unset."""
+    configured = current_app.config.get("PUBLIC_BASE_URL")
+    return configured.rstrip("/") if configured else None
+
+
+def base_url():
+    """Return the scheme, host and script root installer URLs start with."""
+    if _placeholder_base_url.get():
+        return BASE_URL_PLACEHOLDER
+    configured = public_base_url()
+    if configured:
+        return configured
+    from_asgi = _request_base_url.get()
+    if from_asgi is not None:
+        return from_asgi
+    if has_request_context():
+        return f"{SCHEME}://{request.host}{request.script_root}"
+    raise RuntimeError("Set PUBLIC_BASE_URL to build installer URLs outside of a request")
+
+
+def download_url_builder():
+    """Return a function building installer download URLs for the current app and request.
+
+    Resolve it once and call it per installer, the base and template lookups
+    are then only done once.
+    """
+    base = base_url().replace("{", "{{").replace("}", "}}")
+    prefix = base + _download_template(current_app._get_current_object())
+
+    def download_url(identifier, version, architecture, scope):
+        return prefix.format(
+            identifier=quote(str(identifier), safe=SEGMENT_SAFE),
+            version=quote(str(version), safe=SEGMENT_SAFE),
+            architecture=quote(str(architecture), safe=SEGMENT_SAFE),
+            scope=quote(str(scope), safe=SEGMENT_SAFE),
+        )
+
+    return download_url
+
+
+def download_url(identifier, version, architecture, scope):
+    """Build a single installer download URL."""
+    return download_url_builder()(identifier, version, architecture, scope)
@@ -3,7 +3,8 @@ import os
 import requests
 from flask import current_app, request
 from werkzeug.utils import secure_filename
-from app.models import Installer, InstallerSwitch, NestedInstallerFile, Setting
+from app.models import Installer, InstallerSwitch, NestedInstallerFile
+from app.settings_cache import get_setting
 from app.constants import installer_switches
 import boto3
 s3_client = boto3.client('s3')
@@ -60,7 +61,7 @@ def create_installer(publisher, identifier, version, installer_form):
         # Generate a pre-signed URL for S3 uploads
         presigned_url = s3_client.generate_presigned_url(
             'get_object',
-            Params={'Bucket': Setting.get("BUCKET_NAME").get_value(), 'Key': s3_object_key},
+            Params={'Bucket': get_setting("bucket_name"), 'Key': s3_object_key},
             ExpiresIn=URL_EXPIRATION_SECONDS
         )
         current_app.logger.info(f"Getting file hash from presigned URL: {presigned_url}")
@@ -104,6 +105,11 @@ def create_installer(publisher, identifier, version, installer_form):
 
     return installer
 
+def split_list(value):
+    """Split a comma separated form value into its stripped, non-empty entries."""
+    return [entry.strip() for entry in value.split(',') if entry.strip()]
+
+
 def calculate_sha256(filename):
     sha256_hash = hashlib.sha256()
 
@@ -118,11 +124,11 @@ def calculate_sha256(filename):
 def delete_installer_util(package, installer, version):
     if not installer.external_url and installer.file_name:
         base_path = ['packages', package.publisher, package.identifier, version.version_code, installer.architecture]
-        if Setting.get("USE_S3").get_value():
+        if get_setting("use_s3"):
             s3_key = '/'.join(base_path + [installer.file_name])
             current_app.logger.info(f"Deleting file from S3: {s3_key}")
             s3_client.delete_object(
-                Bucket=Setting.get("BUCKET_NAME").get_value(),
+                Bucket=get_setting("bucket_name"),
                 Key=s3_key
             )
         else:
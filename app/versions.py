@@ -0,0 +1,32 @@
+"""Byte-comparable sort keys for package version codes.
+
+``version_sort_key`` turns a version code into a string whose plain binary
+ordering is the version ordering, so it can be stored, indexed and used in
+``ORDER BY`` and range conditions. Like ``LooseVersion`` a version is split
+into runs of digits and letters, everything else only separates them:
+
+* numbers compare numerically: they are written as their digit count
+  (two digits) followed by the digits, leading zeros stripped, after a ``#``
+* letters compare alphabetically and case-insensitively, after numbers
+* a version that extends another one sorts after it, ``1.0`` < ``1.0.1``
+"""
+
+import re
+
+COMPONENT_RE = re.compile(r"\d+|[a-z]+")
+
+# Sorts before letters, so a shorter word sorts before a longer one it starts
+SEPARATOR = "."
+MAX_DIGITS = 99
+
+
+def version_sort_key(version_code):
+    """Return the sort key of ``version_code``, "" for an empty one."""
+    parts = []
+    for component in COMPONENT_RE.findall((version_code or "").lower()):
+        if component.isdigit():
+            digits = component.lstrip("0")[:MAX_DIGITS]
+            parts.append(f"#{len(digits):02d}{digits}")
+        else:
+            parts.append(component)
+    return SEPARATOR.join(parts)
@@ -1,13 +1,25 @@
 from __future__ import annotations
 
-import asyncio
 from typing import List, Optional
 
-from fastapi import APIRouter, Response
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
 from pydantic import BaseModel
-from sqlalchemy import or_
-
-from .models import Package, Setting
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .async_db import get_revision, get_session, get_setting_value
+from .compression import negotiate
+from .continuation import InvalidContinuationToken
+from .http_cache import (
+    CACHE_CONTROL_SETTING,
+    DEFAULT_CACHE_CONTROL,
+    cache_headers,
+    etag_for,
+    matching_etag,
+    variant_etag,
+)
+from .manifests import CATALOG_REVISION, fetch_manifest, manifest_etag
+from .search import search_packages
+from .serialization import dumps
 
 router = APIRouter(prefix="/wg", tags=["winget"])
 
@@ -18,27 +30,102 @@ async def index() -> str:
     return "WinGet API is running, see documentation for more information"
 
 
+class Conditions:
+    """The ``If-None-Match`` and ``Accept-Encoding`` headers of a request."""
+
+    def __init__(self, if_none_match: Optional[str], encoding: Optional[str]):
+        self.if_none_match = if_none_match
+        self.encoding = encoding
+
+    def matching_etag(self, etag: str) -> Optional[str]:
+        """Return the ETag of the copy the client says it has, None if it has none."""
+        return matching_etag(self.if_none_match, etag, self.encoding)
+
+    def not_modified(self, etag: str) -> bool:
+        return self.matching_etag(etag) is not None
+
+
+def request_conditions(
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+) -> Conditions:
+    return Conditions(if_none_match, negotiate(accept_encoding))
+
+
+async def _cached_response(
+    session: AsyncSession,
+    conditions: Conditions,
+    etag: str,
+    build_body,
+    encoded: Optional[dict] = None,
+) -> Response:
+    """Answer with 304 if the client already has ``etag``, otherwise with the built body.
+
+    ``encoded`` holds pre-compressed bodies by Content-Encoding, anything else
+    is compressed by the middleware, which also turns the ETag into the one of
+    the encoding.
+    """
+    cache_control = await get_setting_value(session, CACHE_CONTROL_SETTING)
+    cache_control = cache_control or DEFAULT_CACHE_CONTROL
+    matched = conditions.matching_etag(etag)
+    if matched:
+        return Response(status_code=304, headers=cache_headers(matched, cache_control))
+    headers = cache_headers(etag, cache_control)
+    if encoded and conditions.encoding in encoded:
+        headers["Content-Encoding"] = conditions.encoding
+        headers["ETag"] = variant_etag(etag, conditions.encoding)
+        return Response(
+            content=encoded[conditions.encoding],
+            media_type="application/json",
+            headers=headers,
+        )
+    return Response(content=build_body(), media_type="application/json", headers=headers)
+
+
 @router.get("/information")
-async def information() -> dict:
+async def information(
+    conditions: Conditions = Depends(request_conditions),
+    session: AsyncSession = Depends(get_session),
+) -> Response:
     """Return repository information."""
-    repo = await asyncio.to_thread(Setting.get("REPO_NAME").get_value)
-    return {
+    repo = await get_setting_value(session, "REPO_NAME")
+    data = {
         "Data": {
             "SourceIdentifier": repo,
             "ServerSupportedVersions": ["1.4.0", "1.5.0"],
         }
     }
+    return await _cached_response(
+        session, conditions, etag_for(data), lambda: dumps(data)
+    )
 
 
 @router.get("/packageManifests/{name}")
-async def get_package_manifest(name: str):
+async def get_package_manifest(
+    name: str,
+    Version: Optional[str] = None,
+    Channel: Optional[str] = None,
+    Market: Optional[str] = None,
+    ContinuationToken: Optional[str] = None,
+    conditions: Conditions = Depends(request_conditions),
+    session: AsyncSession = Depends(get_session),
+):
     """Return a package manifest or 204 if not found."""
-    package = await asyncio.to_thread(
-        Package.query.filter_by(identifier=name).first
-    )
-    if package is None:
+    try:
+        manifest = await fetch_manifest(
+            session, name, Version, Channel, Market, ContinuationToken
+        )
+    except InvalidContinuationToken:
+        raise HTTPException(status_code=400, detail="Invalid ContinuationToken")
+    if manifest is None:
         return Response(status_code=204)
-    return package.generate_output()
+    return await _cached_response(
+        session,
+        conditions,
+        manifest_etag(manifest),
+        lambda: manifest.body,
+        manifest.encoded,
+    )
 
 
 class ManifestField(BaseModel):
@@ -52,57 +139,40 @@ class ManifestFilter(BaseModel):
 
 
 class ManifestSearchRequest(BaseModel):
-    MaximumResults: int = 50
+    MaximumResults: Optional[int] = None
     Query: Optional[ManifestField] = None
     Filters: List[ManifestFilter] = []
     Inclusions: List[ManifestFilter] = []
+    ContinuationToken: Optional[str] = None
 
 
 @router.post("/manifestSearch")
-async def manifest_search(payload: ManifestSearchRequest):
+async def manifest_search(
+    payload: ManifestSearchRequest,
+    conditions: Conditions = Depends(request_conditions),
+    continuation_token: Optional[str] = Header(None, alias="ContinuationToken"),
+    session: AsyncSession = Depends(get_session),
+):
     """Search for packages using WinGet's manifestSearch schema."""
-    maximum_results = payload.MaximumResults or 50
-    packages_query = Package.query
-
-    combined_filters = payload.Filters + payload.Inclusions
-    filter_conditions = []
-
-    if payload.Query:
-        keyword = payload.Query.KeyWord
-        match_type = payload.Query.MatchType
-        if match_type == "Exact":
-            filter_conditions.append(
-                or_(Package.name == keyword, Package.identifier == keyword)
-            )
-
-    for entry in combined_filters:
-        field_map = {
-            "PackageName": Package.name,
-            "PackageIdentifier": Package.identifier,
-            "PackageFamilyName": Package.identifier,
-            "ProductCode": Package.name,
-            "Moniker": Package.name,
-        }
-        field = field_map.get(entry.PackageMatchField)
-        if not field:
-            continue
-        keyword = entry.RequestMatch.KeyWord
-        match_type = entry.RequestMatch.MatchType
-        if match_type == "Exact":
-            filter_conditions.append(field == keyword)
-        elif match_type in ["Partial", "Substring", "CaseInsensitive"]:
-            filter_conditions.append(field.ilike(f"%{keyword}%"))
-
-    if filter_conditions:
-        packages_query = packages_query.filter(or_(*filter_conditions))
-
-    packages_query = packages_query.limit(maximum_results)
-    packages = await asyncio.to_thread(packages_query.all)
-    output_data = [
-        package.generate_output_manifest_search()
-        for package in packages
-        if package.versions and any(v.installers for v in package.versions)
-    ]
-    if not output_data:
+    # 0 doesn't cap the results, like with the Flask blueprint
+    maximum_results = 50 if payload.MaximumResults is None else payload.MaximumResults
+    request_data = payload.dict()
+    continuation_token = continuation_token or payload.ContinuationToken
+    # Search results only change with the catalog, so the client's copy may still be good
+    catalog_revision = await get_revision(session, CATALOG_REVISION)
+    etag = etag_for(catalog_revision, request_data, continuation_token)
+    if conditions.not_modified(etag):
+        return await _cached_response(session, conditions, etag, None)
+
+    try:
+        page = await session.run_sync(
+            search_packages, request_data, maximum_results, continuation_token
+        )
+    except InvalidContinuationToken:
+        raise HTTPException(status_code=400, detail="Invalid ContinuationToken")
+    if not page.data and not page.continuation_token:
         return Response(status_code=204)
-    return {"Data": output_data}
+    output = {"Data": page.data}
+    if page.continuation_token:
+        output["ContinuationToken"] = page.continuation_token
+    return await _cached_response(session, conditions, etag, lambda: dumps(output))
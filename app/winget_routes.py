@@ -2,13 +2,19 @@
 import os
 from flask import Blueprint, jsonify, render_template, request, redirect, url_for, current_app, send_from_directory, flash
 from flask_login import login_required
-from sqlalchemy import and_, or_
 from werkzeug.http import parse_range_header
 from werkzeug.utils import secure_filename
 
 from app.utils import create_installer, save_file, basedir
 from app import db, settings
-from app.models import InstallerSwitch, Package, PackageVersion, Installer, Setting, User
+from app.models import InstallerSwitch, PackageVersion, Installer, RevisionCounter, User
+from app.compression import negotiate
+from app.http_cache import cache_headers, etag_for, matching_etag, variant_etag
+from app.continuation import InvalidContinuationToken
+from app.manifests import CATALOG_REVISION, get_manifest, manifest_etag
+from app.search import MATCH_FIELDS, search_packages
+from app.serialization import dumps
+from app.settings_cache import get_setting
 
 
 winget = Blueprint('winget', __name__)
@@ -17,16 +23,50 @@ winget = Blueprint('winget', __name__)
 def index():
     return "WinGet API is running, see documentation for more information", 200
 
+def not_modified_etag(etag):
+    """Return the ETag of the copy the request's ``If-None-Match`` says the client has, if any."""
+    return matching_etag(
+        request.headers.get('If-None-Match'), etag, negotiate(request.headers.get('Accept-Encoding'))
+    )
+
+def cached_response(etag, build_body, encoded=None):
+    """Answer with 304 if the client already has ``etag``, otherwise with the built JSON body.
+
+    ``encoded`` holds pre-compressed bodies by Content-Encoding, anything else
+    is compressed by the ``after_request`` hook, which also turns the ETag
+    into the one of the encoding.
+    """
+    encoding = negotiate(request.headers.get('Accept-Encoding'))
+    matched = not_modified_etag(etag)
+    if matched:
+        return current_app.response_class(status=304, headers=cache_headers(matched))
+    headers = cache_headers(etag)
+    if encoded and encoding in encoded:
+        headers['Content-Encoding'] = encoding
+        headers['ETag'] = variant_etag(etag, encoding)
+        return current_app.response_class(encoded[encoding], mimetype='application/json', headers=headers)
+    return current_app.response_class(build_body(), mimetype='application/json', headers=headers)
+
 @winget.route('/information')
 def information():
-    return jsonify({"Data": {"SourceIdentifier": Setting.get("REPO_NAME").get_value(), "ServerSupportedVersions": ["1.4.0", "1.5.0"]}})
+    data = {"Data": {"SourceIdentifier": get_setting("repo_name"), "ServerSupportedVersions": ["1.4.0", "1.5.0"]}}
+    return cached_response(etag_for(data), lambda: dumps(data))
     
 @winget.route('/packageManifests/<name>', methods=['GET'])
 def get_package_manifest(name):
-    package = Package.query.filter_by(identifier=name).first()
-    if package is None:
+    try:
+        manifest = get_manifest(
+            name,
+            version=request.args.get('Version'),
+            channel=request.args.get('Channel'),
+            market=request.args.get('Market'),
+            continuation_token=request.args.get('ContinuationToken'),
+        )
+    except InvalidContinuationToken:
+        return jsonify(message="Invalid ContinuationToken"), 400
+    if manifest is None:
         return jsonify({}), 204
-    return jsonify(package.generate_output())
+    return cached_response(manifest_etag(manifest), lambda: manifest.body, manifest.encoded)
 
 
 
@@ -36,68 +76,28 @@ def manifest_search():
     current_app.logger.info(f"Received manifestSearch request: {request_data}")
 
     maximum_results = request_data.get('MaximumResults', 50)
+    continuation_token = request.headers.get('ContinuationToken') or request_data.get('ContinuationToken')
 
-    # Initialize the base query
-    packages_query = Package.query
-
-    # Process Filters and Inclusions
-    combined_filters = request_data.get('Filters', []) + request_data.get('Inclusions', [])
-    filter_conditions = []
-
-     # Handle the main query part
-    if 'Query' in request_data:
-        main_query = request_data['Query']
-        keyword = main_query.get('KeyWord')
-        match_type = main_query.get('MatchType')
-        if match_type == 'Exact':
-            filter_conditions.append(or_(Package.name == keyword, Package.identifier == keyword))
+    # Search results only change with the catalog, so the client's copy may still be good
+    etag = etag_for(RevisionCounter.get(CATALOG_REVISION), request_data, continuation_token)
+    if not_modified_etag(etag):
+        return cached_response(etag, None)
 
-
-    for filter_entry in combined_filters:
-        field = {
-            'PackageName': Package.name,
-            'PackageIdentifier': Package.identifier,
-            'PackageFamilyName': Package.identifier,  # Update these mappings based on your schema
-            'ProductCode': Package.name,       # Update these mappings based on your schema
-            'Moniker': Package.name                 # Update these mappings based on your schema
-        }.get(filter_entry.get('PackageMatchField'))
-
-        if not field:
+    for filter_entry in request_data.get('Filters', []) + request_data.get('Inclusions', []):
+        if filter_entry.get('PackageMatchField') not in MATCH_FIELDS:
             current_app.logger.warning(f"Unsupported PackageMatchField: {filter_entry.get('PackageMatchField')}")
-            continue
-
-        keyword = filter_entry.get('RequestMatch', {}).get('KeyWord', '')
-        match_type = filter_entry.get('RequestMatch', {}).get('MatchType')
-
-        if match_type == 'Exact':
-            filter_conditions.append(field == keyword)
-        elif match_type in ['Partial', 'Substring', 'CaseInsensitive']:
-            filter_conditions.append(field.ilike(f'%{keyword}%'))
-        else:
-            current_app.logger.warning(f"Invalid match type: {match_type}")
-            continue
-
-
-
-
-    # Apply the filter conditions with or_
-    if filter_conditions:
-        packages_query = packages_query.filter(or_(*filter_conditions))
-
-    # Apply limit and execute query
-    packages_query = packages_query.limit(maximum_results)
-    packages = packages_query.all()
 
-    # Generate output data
-    output_data = [
-            package.generate_output_manifest_search()
-            for package in packages
-            if package.versions and any(version.installers for version in package.versions)
-        ]
-    if not output_data:
+    try:
+        page = search_packages(db.session, request_data, maximum_results, continuation_token)
+    except InvalidContinuationToken:
+        return jsonify(message="Invalid ContinuationToken"), 400
+    if not page.data and not page.continuation_token:
         current_app.logger.info("No packages found.")
         return jsonify({}), 204
 
-    current_app.logger.info(f"Returning {len(output_data)} packages.")
-    current_app.logger.info(f"Output Data: {output_data}")
-    return jsonify({"Data": output_data})
\ No newline at end of file
+    output = {"Data": page.data}
+    if page.continuation_token:
+        output["ContinuationToken"] = page.continuation_token
+    current_app.logger.info(f"Returning {len(page.data)} packages.")
+    current_app.logger.info(f"Output Data: {page.data}")
+    return cached_response(etag, lambda: dumps(output))
\ No newline at end of file
@@ -0,0 +1,81 @@
+"""Compare the JSON encoding of WinGet responses before and after app.serialization.
+
+Run from the repository root with ``python -m benchmarks.serialization``.
+"""
+
+import json
+import timeit
+
+from fastapi.encoders import jsonable_encoder
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from app.serialization import FastJSONProvider, dumps
+
+
+def manifest(versions=200, installers=4):
+    """A packageManifests body shaped like Package.generate_output()."""
+    return {
+        "Data": {
+            "PackageIdentifier": "Contoso.App",
+            "Versions": [
+                {
+                    "PackageVersion": f"1.{v}.0",
+                    "DefaultLocale": {
+                        "PackageLocale": "en-US",
+                        "Publisher": "Contoso",
+                        "PackageName": "App",
+                        "ShortDescription": "An app",
+                        "Tags": ["tools", "utilities"],
+                    },
+                    "Installers": [
+                        {
+                            "Architecture": architecture,
+                            "InstallerType": "exe",
+                            "InstallerUrl": f"https://wingetty.example/api/download/Contoso.App/1.{v}.0/{architecture}/machine",
+                            "InstallerSha256": "ab" * 32,
+                            "Scope": "machine",
+                            "InstallerSwitches": {"Silent": "/S", "SilentWithProgress": "/S"},
+                        }
+                        for architecture in ["x64", "x86", "arm64", "neutral"][:installers]
+                    ],
+                }
+                for v in range(versions)
+            ],
+        }
+    }
+
+
+def search(packages=1000):
+    """A manifestSearch body as built by app.search.search_output()."""
+    return {
+        "Data": [
+            {
+                "PackageIdentifier": f"Contoso.App{i}",
+                "PackageName": f"App {i}",
+                "Publisher": "Contoso",
+                "Versions": [{"PackageVersion": "1.0.0"}, {"PackageVersion": "2.0.0"}],
+            }
+            for i in range(packages)
+        ]
+    }
+
+
+def main(number=200):
+    flask_app = Flask(__name__)
+    candidates = {
+        "json.dumps": lambda body: json.dumps(body).encode("utf-8"),
+        "flask jsonify (default provider)": DefaultJSONProvider(flask_app).dumps,
+        "fastapi jsonable_encoder + json": lambda body: json.dumps(jsonable_encoder(body)),
+        "app.serialization.dumps": dumps,
+        "flask jsonify (FastJSONProvider)": FastJSONProvider(flask_app).dumps,
+    }
+    for name, body in [("manifest, 200 versions", manifest()), ("search, 1000 packages", search())]:
+        print(f"{name} ({len(dumps(body))} bytes)")
+        for label, encode in candidates.items():
+            seconds = timeit.timeit(lambda: encode(body), number=number) / number
+            print(f"  {label:<36} {seconds * 1000:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
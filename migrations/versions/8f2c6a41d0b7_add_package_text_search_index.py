@@ -0,0 +1,69 @@
+"""Add package text search index
+
+Revision ID: 8f2c6a41d0b7
+Revises: 5a7e3b9d12c4
+Create Date: 2026-10-18 11:24:09.635871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f2c6a41d0b7'
+down_revision = '5a7e3b9d12c4'
+branch_labels = None
+depends_on = None
+
+TRIGRAM_COLUMNS = ['name', 'identifier', 'publisher']
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE package_fts USING fts5(name, identifier, publisher, "
+            "content='package', content_rowid='id', tokenize='trigram')"
+        )
+        op.execute(
+            """CREATE TRIGGER package_fts_ai AFTER INSERT ON package BEGIN
+                INSERT INTO package_fts(rowid, name, identifier, publisher)
+                VALUES (new.id, new.name, new.identifier, new.publisher);
+            END"""
+        )
+        op.execute(
+            """CREATE TRIGGER package_fts_ad AFTER DELETE ON package BEGIN
+                INSERT INTO package_fts(package_fts, rowid, name, identifier, publisher)
+                VALUES ('delete', old.id, old.name, old.identifier, old.publisher);
+            END"""
+        )
+        op.execute(
+            """CREATE TRIGGER package_fts_au AFTER UPDATE OF name, identifier, publisher ON package BEGIN
+                INSERT INTO package_fts(package_fts, rowid, name, identifier, publisher)
+                VALUES ('delete', old.id, old.name, old.identifier, old.publisher);
+                INSERT INTO package_fts(rowid, name, identifier, publisher)
+                VALUES (new.id, new.name, new.identifier, new.publisher);
+            END"""
+        )
+        op.execute("INSERT INTO package_fts(package_fts) VALUES ('rebuild')")
+    elif dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for column in TRIGRAM_COLUMNS:
+            op.create_index(
+                f'ix_package_{column}_trgm',
+                'package',
+                [column],
+                postgresql_using='gin',
+                postgresql_ops={column: 'gin_trgm_ops'},
+            )
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for trigger in ['package_fts_ai', 'package_fts_ad', 'package_fts_au']:
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        op.execute('DROP TABLE IF EXISTS package_fts')
+    elif dialect == 'postgresql':
+        for column in TRIGRAM_COLUMNS:
+            op.drop_index(f'ix_package_{column}_trgm', table_name='package')
@@ -0,0 +1,58 @@
+import pytest
+from flask import Flask
+from sqlalchemy import event
+
+from app import db
+
+
+@pytest.fixture()
+def flask_app(tmp_path):
+    """A bare Flask app on an empty SQLite file, inside an app context.
+
+    The file rather than an in-memory database so async engines and other
+    connections see the same data.
+    """
+    flask_app = Flask(__name__)
+    flask_app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'wingetty.db'}"
+    flask_app.config["SECRET_KEY"] = "test"
+    flask_app.config["CACHE_CHECK_INTERVAL"] = 3600
+    db.init_app(flask_app)
+    with flask_app.app_context():
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture()
+def session(flask_app):
+    return db.session
+
+
+@pytest.fixture()
+def download_route(flask_app):
+    """Stand in for the download route of the api blueprint, installer URLs are built from it."""
+
+    @flask_app.route("/api/download/<identifier>/<version>/<architecture>/<scope>", endpoint="api.download")
+    def download(identifier, version, architecture, scope):
+        return ""
+
+
+@pytest.fixture()
+def count_queries(flask_app):
+    """Return a function calling ``func`` that returns its result and the number of queries it ran."""
+
+    def count_queries(func, *args, **kwargs):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+        return result, len(statements)
+
+    return count_queries
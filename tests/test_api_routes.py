@@ -0,0 +1,293 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from flask_login import LoginManager
+
+from app import api_routes, db
+from app.api_routes import api
+from app.counters import DownloadCounter
+from app.downloads import init_download_offload
+from app.continuation import encode_token, keyset_token
+from app.hll import HyperLogLog
+from app.models import DownloadStat, Installer, Package, PackageVersion, Permission, Role, User
+
+
+@pytest.fixture()
+def flask_app(flask_app):
+    login_manager = LoginManager(flask_app)
+    login_manager.user_loader(lambda user_id: db.session.get(User, int(user_id)))
+    flask_app.register_blueprint(api, url_prefix="/api")
+    role = Role(
+        name="admin",
+        permissions=[Permission(name=name) for name in ["view:package", "view:version"]],
+    )
+    db.session.add(User(username="admin", email="admin@example.com", role=role))
+    db.session.commit()
+    return flask_app
+
+
+@pytest.fixture()
+def client(flask_app):
+    client = flask_app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = "1"
+        session["_fresh"] = True
+    return client
+
+
+def add_package(identifier, version_codes=(), installers=True):
+    package = Package(identifier=identifier, name=identifier.split(".")[-1], publisher="Contoso")
+    for version_code in version_codes:
+        version = PackageVersion(version_code=version_code, identifier=identifier)
+        if installers:
+            version.installers.append(
+                Installer(architecture="x64", installer_type="exe", installer_sha256="00", scope="machine")
+            )
+        package.versions.append(version)
+    db.session.add(package)
+    db.session.commit()
+    return package
+
+
+def test_summary_counts_versions_without_installers(flask_app, client):
+    with flask_app.app_context():
+        add_package("Contoso.App", ["1.0", "2.0"])
+        add_package("Contoso.Draft", ["1.0", "2.0"], installers=False)
+        add_package("Contoso.Empty")
+
+    response = client.get("/api/packages?view=summary")
+    summaries = {
+        package["identifier"]: (
+            package["version_count"],
+            package["installer_count"],
+            package["latest_version"],
+        )
+        for package in response.get_json()["packages"]
+    }
+    assert summaries == {
+        "Contoso.App": (2, 2, "2.0"),
+        "Contoso.Draft": (2, 0, None),
+        "Contoso.Empty": (0, 0, None),
+    }
+
+
+def pages(client, url, name):
+    """Follow ``next_cursor`` from the first page, return the items and the first page."""
+    items = []
+    first = response = client.get(f"{url}&cursor=").get_json()
+    while True:
+        items.extend(response[name])
+        if response["next_cursor"] is None:
+            return items, first
+        response = client.get(f"{url}&cursor={response['next_cursor']}").get_json()
+
+
+def test_packages_cursor_round_trip(flask_app, client):
+    with flask_app.app_context():
+        for i in range(7):
+            add_package(f"Contoso.App{i}", ["1.0"], installers=i % 2 == 0)
+
+    packages, first = pages(client, "/api/packages?view=summary&limit=3&count=1", "packages")
+    assert [package["identifier"] for package in packages] == [f"Contoso.App{i}" for i in range(7)]
+    assert first["total"] == 7
+    assert len(first["packages"]) == 3
+
+    packages, _ = pages(client, "/api/packages?view=summary&limit=3&search=App", "packages")
+    assert len(packages) == 7
+
+
+def test_versions_cursor_with_ties_on_the_sort_key(flask_app, client):
+    with flask_app.app_context():
+        add_package("Contoso.App", ["1.0", "1.0", "2.0", "1.0", "1.0"])
+
+    versions, _ = pages(client, "/api/package/Contoso.App/versions?limit=2", "versions")
+    assert [version["version_code"] for version in versions] == ["1.0", "1.0", "1.0", "1.0", "2.0"]
+    assert len({version["id"] for version in versions}) == 5
+
+
+def test_invalid_cursor(flask_app, client):
+    with flask_app.app_context():
+        add_package("Contoso.App", ["1.0"])
+
+    for cursor in ["not a cursor", keyset_token("Contoso.App"), keyset_token(1, 2), encode_token({"before": [1]})]:
+        response = client.get("/api/packages", query_string={"view": "summary", "cursor": cursor})
+        assert (response.status_code, response.text) == (400, "Invalid cursor")
+    response = client.get("/api/package/Contoso.App/versions", query_string={"cursor": keyset_token("1", "2")})
+    assert response.status_code == 400
+
+
+def test_sparse_fieldsets(flask_app, client):
+    with flask_app.app_context():
+        add_package("Contoso.App", ["1.0", "2.0"])
+
+    response = client.get("/api/package/Contoso.App?fields=identifier,versions.version_code")
+    assert response.get_json() == {
+        "identifier": "Contoso.App",
+        "versions": [{"version_code": "2.0"}, {"version_code": "1.0"}],
+    }
+    response = client.get("/api/package/Contoso.App?fields=identifier,versions")
+    assert response.get_json() == {"identifier": "Contoso.App", "versions": [2, 1]}
+
+    for query_string in ["fields=bogus", "fields=versions.bogus", "fields=name.id", "expand=name", "expand=bogus"]:
+        response = client.get(f"/api/package/Contoso.App?{query_string}")
+        assert response.status_code == 400
+        assert response.text.startswith("Unknown field: ")
+
+
+def test_stats(flask_app, client):
+    today = datetime.now(timezone.utc).date()
+
+    def stat(day, architecture, clients):
+        sketch = HyperLogLog()
+        for address in clients:
+            sketch.add(address)
+        return DownloadStat(
+            identifier="Contoso.App",
+            version_code="1.0",
+            architecture=architecture,
+            scope="machine",
+            day=day,
+            downloads=len(clients),
+            clients=sketch.to_bytes(),
+        )
+
+    with flask_app.app_context():
+        db.session.add_all([
+            stat(today, "x64", ["10.0.0.1", "10.0.0.2"]),
+            stat(today - timedelta(days=1), "arm64", ["10.0.0.2", "10.0.0.3"]),
+            # Just outside the default 30 days
+            stat(today - timedelta(days=30), "x64", ["10.0.0.4"]),
+        ])
+        db.session.commit()
+
+    stats = client.get("/api/stats").get_json()
+    assert (stats["since"], stats["until"]) == ((today - timedelta(days=29)).isoformat(), today.isoformat())
+    # Clients downloading on several days and installers are counted once
+    assert (stats["downloads"], stats["unique_clients"]) == (4, 3)
+    assert [row["architecture"] for row in stats["stats"]] == ["arm64", "x64"]
+
+    stats = client.get("/api/stats?architecture=x64&since=2000-01-01").get_json()
+    assert (stats["downloads"], stats["unique_clients"]) == (3, 3)
+    stats = client.get(f"/api/stats?until={today - timedelta(days=1)}&identifier=Contoso.App").get_json()
+    assert stats["since"] == (today - timedelta(days=30)).isoformat()
+    assert (stats["downloads"], len(stats["stats"])) == (3, 2)
+    assert client.get("/api/stats?version=2.0").get_json()["stats"] == []
+
+    for query in ["since=yesterday", "until=2026-02-30"]:
+        response = client.get(f"/api/stats?{query}")
+        assert (response.status_code, response.get_data(as_text=True)) == (400, "Invalid date")
+
+
+@pytest.fixture()
+def downloads(flask_app, tmp_path, monkeypatch):
+    """Installers of Contoso.App stored below ``tmp_path``, returns the download counter."""
+    monkeypatch.setattr(api_routes, "basedir", str(tmp_path))
+    counter = flask_app.extensions["download_counter"] = DownloadCounter(flask_app, interval=3600)
+    package = Package(identifier="Contoso.App", name="App", publisher="Contoso")
+    for version_code, architectures in [("1.0", ["x64", "arm64"]), ("2.0", ["x64"])]:
+        version = PackageVersion(version_code=version_code, identifier=package.identifier)
+        for architecture in architectures:
+            version.installers.append(
+                Installer(
+                    architecture=architecture,
+                    installer_type="exe",
+                    file_name="setup.exe",
+                    installer_sha256="00",
+                    scope="machine",
+                )
+            )
+            directory = tmp_path / "packages" / "Contoso" / "Contoso.App" / version_code / architecture
+            directory.mkdir(parents=True)
+            (directory / "setup.exe").write_bytes(f"{version_code}-{architecture}".encode() * 100)
+        package.versions.append(version)
+    web = Package(identifier="Contoso.Web", name="Web", publisher="Contoso")
+    version = PackageVersion(version_code="1.0", identifier=web.identifier)
+    version.installers.append(
+        Installer(
+            architecture="x64",
+            installer_type="exe",
+            file_name="web.exe",
+            installer_sha256="00",
+            scope="machine",
+            external_url="https://cdn.example/web.exe",
+        )
+    )
+    web.versions.append(version)
+    db.session.add_all([package, web])
+    db.session.commit()
+    yield counter
+    counter.stop()
+
+
+def test_download_routes(flask_app, client, downloads):
+    response = client.get("/api/download/Contoso.App/1.0/arm64/machine")
+    assert (response.status_code, response.data) == (200, b"1.0-arm64" * 100)
+    assert response.headers["Content-Disposition"] == "attachment; filename=setup.exe"
+    assert client.get("/api/download/Contoso.App/latest/x64/machine").data == b"2.0-x64" * 100
+    # The newest version with an installer for the architecture
+    assert client.get("/api/download/Contoso.App/latest/arm64/machine").data == b"1.0-arm64" * 100
+
+    for url, message in [
+        ("/api/download/Contoso.Missing/1.0/x64/machine", "Package not found"),
+        ("/api/download/Contoso.App/3.0/x64/machine", "Package version not found"),
+        ("/api/download/Contoso.App/2.0/arm64/machine", "Installer not found"),
+        ("/api/download/Contoso.Missing/latest/x64/machine", "Installer not found"),
+        ("/api/download/Contoso.App/latest/x86/machine", "Installer not found"),
+    ]:
+        response = client.get(url)
+        assert (response.status_code, response.get_data(as_text=True)) == (404, message)
+
+    url = "/api/download/Contoso.App/2.0/x64/machine"
+    response = client.get(url, headers={"Range": "bytes=0-1"})
+    assert (response.status_code, response.data) == (206, b"2.")
+    # The rest of the file isn't another download
+    response = client.get(url, headers={"Range": "bytes=2-5"})
+    assert (response.status_code, response.data) == (206, b"0-x6")
+    response = client.get("/api/download/Contoso.Web/1.0/x64/machine")
+    assert (response.status_code, response.location) == (302, "https://cdn.example/web.exe")
+
+    downloads.flush()
+    counts = {package.identifier: package.download_count for package in Package.query}
+    assert counts == {"Contoso.App": 4, "Contoso.Web": 1}
+    stats = {
+        (stat.version_code, stat.architecture): stat.downloads
+        for stat in DownloadStat.query.filter_by(identifier="Contoso.App")
+    }
+    assert stats == {("1.0", "arm64"): 2, ("2.0", "x64"): 2}
+
+
+def test_download_offload(flask_app, client, downloads, tmp_path):
+    url = "/api/download/Contoso.App/1.0/arm64/machine"
+    flask_app.config["DOWNLOAD_OFFLOAD"] = "X-Accel-Redirect"
+    response = client.get(url)
+    assert (response.status_code, response.data) == (200, b"")
+    assert response.headers["X-Accel-Redirect"] == "/protected/packages/Contoso/Contoso.App/1.0/arm64/setup.exe"
+    assert response.headers["Content-Disposition"] == "attachment; filename=setup.exe"
+
+    flask_app.config["DOWNLOAD_OFFLOAD_PREFIX"] = "/internal"
+    response = client.get("/api/download/Contoso.App/latest/x64/machine")
+    assert response.headers["X-Accel-Redirect"] == "/internal/Contoso/Contoso.App/2.0/x64/setup.exe"
+
+    flask_app.config["DOWNLOAD_OFFLOAD"] = "x-sendfile"
+    response = client.get(url)
+    assert response.data == b""
+    assert response.headers["X-Sendfile"] == str(
+        tmp_path / "packages" / "Contoso" / "Contoso.App" / "1.0" / "arm64" / "setup.exe"
+    )
+    assert "X-Accel-Redirect" not in response.headers
+
+    # A file missing from storage isn't handed to the proxy
+    (tmp_path / "packages" / "Contoso" / "Contoso.App" / "1.0" / "arm64" / "setup.exe").unlink()
+    assert client.get(url).status_code == 404
+
+    flask_app.config["DOWNLOAD_OFFLOAD"] = ""
+    response = client.get("/api/download/Contoso.App/2.0/x64/machine")
+    assert (response.data, "X-Sendfile" in response.headers) == (b"2.0-x64" * 100, False)
+
+
+def test_unknown_download_offload_fails_at_startup(flask_app):
+    flask_app.config["DOWNLOAD_OFFLOAD"] = "X-Accel-Redirect"
+    init_download_offload(flask_app)
+    flask_app.config["DOWNLOAD_OFFLOAD"] = "sendfile"
+    with pytest.raises(ValueError, match="Unknown DOWNLOAD_OFFLOAD 'sendfile'"):
+        init_download_offload(flask_app)
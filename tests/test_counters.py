@@ -0,0 +1,82 @@
+from datetime import date
+
+import pytest
+
+from app import db
+from app.counters import DownloadCounter, StatKey
+from app.models import DownloadStat, Package
+
+
+@pytest.fixture()
+def package_id(flask_app):
+    package = Package(identifier="Contoso.App", name="App", publisher="Contoso", download_count=0)
+    db.session.add(package)
+    db.session.commit()
+    return package.id
+
+
+def test_flush_adds_pending_counts(flask_app, package_id):
+    db.session.execute(db.update(Package).values(download_count=2))
+    db.session.commit()
+
+    stat = StatKey("Contoso.App", "1.0", "x64", "machine", date(2026, 1, 1))
+    counter = DownloadCounter(flask_app, interval=3600)
+    for client in ["10.0.0.1", "10.0.0.2", "10.0.0.1"]:
+        counter.increment(package_id, stat, client)
+    counter.flush()
+    counter.increment(package_id, stat, "10.0.0.3")
+    counter.stop()
+
+    with flask_app.app_context():
+        assert Package.query.one().download_count == 6
+        assert DownloadStat.query.one().to_dict() == {
+            "identifier": "Contoso.App",
+            "version_code": "1.0",
+            "architecture": "x64",
+            "scope": "machine",
+            "day": "2026-01-01",
+            "downloads": 4,
+            "unique_clients": 3,
+        }
+
+
+def test_flush_merges_into_a_row_another_worker_inserted(flask_app, package_id):
+    # Both workers count the first downloads of the day, neither has written them yet
+    stat = StatKey("Contoso.App", "1.0", "x64", "machine", date(2026, 1, 1))
+    first, second = DownloadCounter(flask_app, interval=3600), DownloadCounter(flask_app, interval=3600)
+    first.increment(package_id, stat, "10.0.0.1")
+    second.increment(package_id, stat, "10.0.0.2")
+    second.increment(package_id, stat, "10.0.0.2")
+    first.flush()
+    second.flush()
+
+    with flask_app.app_context():
+        assert Package.query.one().download_count == 3
+        row = DownloadStat.query.one().to_dict()
+        assert (row["downloads"], row["unique_clients"]) == (3, 2)
+        assert not second._pending and not second._stats
+
+
+def test_failed_flushes_are_retried_then_dropped(flask_app, package_id, caplog):
+    # Every write fails until the table is back
+    db.session.execute(db.text("ALTER TABLE download_stat RENAME TO download_stat_away"))
+    db.session.commit()
+
+    stat = StatKey("Contoso.App", "1.0", "x64", "machine", date(2026, 1, 1))
+    counter = DownloadCounter(flask_app, interval=3600, attempts=2)
+    counter.increment(package_id, stat, "10.0.0.1")
+    counter.flush()
+    assert counter._pending == {package_id: 1}
+
+    counter.increment(package_id, stat, "10.0.0.2")
+    counter.flush()
+    assert not counter._pending and not counter._stats
+    assert "Dropped 2 downloads of 1 packages and 2 downloads of 1 installer statistics" in caplog.text
+
+    db.session.execute(db.text("ALTER TABLE download_stat_away RENAME TO download_stat"))
+    db.session.commit()
+    counter.increment(package_id, stat, "10.0.0.3")
+    counter.stop()
+    with flask_app.app_context():
+        assert Package.query.one().download_count == 1
+        assert DownloadStat.query.one().downloads == 1
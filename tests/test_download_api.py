@@ -0,0 +1,216 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from flask import Flask
+
+from app import db, download_api, fastapi_app
+from app.counters import init_download_counter
+from app.download_api import file_response
+from app.downloads import ResolvedInstaller
+from app.http_cache import byte_ranges, if_range_matches
+from app.models import DownloadStat, Installer, Package, PackageVersion, Setting
+
+SHA256 = "AB" * 32
+
+
+def test_byte_ranges():
+    assert byte_ranges(None, 100) is None
+    assert byte_ranges("items=0-1", 100) is None
+    assert byte_ranges("bytes=5-2", 100) is None
+    assert byte_ranges("bytes=0-1, 98-, -5", 100) is None  # overlapping
+    assert byte_ranges("bytes=0-1, 50-200", 100) == [(0, 2), (50, 100)]
+    assert byte_ranges("bytes=-5", 100) == [(95, 100)]
+    assert byte_ranges("bytes=100-", 100) == []
+
+
+def test_if_range_matches():
+    modified = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    assert if_range_matches(None, '"a"', modified)
+    assert if_range_matches('"a"', '"a"', modified)
+    assert not if_range_matches('W/"a"', '"a"', modified)
+    assert not if_range_matches('"b"', '"a"', modified)
+    assert if_range_matches("Thu, 01 Jan 2026 00:00:00 GMT", '"a"', modified)
+    assert not if_range_matches("Fri, 02 Jan 2026 00:00:00 GMT", '"a"', modified)
+
+
+def make_client(path):
+    installer = ResolvedInstaller(
+        1, "Contoso.App", "App", "Contoso", "1.0", "x64", "machine", "setup.exe", None, SHA256
+    )
+    api = FastAPI()
+
+    @api.get("/file")
+    async def send(request: Request):
+        return file_response(request, str(path), path.stat().st_size, 0, installer)
+
+    return TestClient(api)
+
+
+def test_file_response_ranges(tmp_path):
+    path = tmp_path / "setup.exe"
+    data = bytes(range(256)) * 4
+    path.write_bytes(data)
+    client = make_client(path)
+
+    response = client.get("/file")
+    assert response.status_code == 200
+    assert response.content == data
+    assert response.headers["etag"] == f'"{SHA256.lower()}"'
+
+    response = client.get("/file", headers={"Range": "bytes=-4", "If-Range": f'"{SHA256.lower()}"'})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 1020-1023/1024"
+    assert response.content == data[-4:]
+
+    response = client.get("/file", headers={"Range": "bytes=0-1", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == data
+
+    response = client.get("/file", headers={"Range": "bytes=0-1,10-11"})
+    boundary = response.headers["content-type"].split("boundary=")[1]
+    assert response.status_code == 206
+    assert response.content == (
+        f"--{boundary}\r\nContent-Type: application/octet-stream\r\n"
+        f"Content-Range: bytes 0-1/1024\r\n\r\n".encode() + data[0:2]
+        + f"\r\n--{boundary}\r\nContent-Type: application/octet-stream\r\n"
+        f"Content-Range: bytes 10-11/1024\r\n\r\n".encode() + data[10:12]
+        + f"\r\n--{boundary}--\r\n".encode()
+    )
+    assert int(response.headers["content-length"]) == len(response.content)
+
+    response = client.get("/file", headers={"Range": "bytes=2000-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */1024"
+
+
+@pytest.fixture()
+def routes(tmp_path, monkeypatch):
+    """The real ASGI app on a SQLite database, installers stored below ``tmp_path``."""
+    flask_app = Flask(__name__)
+    flask_app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'wingetty.db'}"
+    # Changed settings apply right away
+    flask_app.config["CACHE_CHECK_INTERVAL"] = 0
+    flask_app.config["DOWNLOAD_COUNT_FLUSH_INTERVAL"] = 3600
+    db.init_app(flask_app)
+    init_download_counter(flask_app)
+    with flask_app.app_context():
+        db.create_all()
+        db.session.add(Setting(key="use_s3", name="Use S3", type="boolean", value="false"))
+        db.session.add(Setting(key="bucket_name", name="S3 bucket", type="string", value="installers"))
+        package = Package(identifier="Contoso.App", name="App", publisher="Contoso")
+        for version_code in ["1.0", "2.0"]:
+            version = PackageVersion(version_code=version_code, identifier=package.identifier)
+            version.installers.append(
+                Installer(
+                    architecture="x64",
+                    installer_type="exe",
+                    file_name="setup.exe",
+                    installer_sha256=SHA256,
+                    scope="machine",
+                )
+            )
+            package.versions.append(version)
+            directory = tmp_path / "packages" / "Contoso" / "Contoso.App" / version_code / "x64"
+            directory.mkdir(parents=True)
+            (directory / "setup.exe").write_bytes(version_code.encode() * 1000)
+        web = Package(identifier="Contoso.Web", name="Web", publisher="Contoso")
+        version = PackageVersion(version_code="1.0", identifier=web.identifier)
+        version.installers.append(
+            Installer(
+                architecture="x64",
+                installer_type="exe",
+                file_name="web.exe",
+                installer_sha256=SHA256,
+                scope="machine",
+                external_url="https://cdn.example/web.exe",
+            )
+        )
+        web.versions.append(version)
+        db.session.add_all([package, web])
+        db.session.commit()
+
+    monkeypatch.setattr(fastapi_app, "create_app", lambda: flask_app)
+    monkeypatch.setattr(download_api, "basedir", str(tmp_path))
+    monkeypatch.setattr(
+        download_api,
+        "s3_client",
+        SimpleNamespace(
+            generate_presigned_url=lambda method, Params, ExpiresIn: (
+                f"https://s3.example/{Params['Bucket']}/{Params['Key']}"
+            )
+        ),
+    )
+    yield flask_app
+    with flask_app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def download_counts(flask_app):
+    with flask_app.app_context():
+        return {package.identifier: package.download_count for package in Package.query}
+
+
+def test_routes_stream_and_count(routes):
+    url = "/api/download/Contoso.App/1.0/x64/machine"
+    etag = f'"{SHA256.lower()}"'
+    with TestClient(fastapi_app.app) as client:
+        response = client.get(url, headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.content == b"1.0" * 1000
+        assert "content-encoding" not in response.headers
+
+        response = client.head(url)
+        assert (response.status_code, response.content) == (200, b"")
+        assert response.headers["content-length"] == "3000"
+
+        assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+        response = client.get(url, headers={"Range": "bytes=0-1"})
+        assert (response.status_code, response.content) == (206, b"1.")
+        response = client.get(url, headers={"Range": "bytes=2-5"})
+        assert (response.status_code, response.content) == (206, b"01.0")
+
+        response = client.get("/api/download/Contoso.App/latest/x64/machine")
+        assert response.content == b"2.0" * 1000
+
+        response = client.get("/api/download/Contoso.App/3.0/x64/machine")
+        assert (response.status_code, response.json()) == (404, {"detail": "Package version not found"})
+
+        routes.config["DOWNLOAD_OFFLOAD"] = "x-accel-redirect"
+        response = client.get(url)
+        assert response.headers["x-accel-redirect"] == "/protected/packages/Contoso/Contoso.App/1.0/x64/setup.exe"
+        assert response.content == b""
+        del routes.config["DOWNLOAD_OFFLOAD"]
+
+        response = client.get("/api/download/Contoso.Web/1.0/x64/machine", follow_redirects=False)
+        assert (response.status_code, response.headers["location"]) == (302, "https://cdn.example/web.exe")
+
+        with routes.app_context():
+            db.session.get(Setting, "use_s3").set_value(True)
+            db.session.commit()
+        response = client.get(url, follow_redirects=False)
+        assert (response.status_code, response.headers["location"]) == (
+            302,
+            "https://s3.example/installers/packages/Contoso/Contoso.App/1.0/x64/setup.exe",
+        )
+
+    # Written when the app shut down: not the HEAD, the 304 or the later range
+    assert download_counts(routes) == {"Contoso.App": 5, "Contoso.Web": 1}
+    with routes.app_context():
+        stat = DownloadStat.query.filter_by(identifier="Contoso.App", version_code="1.0").one()
+        assert (stat.downloads, stat.to_dict()["unique_clients"]) == (4, 1)
+
+
+def test_routes_reject_untrusted_hosts(routes, monkeypatch):
+    routes.config["TRUSTED_HOSTS"] = ["wg.example"]
+    # Set from the config on startup, gone again after the test
+    monkeypatch.setattr(fastapi_app.app.state, "trusted_hosts", None, raising=False)
+    url = "/api/download/Contoso.App/1.0/x64/machine"
+    with TestClient(fastapi_app.app, base_url="http://wg.example") as client:
+        assert client.get(url).status_code == 200
+        response = client.get(url, headers={"Host": "evil.example"})
+        assert (response.status_code, response.text) == (400, "Invalid host header")
@@ -0,0 +1,116 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from wtforms import ValidationError
+
+from app import db
+from app.downloads import LATEST, DownloadNotFound, fetch_download, resolve_download
+from app.forms import NotReservedVersion
+from app.manifests import CATALOG_REVISION
+from app.models import Installer, Package, PackageVersion, RevisionCounter
+from app.revision_cache import revision_cache
+
+
+@pytest.fixture()
+def flask_app(flask_app):
+    package = Package(identifier="Contoso.App", name="App", publisher="Contoso")
+    for version_code, architectures in [("1.0", ["x64", "arm64"]), ("2.0", ["x64"])]:
+        version = PackageVersion(version_code=version_code, identifier=package.identifier)
+        for architecture in architectures:
+            version.installers.append(
+                Installer(
+                    architecture=architecture,
+                    installer_type="exe",
+                    file_name=f"{version_code}-{architecture}.exe",
+                    installer_sha256="00",
+                    scope="machine",
+                )
+            )
+        package.versions.append(version)
+    db.session.add(package)
+    db.session.commit()
+    return flask_app
+
+
+def test_not_found_messages(flask_app):
+    cases = [
+        (("Contoso.Missing", "1.0", "x64", "machine"), "Package not found"),
+        (("Contoso.App", "9.0", "x64", "machine"), "Package version not found"),
+        (("Contoso.App", "2.0", "arm64", "machine"), "Installer not found"),
+        (("Contoso.App", LATEST, "x86", "machine"), "Installer not found"),
+    ]
+    for args, message in cases:
+        with pytest.raises(DownloadNotFound) as error:
+            resolve_download(*args)
+        assert str(error.value) == message
+
+
+def test_latest_falls_back_to_older_versions(flask_app):
+    # 2.0 has no arm64 installer
+    installer = resolve_download("Contoso.App", LATEST, "arm64", "machine")
+    assert (installer.version_code, installer.file_name) == ("1.0", "1.0-arm64.exe")
+    assert resolve_download("Contoso.App", LATEST, "x64", "machine").version_code == "2.0"
+
+
+def test_latest_is_reserved():
+    field = SimpleNamespace(data="latest")
+    with pytest.raises(ValidationError):
+        NotReservedVersion()(None, field)
+    NotReservedVersion()(None, SimpleNamespace(data="latest.1"))
+
+
+def test_latest_is_cached_apart_from_its_version(flask_app, count_queries):
+    installer, queries = count_queries(resolve_download, "Contoso.App", LATEST, "x64", "machine")
+    assert (installer.version_code, installer.file_name, queries) == ("2.0", "2.0-x64.exe", 2)
+
+    installer, queries = count_queries(resolve_download, "Contoso.App", LATEST, "x64", "machine")
+    assert (installer.version_code, queries) == ("2.0", 0)
+
+    installer, queries = count_queries(resolve_download, "Contoso.App", "2.0", "x64", "machine")
+    assert (installer.version_code, queries) == ("2.0", 1)
+    assert set(revision_cache(CATALOG_REVISION, None).value) == {
+        ("Contoso.App", LATEST, "x64", "machine"),
+        ("Contoso.App", "2.0", "x64", "machine"),
+    }
+
+
+def test_catalog_changes_clear_the_cache(flask_app):
+    assert resolve_download("Contoso.App", "1.0", "x64", "machine").file_name == "1.0-x64.exe"
+
+    installer = Installer.query.filter_by(file_name="1.0-x64.exe").one()
+    installer.file_name = "renamed.exe"
+    db.session.commit()
+    assert resolve_download("Contoso.App", "1.0", "x64", "machine").file_name == "renamed.exe"
+
+    # Written by another worker, picked up on the next revision check
+    db.session.execute(db.update(Installer).values(file_name="other.exe").where(Installer.id == installer.id))
+    db.session.execute(
+        db.update(RevisionCounter)
+        .values(value=RevisionCounter.value + 1)
+        .where(RevisionCounter.name == CATALOG_REVISION)
+    )
+    db.session.commit()
+    assert resolve_download("Contoso.App", "1.0", "x64", "machine").file_name == "renamed.exe"
+    revision_cache(CATALOG_REVISION, None).checked_at -= 3600
+    assert resolve_download("Contoso.App", "1.0", "x64", "machine").file_name == "other.exe"
+
+
+def test_fetch_download_on_aiosqlite(flask_app):
+    async def fetch(*args):
+        engine = create_async_engine(str(db.engine.url).replace("sqlite:", "sqlite+aiosqlite:", 1))
+        try:
+            async with AsyncSession(engine) as session:
+                return await fetch_download(session, *args)
+        finally:
+            await engine.dispose()
+
+    installer = asyncio.run(fetch("Contoso.App", "1.0", "arm64", "machine"))
+    assert (installer.identifier, installer.publisher, installer.file_name) == (
+        "Contoso.App",
+        "Contoso",
+        "1.0-arm64.exe",
+    )
+    with pytest.raises(DownloadNotFound, match="Package version not found"):
+        asyncio.run(fetch("Contoso.App", "3.0", "x64", "machine"))
@@ -0,0 +1,78 @@
+import pytest
+from sqlalchemy import event, inspect, select
+
+from app import db
+from app.fieldsets import InvalidFieldset, load_options, parse_selection, serialize
+from app.models import Installer, InstallerSwitch, Package, PackageVersion
+
+
+def test_dotted_fields_expand_and_narrow():
+    selection = parse_selection(Package, "id,versions.installers.installer_sha256", "versions")
+
+    assert selection.fields == {"id", "versions"}
+    versions = selection.children["versions"]
+    assert versions.fields == {"installers"}
+    assert versions.children["installers"].fields == {"installer_sha256"}
+
+
+def test_invalid_fieldsets():
+    assert parse_selection(Package) is None
+    with pytest.raises(InvalidFieldset):
+        parse_selection(Package, "versions.bogus")
+    with pytest.raises(InvalidFieldset):
+        parse_selection(Package, expand="name")
+
+
+@pytest.fixture()
+def session(flask_app, download_route):
+    flask_app.config["PUBLIC_BASE_URL"] = "https://wingetty.example"
+    package = Package(identifier="Contoso.App", name="App", publisher="Contoso")
+    for version_code in ["1.0", "2.0"]:
+        version = PackageVersion(version_code=version_code, identifier=package.identifier)
+        installer = Installer(architecture="x64", installer_type="exe", installer_sha256="00", scope="machine")
+        installer.switches.append(InstallerSwitch(parameter="Silent", value="/S"))
+        version.installers.append(installer)
+        package.versions.append(version)
+    db.session.add(package)
+    db.session.commit()
+    db.session.expunge_all()
+    return db.session
+
+
+def load(session, fields=None, expand=None):
+    """Load the package for a selection, return the output, the statements and the package."""
+    selection = parse_selection(Package, fields, expand)
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = session.get_bind()
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        package = session.scalars(
+            select(Package).options(*load_options(Package, selection))
+        ).one()
+        loaded = len(statements)
+        output = serialize(package, selection)
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    # Serializing mustn't load anything lazily
+    assert len(statements) == loaded
+    return output, statements, package
+
+
+def test_load_options_load_only_the_selection(session):
+    output, statements, package = load(session, "id,name,versions")
+    assert output == {"id": 1, "name": "App", "versions": [2, 1]}
+    assert {"publisher", "moniker", "tags", "commands"} <= inspect(package).unloaded
+    assert "publisher" not in statements[0]
+    assert not any("installer" in statement for statement in statements)
+    assert inspect(package.versions[0]).unloaded >= {"version_code", "installers"}
+
+    output, statements, _ = load(session, "versions.version_code", "versions.installers.switches")
+    assert [version["version_code"] for version in output["versions"]] == ["2.0", "1.0"]
+    installer = output["versions"][0]["installers"][0]
+    assert installer["switches"][0]["parameter"] == "Silent"
+    assert installer["installer_url"] == "https://wingetty.example/api/download/Contoso.App/2.0/x64/machine"
+    assert not any("package_tag" in statement for statement in statements)
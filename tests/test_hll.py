@@ -0,0 +1,15 @@
+from app.hll import HyperLogLog
+
+
+def test_count_is_close_and_merges():
+    first, second = HyperLogLog(), HyperLogLog()
+    for i in range(20000):
+        first.add(f"10.0.{i}")
+        first.add(f"10.0.{i}")
+    for i in range(10000, 30000):
+        second.add(f"10.0.{i}")
+
+    assert abs(first.count() - 20000) < 20000 * 0.1
+    merged = HyperLogLog.from_bytes(first.to_bytes()).merge(second)
+    assert abs(merged.count() - 30000) < 30000 * 0.1
+    assert len(merged.to_bytes()) == 1024
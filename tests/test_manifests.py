@@ -0,0 +1,335 @@
+import asyncio
+import gzip
+import json
+
+import pytest
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app import db
+from app.async_db import get_revision
+from app.manifests import CATALOG_REVISION, fetch_manifest, get_manifest, manifest_etag
+from app.models import Installer, Package, PackageManifest, PackageVersion, RevisionCounter, Setting
+from app.search import search_packages
+from app.urls import reset_request_base_url, set_request_base_url
+
+
+@pytest.fixture()
+def flask_app(flask_app, download_route):
+    package = Package(identifier="Contoso.App", name="App", publisher="Contoso")
+    version = PackageVersion(version_code="1.0", identifier=package.identifier, package_locale="en-US")
+    version.installers.append(
+        Installer(architecture="x64", installer_type="exe", installer_sha256="00", scope="machine")
+    )
+    package.versions.append(version)
+    db.session.add(package)
+    db.session.commit()
+    return flask_app
+
+
+def serve(flask_app, host):
+    """Return the manifest served to ``host`` and how often the request committed."""
+    commits = []
+    with flask_app.test_request_context("/wg/packageManifests/Contoso.App", base_url=f"http://{host}"):
+        listener = lambda session: commits.append(session)
+        event.listen(db.session, "after_commit", listener)
+        try:
+            manifest = get_manifest("Contoso.App")
+        finally:
+            event.remove(db.session, "after_commit", listener)
+        db.session.remove()
+    return manifest, len(commits)
+
+
+def installer_urls(manifest):
+    return [
+        installer["InstallerUrl"]
+        for version in json.loads(manifest.body)["Data"]["Versions"]
+        for installer in version["Installers"]
+    ]
+
+
+def stored(flask_app):
+    with flask_app.app_context():
+        return db.session.get(PackageManifest, "Contoso.App")
+
+
+def test_stored_manifest_is_host_independent(flask_app):
+    manifest, commits = serve(flask_app, "evil.example")
+    assert installer_urls(manifest) == ["https://evil.example/api/download/Contoso.App/1.0/x64/machine"]
+    assert commits == 0
+    row = stored(flask_app)
+    assert "evil.example" not in row.body
+    assert (row.revision, row.base_url, row.body_gzip) == (manifest.revision, None, None)
+
+    manifest, _ = serve(flask_app, "wingetty.example")
+    assert installer_urls(manifest) == ["https://wingetty.example/api/download/Contoso.App/1.0/x64/machine"]
+    assert manifest.encoded == {}
+    assert stored(flask_app).date_built == row.date_built
+
+
+def test_compressed_variants_for_the_public_base_url(flask_app):
+    with flask_app.app_context():
+        # Large enough to be compressed
+        version = PackageVersion.query.one()
+        for architecture in ["x86", "arm", "arm64"]:
+            version.installers.append(
+                Installer(architecture=architecture, installer_type="exe", installer_sha256="00", scope="machine")
+            )
+        db.session.commit()
+    flask_app.config["PUBLIC_BASE_URL"] = "https://wingetty.example/"
+    manifest, _ = serve(flask_app, "evil.example")
+    assert installer_urls(manifest)[0] == "https://wingetty.example/api/download/Contoso.App/1.0/x64/machine"
+    assert gzip.decompress(manifest.encoded["gzip"]).decode() == manifest.body
+    assert stored(flask_app).base_url == "https://wingetty.example"
+
+    # Stored for another base URL, only the body is reused
+    del flask_app.config["PUBLIC_BASE_URL"]
+    manifest, _ = serve(flask_app, "mirror.example")
+    assert installer_urls(manifest)[0] == "https://mirror.example/api/download/Contoso.App/1.0/x64/machine"
+    assert manifest.encoded == {}
+
+
+def test_writes_invalidate_the_stored_manifest(flask_app):
+    first, _ = serve(flask_app, "wingetty.example")
+
+    with flask_app.app_context():
+        version = PackageVersion.query.one()
+        version.installers.append(
+            Installer(architecture="arm64", installer_type="exe", installer_sha256="00", scope="machine")
+        )
+        db.session.commit()
+    second, _ = serve(flask_app, "wingetty.example")
+    assert second.revision > first.revision
+    assert installer_urls(second) == [
+        "https://wingetty.example/api/download/Contoso.App/1.0/x64/machine",
+        "https://wingetty.example/api/download/Contoso.App/1.0/arm64/machine",
+    ]
+
+    with flask_app.app_context():
+        package = Package.query.one()
+        package.versions.append(PackageVersion(version_code="2.0", identifier=package.identifier))
+        db.session.commit()
+        version = PackageVersion.query.filter_by(version_code="2.0").one()
+        version.installers.append(
+            Installer(architecture="x64", installer_type="exe", installer_sha256="00", scope="machine")
+        )
+        db.session.commit()
+    third, _ = serve(flask_app, "wingetty.example")
+    assert third.revision > second.revision
+    assert stored(flask_app).revision == third.revision
+    assert "https://wingetty.example/api/download/Contoso.App/2.0/x64/machine" in installer_urls(third)
+
+
+def test_etag_differs_for_a_recreated_package(flask_app):
+    first, _ = serve(flask_app, "wingetty.example")
+    assert manifest_etag(first) != manifest_etag(serve(flask_app, "mirror.example")[0])
+
+    with flask_app.app_context():
+        db.session.delete(Package.query.one())
+        db.session.commit()
+        package = Package(identifier="Contoso.App", name="App", publisher="Contoso")
+        version = PackageVersion(version_code="1.0", identifier=package.identifier, package_locale="en-US")
+        version.installers.append(
+            Installer(architecture="arm64", installer_type="exe", installer_sha256="00", scope="machine")
+        )
+        package.versions.append(version)
+        db.session.add(package)
+        db.session.commit()
+    second, _ = serve(flask_app, "wingetty.example")
+    assert second.revision == first.revision
+    assert manifest_etag(second) != manifest_etag(first)
+
+
+def test_async_session_writes_bump_revisions(flask_app, download_route):
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        try:
+            async with engine.begin() as connection:
+                await connection.run_sync(db.metadata.create_all)
+            # A session per request, like get_session hands out
+            async with AsyncSession(engine) as session:
+                package = Package(identifier="Contoso.App", name="App", publisher="Contoso")
+                version = PackageVersion(version_code="1.0", identifier=package.identifier)
+                version.installers.append(
+                    Installer(architecture="x64", installer_type="exe", installer_sha256="00", scope="machine")
+                )
+                package.versions.append(version)
+                session.add(package)
+                await session.commit()
+            async with AsyncSession(engine) as session:
+                version_id = await session.scalar(select(PackageVersion.id))
+                row = (await session.execute(select(Package.revision, Package.latest_version_id))).one()
+                assert tuple(row) == (1, version_id)
+                first = await fetch_manifest(session, "Contoso.App")
+            async with AsyncSession(engine) as session:
+                session.add(
+                    Installer(
+                        version_id=version_id,
+                        architecture="arm64",
+                        installer_type="exe",
+                        installer_sha256="00",
+                        scope="machine",
+                    )
+                )
+                await session.commit()
+            async with AsyncSession(engine) as session:
+                second = await fetch_manifest(session, "Contoso.App")
+                page = await session.run_sync(
+                    search_packages, {"Query": {"KeyWord": "App", "MatchType": "Exact"}}
+                )
+                catalog = await get_revision(session, CATALOG_REVISION)
+            return first, second, page, catalog
+        finally:
+            await engine.dispose()
+
+    token = set_request_base_url("wingetty.example")
+    try:
+        first, second, page, catalog = asyncio.run(run())
+    finally:
+        reset_request_base_url(token)
+
+    assert (first.revision, second.revision, catalog) == (1, 2, 2)
+    assert installer_urls(second) == [
+        "https://wingetty.example/api/download/Contoso.App/1.0/x64/machine",
+        "https://wingetty.example/api/download/Contoso.App/1.0/arm64/machine",
+    ]
+    assert [result["PackageIdentifier"] for result in page.data] == ["Contoso.App"]
+
+
+def test_latest_version_follows_installers(flask_app):
+    def latest():
+        return db.session.scalar(
+            db.select(PackageVersion.version_code).join(
+                Package, Package.latest_version_id == PackageVersion.id
+            )
+        )
+
+    def installer(architecture="x64"):
+        return Installer(architecture=architecture, installer_type="exe", installer_sha256="00", scope="machine")
+
+    with flask_app.app_context():
+        package = Package.query.one()
+        package.versions.append(PackageVersion(version_code="2.0", identifier=package.identifier))
+        db.session.commit()
+        # 2.0 has no installer yet
+        assert latest() == "1.0"
+
+        version = PackageVersion.query.filter_by(version_code="2.0").one()
+        version.installers.append(installer())
+        db.session.commit()
+        assert latest() == "2.0"
+
+        package.versions.append(PackageVersion(version_code="10.0", identifier=package.identifier))
+        db.session.commit()
+        newest = PackageVersion.query.filter_by(version_code="10.0").one()
+        newest.installers.append(installer())
+        db.session.commit()
+        assert latest() == "10.0"
+
+        db.session.delete(newest)
+        db.session.commit()
+        assert latest() == "2.0"
+
+        db.session.delete(version.installers[0])
+        db.session.commit()
+        assert latest() == "1.0"
+
+        db.session.delete(PackageVersion.query.filter_by(version_code="1.0").one())
+        db.session.commit()
+        assert Package.query.one().latest_version_id is None
+
+
+def version_codes(manifest):
+    return [version["PackageVersion"] for version in json.loads(manifest.body)["Data"]["Versions"]]
+
+
+def test_version_channel_and_limit(flask_app):
+    def manifest(**filters):
+        with flask_app.test_request_context(base_url="http://wingetty.example"):
+            return get_manifest("Contoso.App", **filters)
+
+    with flask_app.app_context():
+        package = Package.query.one()
+        for version_code in ["2.0", "3.0"]:
+            version = PackageVersion(version_code=version_code, identifier=package.identifier)
+            version.installers.append(
+                Installer(architecture="x64", installer_type="exe", installer_sha256="00", scope="machine")
+            )
+            package.versions.append(version)
+        # No installer, never listed
+        package.versions.append(PackageVersion(version_code="4.0", identifier=package.identifier))
+        db.session.add(Setting(key="manifest_version_limit", name="Versions", type="integer", value="2"))
+        db.session.commit()
+
+    assert version_codes(manifest()) == ["2.0", "3.0"]
+    # The limit only applies to whole manifests
+    assert version_codes(manifest(version="1.0")) == ["1.0"]
+    assert manifest(version="4.0") is None
+    assert manifest(version="9.0") is None
+    assert manifest(channel="beta") is None
+    assert version_codes(manifest(market="US")) == ["2.0", "3.0"]
+
+    with flask_app.app_context():
+        db.session.get(Setting, "manifest_version_limit").set_value(0)
+        db.session.commit()
+    assert version_codes(manifest()) == ["1.0", "2.0", "3.0"]
+
+
+def test_first_bump_races_another_worker(flask_app):
+    db.session.execute(db.delete(RevisionCounter))
+    db.session.commit()
+    raced = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        # The UPDATE found no row, another worker creates it right after
+        if statement.startswith("INSERT INTO revision_counter") and not raced:
+            raced.append(statement)
+            cursor.connection.execute("INSERT INTO revision_counter (name, value) VALUES ('catalog', 5)")
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        Package.query.one().name = "Renamed"
+        db.session.commit()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+    assert raced
+    assert Package.query.one().name == "Renamed"
+    assert RevisionCounter.get(CATALOG_REVISION) == 6
+
+
+def test_stored_manifest_follows_the_version_limit(flask_app):
+    def manifest():
+        with flask_app.test_request_context(base_url="http://wingetty.example"):
+            return get_manifest("Contoso.App")
+
+    def revision():
+        return db.session.scalar(db.select(Package.revision))
+
+    package = Package.query.one()
+    version = PackageVersion(version_code="2.0", identifier=package.identifier)
+    version.installers.append(
+        Installer(architecture="x64", installer_type="exe", installer_sha256="00", scope="machine")
+    )
+    package.versions.append(version)
+    db.session.commit()
+    assert version_codes(manifest()) == ["1.0", "2.0"]
+
+    # Created rather than changed
+    first = revision()
+    db.session.add(Setting(key="manifest_version_limit", name="Versions", type="integer", value="1"))
+    db.session.commit()
+    assert revision() > first
+    assert version_codes(manifest()) == ["2.0"]
+
+    flask_app.config["MANIFEST_VERSION_LIMIT"] = 0
+    assert version_codes(manifest()) == ["1.0", "2.0"]
+    del flask_app.config["MANIFEST_VERSION_LIMIT"]
+    assert version_codes(manifest()) == ["2.0"]
+    assert stored(flask_app).version_limit == 1
+
+    second = revision()
+    db.session.delete(db.session.get(Setting, "manifest_version_limit"))
+    db.session.commit()
+    assert revision() > second
+    assert version_codes(manifest()) == ["1.0", "2.0"]
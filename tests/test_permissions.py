@@ -0,0 +1,43 @@
+import pytest
+
+from app import db
+from app.models import Permission, RevisionCounter, Role, User
+from app.permissions import ROLES_REVISION, load_user, role_permissions
+
+
+@pytest.fixture()
+def flask_app(flask_app):
+    role = Role(name="editor", permissions=[Permission(name="view:package")])
+    db.session.add_all([role, Permission(name="edit:package")])
+    db.session.add(User(username="editor", email="editor@example.com", role=role))
+    db.session.commit()
+    return flask_app
+
+
+def test_permission_changes_invalidate_the_cache(flask_app):
+    role = Role.query.one()
+    cached = role_permissions(role.id)
+    assert cached == frozenset({"view:package"})
+    assert role_permissions(role.id) is cached
+
+    revision = RevisionCounter.get(ROLES_REVISION)
+    role.permissions.append(Permission.query.filter_by(name="edit:package").one())
+    db.session.commit()
+    assert RevisionCounter.get(ROLES_REVISION) == revision + 1
+    assert role_permissions(role.id) == frozenset({"view:package", "edit:package"})
+
+    role.permissions = []
+    db.session.commit()
+    assert not role.has_permission("view:package")
+
+
+def test_load_user_takes_one_query(flask_app, count_queries):
+    role_permissions(Role.query.one().id)
+    db.session.expunge_all()
+
+    def check(user_id):
+        user = load_user(user_id)
+        return user.role.has_permission("view:package")
+
+    allowed, queries = count_queries(check, "1")
+    assert (allowed, queries) == (True, 1)
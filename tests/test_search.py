@@ -0,0 +1,212 @@
+import warnings
+
+import pytest
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+
+from app import db
+from app.fulltext import include_object
+from app.models import Installer, Package, PackageCommand, PackageTag, PackageVersion
+from app.continuation import InvalidContinuationToken
+from app.search import package_statement, search_packages
+
+
+def add_packages(session, count, start=0):
+    for i in range(start, start + count):
+        package = Package(identifier=f"Contoso.App{i}", name=f"App {i}", publisher="Contoso")
+        for version_code in ["1.0.0", "2.0.0"]:
+            version = PackageVersion(version_code=version_code, identifier=package.identifier)
+            version.installers.append(
+                Installer(architecture="x64", installer_type="exe", installer_sha256="00", scope="machine")
+            )
+            package.versions.append(version)
+        # A version without installers is never returned by a search
+        package.versions.append(PackageVersion(version_code="3.0.0", identifier=package.identifier))
+        session.add(package)
+    session.commit()
+
+
+def search(count_queries, session, request_data):
+    """Return the results of a search and the number of queries it ran."""
+    page, queries = count_queries(search_packages, session, request_data, maximum_results=100)
+    return page.data, queries
+
+
+def test_search_output(session, count_queries):
+    add_packages(session, 1)
+    session.add(Package(identifier="Contoso.Empty", name="Empty", publisher="Contoso"))
+    session.commit()
+
+    results, _ = search(count_queries, session, {})
+
+    assert results == [
+        {
+            "PackageIdentifier": "Contoso.App0",
+            "PackageName": "App 0",
+            "Publisher": "Contoso",
+            "Versions": [{"PackageVersion": "1.0.0"}, {"PackageVersion": "2.0.0"}],
+        }
+    ]
+
+
+def test_search_query_count_is_constant(session, count_queries):
+    add_packages(session, 1)
+    session.expunge_all()
+    small_results, small_queries = search(count_queries, session, {})
+
+    add_packages(session, 25, start=1)
+    session.expunge_all()
+    large_results, large_queries = search(count_queries, session, {})
+
+    assert len(small_results) == 1
+    assert len(large_results) == 26
+    assert small_queries == large_queries == 2
+
+
+def test_maximum_results_skips_packages_without_installers(session):
+    session.add(Package(identifier="Contoso.Aaa", name="Unpublished", publisher="Contoso"))
+    add_packages(session, 3)
+
+    results = search_packages(session, {}, maximum_results=2).data
+
+    assert [result["PackageIdentifier"] for result in results] == ["Contoso.App0", "Contoso.App1"]
+
+
+def test_substring_filter_uses_text_index(session, count_queries):
+    add_packages(session, 12)
+    request_data = {
+        "Filters": [
+            {
+                "PackageMatchField": "PackageIdentifier",
+                "RequestMatch": {"KeyWord": "contoso.app1", "MatchType": "Substring"},
+            }
+        ]
+    }
+
+    results, _ = search(count_queries, session, request_data)
+    statement = str(package_statement(request_data, 50).compile(session.get_bind()))
+
+    assert [r["PackageIdentifier"] for r in results] == ["Contoso.App1", "Contoso.App10", "Contoso.App11"]
+    assert "package_fts MATCH" in statement
+
+
+def identifiers(session, request_data):
+    return [r["PackageIdentifier"] for r in search_packages(session, request_data).data]
+
+
+def test_match_types(session):
+    add_packages(session, 12)
+
+    def query(keyword, match_type):
+        return identifiers(session, {"Query": {"KeyWord": keyword, "MatchType": match_type}})
+
+    assert query("Contoso.App1", "Exact") == ["Contoso.App1"]
+    assert query("contoso.app1", "Exact") == []
+    assert query("APP 1", "CaseInsensitive") == ["Contoso.App1"]
+    assert query("contoso.app1", "StartsWith") == ["Contoso.App1", "Contoso.App10", "Contoso.App11"]
+    assert query("app 1", "Substring") == ["Contoso.App1", "Contoso.App10", "Contoso.App11"]
+    assert query("contoso.app?", "Wildcard") == [f"Contoso.App{i}" for i in range(10)]
+
+
+def test_filters_narrow_and_inclusions_widen(session):
+    add_packages(session, 12)
+
+    def match(field, keyword, match_type="Exact"):
+        return {"PackageMatchField": field, "RequestMatch": {"KeyWord": keyword, "MatchType": match_type}}
+
+    assert identifiers(
+        session,
+        {
+            "Query": {"KeyWord": "App 1", "MatchType": "Exact"},
+            "Inclusions": [match("PackageIdentifier", "Contoso.App2")],
+        },
+    ) == ["Contoso.App1", "Contoso.App2"]
+    assert identifiers(
+        session,
+        {
+            "Query": {"KeyWord": "contoso.app1", "MatchType": "StartsWith"},
+            "Filters": [match("PackageName", "App 10")],
+        },
+    ) == ["Contoso.App10"]
+    assert identifiers(session, {"Filters": [match("ProductCode", "App 1")]}) == []
+
+
+def test_match_fields(session):
+    add_packages(session, 3)
+    package = Package.query.filter_by(identifier="Contoso.App1").one()
+    package.moniker = "contoso-app"
+    package.tags = [PackageTag(tag="utility")]
+    package.commands = [PackageCommand(command="capp")]
+    package.versions[0].installers[0].product_code = "{1E3D7C2A-5B6F-4D8E-9A0B-C1D2E3F4A5B6}"
+    session.commit()
+
+    def match(field, keyword, match_type="Exact"):
+        return {"PackageMatchField": field, "RequestMatch": {"KeyWord": keyword, "MatchType": match_type}}
+
+    product_code = "{1e3d7c2a-5b6f-4d8e-9a0b-c1d2e3f4a5b6}"
+    assert identifiers(session, {"Inclusions": [match("ProductCode", product_code, "CaseInsensitive")]}) == ["Contoso.App1"]
+    assert identifiers(session, {"Filters": [match("Moniker", "contoso-app")]}) == ["Contoso.App1"]
+    assert identifiers(session, {"Query": {"KeyWord": "utility", "MatchType": "Exact"}}) == ["Contoso.App1"]
+    assert identifiers(session, {"Query": {"KeyWord": "cap", "MatchType": "StartsWith"}}) == ["Contoso.App1"]
+    assert identifiers(session, {"Inclusions": [match("PackageFamilyName", "Contoso.App1")]}) == []
+    # A filter on a field we don't store is skipped, not one that matches nothing
+    request_data = {"Filters": [match("Market", "US"), match("Moniker", "contoso-app")]}
+    assert identifiers(session, request_data) == ["Contoso.App1"]
+    assert len(identifiers(session, {"Filters": [match("Market", "US")]})) == 3
+    assert identifiers(session, {"Inclusions": [match("Market", "US")]}) == []
+
+
+def test_continuation_token_pages_through_results(session):
+    add_packages(session, 7)
+
+    seen = []
+    token = None
+    while True:
+        page = search_packages(session, {}, maximum_results=6, continuation_token=token, page_size=4)
+        seen.extend(result["PackageIdentifier"] for result in page.data)
+        token = page.continuation_token
+        if token is None:
+            break
+
+    assert seen == [f"Contoso.App{i}" for i in range(6)]
+    with pytest.raises(InvalidContinuationToken):
+        search_packages(session, {}, continuation_token="not a token")
+
+
+def test_unknown_match_types_match_nothing(session):
+    add_packages(session, 3)
+    filter_entry = {"PackageMatchField": "PackageName", "RequestMatch": {"KeyWord": "App 1", "MatchType": "Regex"}}
+
+    assert identifiers(session, {"Query": {"KeyWord": "App 1", "MatchType": "Regex"}}) == []
+    assert identifiers(session, {"Query": {"KeyWord": "App 1"}}) == []
+    assert identifiers(session, {"Filters": [filter_entry]}) == []
+    assert identifiers(
+        session, {"Query": {"KeyWord": "App 1", "MatchType": "Exact"}, "Inclusions": [filter_entry]}
+    ) == ["Contoso.App1"]
+
+
+def test_case_folding_matches_the_database(session):
+    add_packages(session, 1)
+    package = Package.query.one()
+    package.name = "Äpfel Manager"
+    session.commit()
+
+    def query(keyword, match_type):
+        return identifiers(session, {"Query": {"KeyWord": keyword, "MatchType": match_type}})
+
+    assert query("ÄPFEL MANAGER", "CaseInsensitive") == ["Contoso.App0"]
+    assert query("Äpfel", "StartsWith") == ["Contoso.App0"]
+    assert query("ÄPF", "StartsWith") == ["Contoso.App0"]
+    # SQLite's lower() leaves non-ASCII letters alone
+    assert query("äpfel", "StartsWith") == []
+
+
+def test_autogenerate_leaves_the_search_index_alone(session):
+    def changes(**opts):
+        with db.engine.connect() as connection, warnings.catch_warnings():
+            # Expression indexes can't be reflected on SQLite
+            warnings.simplefilter("ignore")
+            return compare_metadata(MigrationContext.configure(connection, opts=opts), db.metadata)
+
+    assert {change[1].name for change in changes()} >= {"package_fts", "package_fts_data"}
+    assert changes(include_object=include_object) == []
@@ -0,0 +1,80 @@
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import date, datetime, timezone
+
+import pytest
+from flask import Flask, jsonify
+from flask.json.provider import DefaultJSONProvider
+from markupsafe import Markup
+
+from app.serialization import FastJSONProvider, FastJSONResponse
+
+
+@dataclasses.dataclass
+class Point:
+    x: int
+    y: int
+
+
+VALUES = [
+    {"b": 1, "a": [1.5, None, True], "c": {"z": "", "y": {}}},
+    {"created": datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc), "day": date(2026, 1, 2)},
+    {"price": decimal.Decimal("1.10"), "id": uuid.UUID("12345678-1234-5678-1234-567812345678")},
+    # Sorted by value, 9 before 10
+    {10: "ten", 9: "nine", 1.5: "float"},
+    {True: "yes", False: "no"},
+    {"html": Markup("<b>bold</b>"), "point": Point(1, 2)},
+    [],
+]
+
+
+def responses(value, debug=False, compact=None):
+    """Return the bodies of ``jsonify(value)`` with Flask's default and our provider."""
+    bodies = []
+    for provider in [DefaultJSONProvider, FastJSONProvider]:
+        flask_app = Flask(__name__)
+        flask_app.debug = debug
+        flask_app.json = provider(flask_app)
+        flask_app.json.compact = compact
+        with flask_app.app_context():
+            response = jsonify(value)
+            assert response.mimetype == "application/json"
+            bodies.append(response.get_data(as_text=True))
+    return bodies
+
+
+@pytest.mark.parametrize("value", VALUES)
+def test_provider_matches_flask(value):
+    default, fast = responses(value)
+    assert fast == default
+    default, fast = responses(value, debug=True)
+    assert fast == default
+    default, fast = responses(value, compact=False)
+    assert fast == default
+
+
+def test_provider_keeps_non_ascii_unescaped():
+    default, fast = responses({"name": "Café"})
+    assert (fast, json.loads(fast)) == ('{"name":"Café"}\n', json.loads(default))
+
+
+def test_provider_dumps_and_loads():
+    flask_app = Flask(__name__)
+    provider = FastJSONProvider(flask_app)
+    default = DefaultJSONProvider(flask_app)
+    value = {"b": [1, 2], "a": date(2026, 1, 2)}
+    assert provider.dumps(value) == default.dumps(value, separators=(",", ":"))
+    assert provider.dumps(value, indent=2) == default.dumps(value, indent=2)
+    assert provider.dumps({"b": 1, "a": 2}, sort_keys=False) == '{"b":1,"a":2}'
+    assert provider.loads(b'{"a": [1, null]}') == {"a": [1, None]}
+
+
+@pytest.mark.parametrize("value", VALUES)
+def test_fastapi_response_matches_json(value):
+    flask_app = Flask(__name__)
+    with flask_app.app_context():
+        expected = DefaultJSONProvider(flask_app).dumps(value, sort_keys=False, separators=(",", ":"))
+    # Keys keep their order
+    assert FastJSONResponse(value).body.decode("utf-8") == expected
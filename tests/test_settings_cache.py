@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app import db
+from app.models import RevisionCounter, Setting
+from app.settings_cache import SETTINGS_REVISION, fetch_setting, get_setting, settings_cache
+
+
+@pytest.fixture()
+def flask_app(flask_app):
+    db.session.add(Setting(key="repo_name", name="Repository name", type="string", value="WinGetty"))
+    db.session.add(Setting(key="use_s3", name="Use S3", type="boolean", value="false"))
+    db.session.commit()
+    return flask_app
+
+
+def test_values_are_typed_and_overridden_by_config(flask_app):
+    flask_app.config["USE_S3"] = "true"
+
+    assert get_setting("REPO_NAME") == "WinGetty"
+    assert get_setting("use_s3") is True
+    assert get_setting("missing") is None
+
+
+def test_changes_invalidate_the_cache(flask_app):
+    assert get_setting("repo_name") == "WinGetty"
+
+    db.session.get(Setting, "repo_name").set_value("Contoso")
+    db.session.commit()
+    assert RevisionCounter.get(SETTINGS_REVISION) == 2
+    assert get_setting("repo_name") == "Contoso"
+
+    # Written by another worker, picked up on the next revision check
+    db.session.execute(db.update(Setting).values(value="Fabrikam").where(Setting.key == "repo_name"))
+    db.session.execute(db.update(RevisionCounter).values(value=3).where(RevisionCounter.name == SETTINGS_REVISION))
+    db.session.commit()
+    assert get_setting("repo_name") == "Contoso"
+    settings_cache().checked_at -= 3600
+    assert get_setting("repo_name") == "Fabrikam"
+
+
+def test_concurrent_fetches_on_aiosqlite(flask_app):
+    # Every fetch finds the cache stale and refreshes it
+    flask_app.config["CACHE_CHECK_INTERVAL"] = 0
+
+    async def fetch_all():
+        engine = create_async_engine(str(db.engine.url).replace("sqlite:", "sqlite+aiosqlite:", 1))
+        sessions = [AsyncSession(engine) for _ in range(5)]
+        try:
+            return await asyncio.wait_for(
+                asyncio.gather(*(fetch_setting(session, "repo_name") for session in sessions)), 10
+            )
+        finally:
+            for session in sessions:
+                await session.close()
+            await engine.dispose()
+
+    assert asyncio.run(fetch_all()) == ["WinGetty"] * 5
@@ -32,12 +32,8 @@ def load_storage(monkeypatch, settings):
     monkeypatch.setitem(sys.modules, "azure.storage.blob.aio", fake_blob)
     monkeypatch.setitem(
         sys.modules,
-        "app.models",
-        SimpleNamespace(
-            Setting=SimpleNamespace(
-                get=lambda name: SimpleNamespace(get_value=lambda: settings.get(name.lower()))
-            )
-        ),
+        "app.settings_cache",
+        SimpleNamespace(get_setting=lambda name: settings.get(name.lower())),
     )
     monkeypatch.setitem(sys.modules, "app", sys.modules.get("app", SimpleNamespace()))
     spec = importlib.util.spec_from_file_location("app.storage", MODULE_PATH)
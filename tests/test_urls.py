@@ -0,0 +1,59 @@
+from flask import Flask, url_for
+
+from app.urls import download_url, init_trusted_hosts, set_request_base_url, reset_request_base_url
+
+
+def make_app():
+    flask_app = Flask(__name__)
+
+    @flask_app.route("/api/download/<identifier>/<version>/<architecture>/<scope>", endpoint="api.download")
+    def download(identifier, version, architecture, scope):
+        return ""
+
+    return flask_app
+
+
+def test_download_url_matches_url_for():
+    flask_app = make_app()
+    args = ("Contoso.App", "1.0 beta+1/2", "x64", "machine")
+    with flask_app.test_request_context("/", base_url="http://wg.example/root"):
+        expected = url_for(
+            "api.download",
+            identifier=args[0],
+            version=args[1],
+            architecture=args[2],
+            scope=args[3],
+            _external=True,
+            _scheme="https",
+        )
+        assert download_url(*args) == expected
+
+
+def test_download_url_outside_flask_requests():
+    flask_app = make_app()
+    with flask_app.app_context():
+        token = set_request_base_url("wg.example:8443", "/root/")
+        try:
+            assert download_url("A", "1", "x64", "user") == "https://wg.example:8443/root/api/download/A/1/x64/user"
+        finally:
+            reset_request_base_url(token)
+
+        flask_app.config["PUBLIC_BASE_URL"] = "https://cdn.example/"
+        assert download_url("A", "1", "x64", "user") == "https://cdn.example/api/download/A/1/x64/user"
+
+
+def test_trusted_hosts():
+    flask_app = make_app()
+    flask_app.config["TRUSTED_HOSTS"] = ["wg.example", ".mirror.example"]
+    init_trusted_hosts(flask_app)
+
+    @flask_app.route("/url")
+    def url():
+        return download_url("A", "1", "x64", "user")
+
+    client = flask_app.test_client()
+    assert client.get("/url", base_url="http://wg.example:8080").text == (
+        "https://wg.example:8080/api/download/A/1/x64/user"
+    )
+    assert client.get("/url", base_url="http://eu.mirror.example").status_code == 200
+    assert client.get("/url", base_url="http://evil.example").status_code == 400
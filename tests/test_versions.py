@@ -0,0 +1,12 @@
+from app.versions import version_sort_key
+
+
+def test_sort_key_orders_versions():
+    versions = ["10.0", "1.10", "1.9", "1.0.1", "1.0", "1.0.0", "1.0a", "01.2", "2", ""]
+    assert sorted(versions, key=version_sort_key) == [
+        "", "1.0", "1.0.0", "1.0.1", "1.0a", "01.2", "1.9", "1.10", "2", "10.0",
+    ]
+
+
+def test_sort_key_ignores_case_and_separators():
+    assert version_sort_key("1.0-Beta") == version_sort_key("1_0.beta")
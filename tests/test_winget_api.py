@@ -1,8 +1,12 @@
+import asyncio
+import gzip
 import importlib.util
+import json
 import sys
 from pathlib import Path
 from types import SimpleNamespace
 import types
+from fastapi import APIRouter
 from fastapi.testclient import TestClient
 
 pytest_plugins = ["pytest_asyncio"]
@@ -27,6 +31,7 @@ def load_app(monkeypatch, package=None):
 
     fake_models = SimpleNamespace(
         Package=SimpleNamespace(query=FakeQuery(package)),
+        RevisionCounter=SimpleNamespace(get=lambda name: 1),
         PackageVersion=None,
         Installer=None,
         db=SimpleNamespace(session=SimpleNamespace(add=lambda *a, **kw: None, commit=lambda: None)),
@@ -47,11 +52,65 @@ def load_app(monkeypatch, package=None):
     fake_schema_mod = types.ModuleType("schemas")
     fake_schema_mod.PackageSchema = object
     monkeypatch.setitem(sys.modules, "app.schemas", fake_schema_mod)
+    fake_manifests = types.ModuleType("manifests")
+    fake_manifests.CATALOG_REVISION = "catalog"
+
+    async def fetch_manifest(session, name, *filters):
+        if package is None:
+            return None
+        body = json.dumps(package.generate_output())
+        return SimpleNamespace(
+            revision=3, body=body, encoded={"gzip": gzip.compress(body.encode())}
+        )
+
+    fake_manifests.fetch_manifest = fetch_manifest
+    fake_manifests.manifest_etag = lambda manifest: f'"{manifest.revision}"'
+    monkeypatch.setitem(sys.modules, "app.manifests", fake_manifests)
+    fake_search = types.ModuleType("search")
+    fake_search.search_packages = lambda session, request_data, maximum_results, token: (
+        SimpleNamespace(data=[], continuation_token=None)
+    )
+    monkeypatch.setitem(sys.modules, "app.search", fake_search)
     fake_storage = types.ModuleType("storage")
     fake_storage.upload_bytes = lambda *a, **kw: None
     monkeypatch.setitem(sys.modules, "app.storage", fake_storage)
+    fake_download_api = types.ModuleType("download_api")
+    fake_download_api.router = APIRouter()
+    monkeypatch.setitem(sys.modules, "app.download_api", fake_download_api)
+    fake_settings_cache = types.ModuleType("settings_cache")
+    fake_settings_cache.get_setting = lambda key, session=None: None
+    monkeypatch.setitem(sys.modules, "app.settings_cache", fake_settings_cache)
+
+    class FakeSession:
+        async def run_sync(self, fn, *args):
+            return fn(self, *args)
+
+    async def get_session():
+        yield FakeSession()
+
+    async def get_setting_value(session, key):
+        return "Repo" if key == "REPO_NAME" else None
+
+    async def get_revision(session, name):
+        return 1
+
+    fake_async_db = types.ModuleType("async_db")
+    fake_async_db.get_session = get_session
+    fake_async_db.get_setting_value = get_setting_value
+    fake_async_db.get_revision = get_revision
+    fake_async_db.init_async_db = lambda app: None
+    fake_async_db.dispose_async_db = lambda: asyncio.sleep(0)
+    monkeypatch.setitem(sys.modules, "app.async_db", fake_async_db)
     monkeypatch.setitem(sys.modules, "app.winget_api", winget_module)
 
+    for helper in ["serialization", "compression", "continuation", "http_cache", "urls"]:
+        helper_path = Path(__file__).resolve().parents[1] / "app" / f"{helper}.py"
+        helper_spec = importlib.util.spec_from_file_location(f"app.{helper}", helper_path)
+        helper_module = importlib.util.module_from_spec(helper_spec)
+        helper_module.__package__ = "app"
+        monkeypatch.setitem(sys.modules, f"app.{helper}", helper_module)
+        helper_spec.loader.exec_module(helper_module)
+
     spec2.loader.exec_module(winget_module)
 
     spec = importlib.util.spec_from_file_location("app.fastapi_app", APP_PATH)
@@ -83,3 +142,84 @@ def test_manifest_found(monkeypatch):
     resp = client.get("/wg/packageManifests/foo")
     assert resp.status_code == 200
     assert resp.json() == {"foo": "bar"}
+
+
+def test_manifest_not_modified(monkeypatch):
+    pkg = SimpleNamespace(generate_output=lambda: {"foo": "bar"}, versions=[], installers=[])
+    app = load_app(monkeypatch, pkg)
+    client = TestClient(app)
+    identity = {"Accept-Encoding": "identity"}
+    resp = client.get("/wg/packageManifests/foo", headers=identity)
+    assert resp.headers["ETag"] == '"3"'
+    resp = client.get("/wg/packageManifests/foo", headers={"If-None-Match": 'W/"2", "3"', **identity})
+    assert resp.status_code == 304
+    assert resp.content == b""
+
+
+def test_manifest_search_empty(monkeypatch):
+    app = load_app(monkeypatch)
+    client = TestClient(app)
+    resp = client.post("/wg/manifestSearch", json={"Query": {"KeyWord": "foo", "MatchType": "Exact"}})
+    assert resp.status_code == 204
+
+
+def test_manifest_precompressed(monkeypatch):
+    pkg = SimpleNamespace(generate_output=lambda: {"foo": "bar"}, versions=[], installers=[])
+    app = load_app(monkeypatch, pkg)
+    client = TestClient(app)
+    resp = client.get("/wg/packageManifests/foo", headers={"Accept-Encoding": "gzip;q=0.5, br;q=0"})
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert resp.headers["ETag"] == '"3-gzip"'
+    assert resp.headers["Vary"] == "Accept-Encoding"
+    assert resp.json() == {"foo": "bar"}
+
+
+def test_etag_names_the_encoding_sent(monkeypatch):
+    pkg = SimpleNamespace(generate_output=lambda: {"foo": "bar" * 500}, versions=[], installers=[])
+    app = load_app(monkeypatch, pkg)
+    winget_api = sys.modules["app.winget_api"]
+    fetch_manifest = winget_api.fetch_manifest
+
+    async def uncompressed(*args):
+        manifest = await fetch_manifest(*args)
+        return SimpleNamespace(revision=manifest.revision, body=manifest.body, encoded={})
+
+    monkeypatch.setattr(winget_api, "fetch_manifest", uncompressed)
+    client = TestClient(app)
+    gzip_accepted = {"Accept-Encoding": "gzip"}
+
+    # Compressed by the middleware
+    resp = client.get("/wg/packageManifests/foo", headers=gzip_accepted)
+    assert (resp.headers["Content-Encoding"], resp.headers["ETag"]) == ("gzip", '"3-gzip"')
+    for etag in ['"3-gzip"', '"3"']:
+        resp = client.get("/wg/packageManifests/foo", headers={"If-None-Match": etag, **gzip_accepted})
+        assert (resp.status_code, resp.headers["ETag"]) == (304, etag)
+
+    # Too small to be compressed
+    resp = client.get("/wg/information", headers=gzip_accepted)
+    assert "Content-Encoding" not in resp.headers
+    assert not resp.headers["ETag"].endswith('-gzip"')
+
+
+def test_matching_etag(monkeypatch):
+    load_app(monkeypatch)
+    matching_etag = sys.modules["app.http_cache"].matching_etag
+    assert matching_etag('"a"', '"a"', "gzip") == '"a"'
+    assert matching_etag('W/"a-gzip"', '"a"', "gzip") == '"a-gzip"'
+    assert matching_etag('"a-gzip"', '"a"', None) is None
+    assert matching_etag('"a-br"', '"a"', "gzip") is None
+
+
+def test_manifest_search_maximum_results(monkeypatch):
+    client = TestClient(load_app(monkeypatch))
+    winget_api = sys.modules["app.winget_api"]
+    limits = []
+
+    def search_packages(session, request_data, maximum_results, token):
+        limits.append(maximum_results)
+        return SimpleNamespace(data=[], continuation_token=None)
+
+    monkeypatch.setattr(winget_api, "search_packages", search_packages)
+    for body in [{}, {"MaximumResults": 0}, {"MaximumResults": 5}]:
+        assert client.post("/wg/manifestSearch", json=body).status_code == 204
+    assert limits == [50, 0, 5]